@@ -19,6 +19,7 @@ class ParseTree:
             if dependency_heads[index] != 0:
                 node.set_parent(self.nodes[dependency_heads[index] - 1])
                 self.nodes[dependency_heads[index] - 1].add_children(node)
+        self.invalidate_paths()
 
     def __str__(self):
         output = self.sentence + '\n'
@@ -31,55 +32,124 @@ class ParseTree:
         # the value is a list of dependencies we traverse down the parse tree
         # the last dependent and, if only_root (the boolean in the dict) is False,
         # all its children will be tagged with the key
-        previous_labels = self.get_current_labelling()
+        # sets the labels computed by pattern_labelling on the nodes
+        labels = self.pattern_labelling(pattern, self.get_current_labelling())
+        if labels is None:
+            return False, []
+        for node, label in zip(self.nodes, labels):
+            node.pattern_label = label
+
+            # if there are no more patterns allowed to be applied, set to True
+        if final:
+            self.pattern_applied = final
+        return final, labels
+
+    def apply_patterns(self, patterns: List[dict]) -> int:
+        # applies the patterns in turn until a final one matches and returns its index, or -1 if none does
+        labels, pattern_no = self.match(patterns, self.get_current_labelling())
+        self.set_labelling(labels, self.pattern_applied or pattern_no != -1)
+        return pattern_no
+
+    def pattern_labelling(self, pattern: List[Tuple[str, List[str], bool]],
+                          labels: List[str]) -> Optional[List[str]]:
+        # the labels after applying the pattern on top of the given ones, or None if it does not match. Neither the
+        # tree nor the given labels are changed, so a tree can be matched from several threads at once.
+        # path resolution does not depend on the labels, so all paths are resolved before any label is set
+        resolved = []
         for entity, path, only_root in pattern:
             if path[0] != 'root':
                 if path[0].split('=')[0] != 'root':
                     raise ValueError('Pattern must start from the root! Your pattern starts with ' + path[0])
-            current_nodes = [self.root]
-            if len(path) > 1:
-                for step in path[1:]:
-                    current_nodes_temp = []
-                    # keep parent if it does NOT contain the given dependency
-                    if step.startswith('!'):
-                        for node in current_nodes:
-                            include = True
-                            for rel in node.children:
-                                if rel == step[1:]:
-                                    include = False
-                                    break
-                            if include:
-                                current_nodes_temp.append(node)
-
-                    else:
-                        for node in current_nodes:
-                            if step == '..':
-                                current_nodes_temp.append(node.parent)
-                            elif '=' not in step:
-                                if step in node.children:
-                                    current_nodes_temp.extend(node.children[step])
-                            else:
-                                step_split = step.split('=')
-                                if step_split[0] in node.children:
-                                    for child in node.children[step_split[0]]:
-                                        if child.word.lower() == step_split[1].lower():
-                                            current_nodes_temp.append(child)
-                    current_nodes = current_nodes_temp
-                    if not current_nodes:
-                        for node, previous_label in zip(self.nodes, previous_labels):
-                            node.set_pattern_label(previous_label, True)
-                        return False, []
+            current_nodes = self.resolve_path(path)
+            if not current_nodes:
+                return None
+            resolved.append((entity, current_nodes, only_root))
+        labels = list(labels)
+        for entity, current_nodes, only_root in resolved:
+            stack = list(current_nodes)
+            while stack:
+                node = stack.pop()
+                labels[node.index] = entity
+                if not only_root:
+                    for children in node.children.values():
+                        stack.extend(children)
+        return labels
+
+    def match(self, patterns: List[dict], labels: Optional[List[str]] = None) -> Tuple[List[str], int]:
+        # first-match-wins without changing the tree: the labels after applying the patterns in turn (starting from
+        # all 'O' unless labels are given) until a final one matches, and its index or -1 if none does
+        if labels is None:
+            labels = ['O'] * len(self.nodes)
+        matched = -1
+        for pattern_no, pattern in enumerate(patterns):
+            pattern_labels = self.pattern_labelling(pattern['pattern'], labels)
+            if pattern_labels is not None:
+                labels = pattern_labels
+                if pattern['final']:
+                    matched = pattern_no
+                    break
+        self.release_paths()
+        return labels, matched
+
+    def resolve_path(self, path: List[str]) -> List[Node]:
+        # the nodes a path leads to only depend on the tree structure, so they are memoized per tree and shared
+        # by all patterns. Only the steps after the root are used as key, the root itself is never checked.
+        # Threads filling the memo at the same time store equal lists, so it needs no lock.
+        # Every prefix of a path is memoized as well, e.g. ['root', 'dobj', 'rcmod'] reuses ['root', 'dobj']
+        key = tuple(path[1:])
+        if key in self.resolved_paths:
+            return self.resolved_paths[key]
+        prefix = len(key) - 1
+        while prefix > 0 and key[:prefix] not in self.resolved_paths:
+            prefix -= 1
+        current_nodes = self.resolved_paths[key[:prefix]]
+        for length in range(prefix + 1, len(key) + 1):
+            if current_nodes:
+                current_nodes = self._resolve_step(current_nodes, key[length - 1])
+            self.resolved_paths[key[:length]] = current_nodes
+        return current_nodes
+
+    @staticmethod
+    def _resolve_step(current_nodes: List[Node], step: str) -> List[Node]:
+        current_nodes_temp = []
+        # keep parent if it does NOT contain the given dependency
+        if step.startswith('!'):
             for node in current_nodes:
-                node.set_pattern_label(entity, only_root)
+                if step[1:] not in node.children:
+                    current_nodes_temp.append(node)
 
-            # if there are no more patterns allowed to be applied, set to True
-        if final:
-            self.pattern_applied = final
-        return final, [node.pattern_label for node in self.nodes]
+        else:
+            for node in current_nodes:
+                if step == '..':
+                    current_nodes_temp.append(node.parent)
+                elif '=' not in step:
+                    if step in node.children:
+                        current_nodes_temp.extend(node.children[step])
+                else:
+                    step_split = step.split('=')
+                    if step_split[0] in node.children:
+                        for child in node.children[step_split[0]]:
+                            if child.word.lower() == step_split[1].lower():
+                                current_nodes_temp.append(child)
+        return current_nodes_temp
+
+    def invalidate_paths(self):
+        # has to be called whenever nodes or edges of the tree change
+        self.resolved_paths = {(): [self.root]}
+
+    def release_paths(self):
+        # frees the memo once the tree is matched. It takes more memory than the tree itself, which adds up when all
+        # trees of a large corpus are kept; matching the tree again resolves the paths anew.
+        self.invalidate_paths()
 
     def get_current_labelling(self) -> List[str]:
         return [node.pattern_label for node in self.nodes]
 
+    def set_labelling(self, labels: List[str], pattern_applied: bool):
+        for node, label in zip(self.nodes, labels):
+            node.pattern_label = label
+        self.pattern_applied = pattern_applied
+
     def clean_labelling(self):
         for node in self.nodes:
             node.pattern_label = 'O'
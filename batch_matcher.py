@@ -0,0 +1,276 @@
+from __future__ import annotations
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Parser import ParseTree
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # concatenation of np.arange(start, start + length) for all starts and lengths
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(total)
+
+
+def check_path(path: List[str]):
+    # the batch only holds the sets of nodes a path leads to, so paths ParseTree.resolve_path cannot follow either
+    # (climbing above the root, which yields None) are rejected up front
+    if path[0].split('=')[0] != 'root':
+        raise ValueError('Pattern must start from the root! Your pattern starts with ' + path[0])
+    depth = 0
+    for step in path[1:]:
+        if step == '..':
+            depth -= 1
+            if depth < 0:
+                raise ValueError("Path " + '/'.join(path) + " climbs above the root")
+        elif not step.startswith('!'):
+            depth += 1
+
+
+class TreeBatch:
+    # a batch of dependency trees as flat arrays over all their tokens: the parent (-1 for the root), label id and
+    # lowercase word id of every token, and the token offset of every sentence. Every step of a path is evaluated for
+    # all trees at once, on the sorted array of the global indices of the tokens it leads to.
+
+    def __init__(self, heads: np.ndarray, label_ids: np.ndarray, word_ids: np.ndarray, offsets: np.ndarray,
+                 label_names: List[str], words: List[str], word_codes: Optional[Dict[str, int]] = None):
+        # heads: 1-based head of every token within its sentence, 0 for the root. word_codes can be passed to share
+        # the mapping of a large vocabulary between batches.
+        self.offsets = offsets
+        self.label_names = label_names
+        self.label_codes = {label: code for code, label in enumerate(label_names)}
+        self.word_codes = word_codes if word_codes is not None else {word: code for code, word in enumerate(words)}
+        self.label_ids = label_ids
+        self.word_ids = word_ids
+        n_tokens = len(heads)
+        self.sentence = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        token_offsets = offsets[:-1][self.sentence]
+        is_root = heads == 0
+        # the first 0 is the root; like in ParseTree, further 0s leave a token without a parent
+        first_root = np.full(len(offsets) - 1, n_tokens, dtype=np.int64)
+        np.minimum.at(first_root, self.sentence[is_root], np.flatnonzero(is_root))
+        if (first_root == n_tokens).any():
+            raise ValueError('Every sentence needs a root')
+        self.roots = first_root
+        self.parent = np.where(is_root, -1, token_offsets + heads - 1)
+
+        # children grouped by parent, each group in token order
+        with_parent = np.flatnonzero(self.parent >= 0)
+        self.child_order = with_parent[np.argsort(self.parent[with_parent], kind='stable')]
+        self.child_start = np.searchsorted(self.parent[self.child_order], np.arange(n_tokens + 1))
+        # tokens grouped by label
+        self.label_order = np.argsort(label_ids, kind='stable')
+        self.label_start = np.searchsorted(label_ids[self.label_order], np.arange(len(label_names) + 1))
+        self._subtrees()
+
+        self._member = np.zeros(n_tokens + 1, dtype=bool)
+        self._has_child: Dict[str, np.ndarray] = {}
+        self.resolved_paths: Dict[tuple, np.ndarray] = {(): self.roots}
+
+    @classmethod
+    def from_parser_output(cls, dep_heads: Sequence[List[int]], dep_labels: Sequence[List[str]],
+                           sentences: Sequence[List[str]]) -> TreeBatch:
+        # raises IndexError for the sentences ParseTree cannot be built from either
+        label_codes: Dict[str, int] = {}
+        word_codes: Dict[str, int] = {}
+        heads, label_ids, word_ids, lengths = [], [], [], []
+        for dep_head, dep_label, text in zip(dep_heads, dep_labels, sentences):
+            if len(dep_head) < len(text) or len(dep_label) < len(text) or dep_head.index(0) >= len(text) \
+                    or max(dep_head[:len(text)]) > len(text):
+                raise IndexError('Dependency heads or labels do not fit the sentence ' + ' '.join(text))
+            heads.extend(dep_head[:len(text)])
+            label_ids.extend(label_codes.setdefault(label, len(label_codes)) for label in dep_label[:len(text)])
+            word_ids.extend(word_codes.setdefault(word.lower(), len(word_codes)) for word in text)
+            lengths.append(len(text))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        return cls(np.array(heads, dtype=np.int64), np.array(label_ids, dtype=np.int32),
+                   np.array(word_ids, dtype=np.int32), offsets, list(label_codes), list(word_codes))
+
+    @classmethod
+    def from_parse_trees(cls, parse_trees: Sequence[ParseTree]) -> TreeBatch:
+        dep_heads, dep_labels, sentences = [], [], []
+        for tree in parse_trees:
+            # tokens without a parent had the head 0, the first of them is the root
+            dep_heads.append([0 if node.parent is None else node.parent.index + 1 for node in tree.nodes])
+            dep_labels.append([node.label for node in tree.nodes])
+            sentences.append([node.word for node in tree.nodes])
+        return cls.from_parser_output(dep_heads, dep_labels, sentences)
+
+    @property
+    def n_sentences(self) -> int:
+        return len(self.offsets) - 1
+
+    def _children(self, nodes: np.ndarray) -> np.ndarray:
+        starts = self.child_start[nodes]
+        return self.child_order[_ranges(starts, self.child_start[nodes + 1] - starts)]
+
+    def _subtrees(self):
+        # preorder position and subtree size of every token reachable from its root, so that the subtree of a token
+        # is the range [preorder, preorder + size) of preorder_nodes
+        n_tokens = len(self.parent)
+        levels = [self.roots]
+        while len(levels[-1]):
+            levels.append(self._children(levels[-1]))
+        levels.pop()
+        self.size = np.zeros(n_tokens, dtype=np.int64)
+        for level in levels:
+            self.size[level] = 1
+        for level in reversed(levels[1:]):
+            np.add.at(self.size, self.parent[level], self.size[level])
+        # size of all earlier siblings, in the token order of child_order
+        sizes = self.size[self.child_order]
+        before = np.cumsum(sizes) - sizes
+        group_first = np.repeat(self.child_start[:-1], np.diff(self.child_start))
+        earlier = np.zeros(n_tokens, dtype=np.int64)
+        earlier[self.child_order] = before - before[group_first]
+        self.preorder = np.full(n_tokens, -1, dtype=np.int64)
+        self.preorder[self.roots] = self.offsets[:-1]
+        for level in levels[1:]:
+            self.preorder[level] = self.preorder[self.parent[level]] + 1 + earlier[level]
+        self.preorder_nodes = np.zeros(n_tokens, dtype=np.int64)
+        reachable = np.flatnonzero(self.preorder >= 0)
+        self.preorder_nodes[self.preorder[reachable]] = reachable
+
+    def _with_label(self, label: str) -> np.ndarray:
+        code = self.label_codes.get(label)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.label_order[self.label_start[code]:self.label_start[code + 1]]
+
+    def _has_child_with(self, label: str) -> np.ndarray:
+        if label not in self._has_child:
+            has_child = np.zeros(len(self.parent), dtype=bool)
+            parents = self.parent[self._with_label(label)]
+            has_child[parents[parents >= 0]] = True
+            self._has_child[label] = has_child
+        return self._has_child[label]
+
+    def _resolve_step(self, nodes: np.ndarray, step: str) -> np.ndarray:
+        if step.startswith('!'):
+            return nodes[~self._has_child_with(step[1:])[nodes]]
+        if step == '..':
+            return np.unique(self.parent[nodes])
+        label, _, word = step.partition('=')
+        candidates = self._with_label(label)
+        if '=' in step:
+            word_code = self.word_codes.get(word.lower())
+            if word_code is None:
+                return np.zeros(0, dtype=np.int64)
+            candidates = candidates[self.word_ids[candidates] == word_code]
+        # the root's parent -1 maps to the last, never set entry
+        self._member[nodes] = True
+        children = candidates[self._member[self.parent[candidates]]]
+        self._member[nodes] = False
+        return children
+
+    def resolve_path(self, path: List[str]) -> np.ndarray:
+        # sorted global indices of the tokens the path leads to in any tree, memoized like ParseTree.resolve_path
+        key = tuple(path[1:])
+        if key in self.resolved_paths:
+            return self.resolved_paths[key]
+        check_path(path)
+        prefix = len(key) - 1
+        while prefix > 0 and key[:prefix] not in self.resolved_paths:
+            prefix -= 1
+        nodes = self.resolved_paths[key[:prefix]]
+        for length in range(prefix + 1, len(key) + 1):
+            if len(nodes):
+                nodes = self._resolve_step(nodes, key[length - 1])
+            self.resolved_paths[key[:length]] = nodes
+        return nodes
+
+    def match(self, patterns: List[dict]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        # first-match-wins over the patterns for all sentences at once, as ParseTree.apply_pattern applied in turn.
+        # Returns the label code of every token, the index of the final pattern applied to every sentence (or -1)
+        # and the label names of the codes.
+        label_names = ['O']
+        label_codes = {'O': 0}
+        labels = np.zeros(len(self.parent), dtype=np.int8)
+        matched = np.full(self.n_sentences, -1, dtype=np.int32)
+        active = np.ones(self.n_sentences, dtype=bool)
+        for pattern_no, pattern in enumerate(patterns):
+            entries = [(entity, self.resolve_path(path), only_root) for entity, path, only_root in pattern['pattern']]
+            hit = active.copy()
+            for _, nodes, _ in entries:
+                has_nodes = np.zeros(self.n_sentences, dtype=bool)
+                has_nodes[self.sentence[nodes]] = True
+                hit &= has_nodes
+            if not hit.any():
+                continue
+            for entity, nodes, only_root in entries:
+                if entity not in label_codes:
+                    label_codes[entity] = len(label_names)
+                    label_names.append(entity)
+                nodes = nodes[hit[self.sentence[nodes]]]
+                if not only_root:
+                    nodes = self.preorder_nodes[_ranges(self.preorder[nodes], self.size[nodes])]
+                labels[nodes] = label_codes[entity]
+            if pattern['final']:
+                matched[hit] = pattern_no
+                active &= ~hit
+        return labels, matched, label_names
+
+    def labelling(self, labels: np.ndarray, label_names: List[str], sentence_no: int) -> List[str]:
+        return [label_names[code] for code in labels[self.offsets[sentence_no]:self.offsets[sentence_no + 1]]]
+
+
+def label_parse_trees(parse_trees: List[ParseTree], patterns: List[dict]) -> Tuple[int, List[int]]:
+    # same result as create_labels.label_parse_trees, with the labels written back to the trees
+    batch = TreeBatch.from_parse_trees(parse_trees)
+    labels, matched, label_names = batch.match(patterns)
+    for sentence_no, tree in enumerate(parse_trees):
+        tree.set_labelling(batch.labelling(labels, label_names, sentence_no), bool(matched[sentence_no] != -1))
+    return int((matched != -1).sum()), matched.tolist()
+
+
+def verify_batch_matching(parse_trees: List[ParseTree], patterns: List[dict]) -> List[int]:
+    # sentence numbers whose labelling differs from applying the patterns tree by tree
+    batch = TreeBatch.from_parse_trees(parse_trees)
+    labels, matched, label_names = batch.match(patterns)
+    differences = []
+    for sentence_no, tree in enumerate(parse_trees):
+        tree.clean_labelling()
+        if tree.apply_patterns(patterns) != matched[sentence_no] \
+                or tree.get_current_labelling() != batch.labelling(labels, label_names, sentence_no):
+            differences.append(sentence_no)
+    return differences
+
+
+def main(input_file, output_path, patterns_file):
+    import time
+    from create_labels import load_parse_trees
+    from pattern_store import default_patterns, load_patterns
+
+    patterns = load_patterns(patterns_file) if patterns_file is not None else default_patterns()
+    parse_trees = load_parse_trees(input_file, output_path)
+    start = time.perf_counter()
+    batch = TreeBatch.from_parse_trees(parse_trees)
+    built = time.perf_counter()
+    batch.match(patterns)
+    matched = time.perf_counter()
+    print("Built the batch of", str(len(parse_trees)), "sentences in", '{:.3f}'.format(built - start), "s, matched in",
+          '{:.3f}'.format(matched - built), "s")
+    differences = verify_batch_matching(parse_trees, patterns)
+    print("Sentences labelled differently than tree by tree:", str(len(differences)))
+    print(' '.join(str(sentence_no) for sentence_no in differences))
+
+
+parser = argparse.ArgumentParser(description="Matches the patterns against all parse trees of a previous "
+                                             "create_labels.py run at once and checks that every sentence is labelled "
+                                             "as by ParseTree.apply_pattern.")
+parser.add_argument('--input-file', '-i', required=True, help="Input file of the previous run.")
+parser.add_argument('--output-dir', '-o', required=True, help="Output directory of the previous run.")
+parser.add_argument('--patterns', help="Pattern file to use instead of the built-in patterns.")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    arguments = parser.parse_args()
+    main(arguments.input_file, arguments.output_dir, arguments.patterns)
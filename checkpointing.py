@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+CHECKPOINT_DIR = 'checkpoint/'
+CHECKPOINT_FILE = 'checkpoint.json'
+PARSER_OUTPUTS = ['output_syndephead_0.txt', 'output_syndeplabel_0.txt']
+LABELS_FILE = 'labels.csv'
+
+
+def file_hash(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointedRun:
+    # runs the LAL-Parser on chunks of the input file and commits every finished chunk: its parser output, the
+    # labels of its sentences (the partial output) and the last input line and parse tree done are kept in the
+    # 'checkpoint' directory of the output directory. A resumed run only parses and labels the chunks not committed
+    # yet; the labels of all chunks are then taken over by apply_labels instead of matching the whole input again.
+    # Every chunk starts the parser anew, so its start-up time is paid once per chunk. The lines and parser wall time
+    # of every chunk are kept in the state, from which parser_startup estimates that time.
+
+    def __init__(self, input_file, output_path, chunk_lines, patterns, resume=False):
+        self.input_file = input_file
+        self.output_path = output_path
+        self.checkpoint_path = output_path + CHECKPOINT_DIR
+        self.chunk_lines = chunk_lines
+        self.patterns = patterns
+        self.state = {'input_hash': file_hash(input_file), 'chunk_lines': chunk_lines,
+                      'pattern_version': getattr(patterns, 'version', None), 'committed_chunks': 0,
+                      'committed_lines': 0, 'committed_trees': 0, 'parser_runs': []}
+        if resume and os.path.isfile(self.checkpoint_path + CHECKPOINT_FILE):
+            with open(self.checkpoint_path + CHECKPOINT_FILE) as file:
+                state = json.load(file)
+            if state['input_hash'] != self.state['input_hash'] or state['chunk_lines'] != chunk_lines:
+                raise RuntimeError('The checkpoint in ' + self.checkpoint_path + ' belongs to a different input file '
+                                   'or chunk size. Run without --resume to start over.')
+            if state.get('pattern_version') != self.state['pattern_version']:
+                raise RuntimeError('The checkpoint in ' + self.checkpoint_path + ' was labelled with other patterns '
+                                   '(version ' + str(state.get('pattern_version')) + '). Run without --resume to '
+                                   'start over.')
+            self.state = state
+        else:
+            shutil.rmtree(self.checkpoint_path, ignore_errors=True)
+            os.makedirs(self.checkpoint_path)
+
+    def chunk_path(self, chunk_no):
+        return self.checkpoint_path + 'chunk_' + str(chunk_no).zfill(5) + '/'
+
+    def chunks(self):
+        # the input lines of every chunk that is not committed yet, with the chunk number and its first line
+        with open(self.input_file) as file:
+            chunk_no = self.state['committed_chunks']
+            lines = []
+            line_no = -1
+            for line_no, line in enumerate(file):
+                if line_no < self.state['committed_lines']:
+                    continue
+                lines.append(line if line.endswith('\n') else line + '\n')
+                if len(lines) == self.chunk_lines:
+                    yield chunk_no, line_no + 1 - len(lines), lines
+                    chunk_no += 1
+                    lines = []
+            if lines:
+                yield chunk_no, line_no + 1 - len(lines), lines
+
+    def run(self, run_parser, router=None, match_cache=None, vectorized=False, threads=1):
+        from create_labels import build_parse_trees, label_parse_trees, read_dependency_heads, \
+            read_dependency_labels, read_requirements
+
+        if self.state['committed_lines']:
+            print("Resuming after input line", str(self.state['committed_lines']), "from chunk",
+                  str(self.state['committed_chunks']))
+        for chunk_no, first_line, lines in self.chunks():
+            chunk_path = self.chunk_path(chunk_no)
+            shutil.rmtree(chunk_path, ignore_errors=True)
+            os.makedirs(chunk_path)
+            with open(chunk_path + 'input.txt', 'w') as file:
+                file.writelines(lines)
+            start = time.perf_counter()
+            run_parser(chunk_path + 'input.txt', chunk_path)
+            self.state.setdefault('parser_runs', []).append([len(lines), time.perf_counter() - start])
+
+            parse_trees = build_parse_trees(read_dependency_heads(chunk_path + PARSER_OUTPUTS[0]),
+                                            read_dependency_labels(chunk_path + PARSER_OUTPUTS[1]),
+                                            read_requirements(chunk_path + 'input.txt'))
+            _, matched_patterns = label_parse_trees(parse_trees, self.patterns, router, match_cache, vectorized,
+                                                    threads)
+            # the labels of every parse tree by its index in the whole run, as build_parse_trees skips the lines it
+            # cannot build a tree of
+            first_tree = self.state['committed_trees']
+            with open(chunk_path + LABELS_FILE, 'w') as file:
+                file.write('ID,applied,pattern,labeling\n')
+                for instance_no, (tree, pattern_no) in enumerate(zip(parse_trees, matched_patterns)):
+                    file.write(str(first_tree + instance_no) + ', ' + str(int(tree.pattern_applied)) + ', '
+                               + str(pattern_no) + ', ' + ' '.join(tree.get_current_labelling()) + '\n')
+            self.commit(chunk_no + 1, first_line + len(lines), first_tree + len(parse_trees))
+        self.report_parser_runs()
+
+    def parser_startup(self):
+        # the parser time of a chunk is about a fixed start-up time plus a time per line. The start-up time is the
+        # intercept of a least squares fit over the chunks, which needs chunks of at least two sizes (the last chunk
+        # is usually smaller); None otherwise.
+        runs = self.state.get('parser_runs', [])
+        if len({lines for lines, _ in runs}) < 2:
+            return None
+        mean_lines = sum(lines for lines, _ in runs) / len(runs)
+        mean_seconds = sum(seconds for _, seconds in runs) / len(runs)
+        slope = sum((lines - mean_lines) * (seconds - mean_seconds) for lines, seconds in runs) \
+            / sum((lines - mean_lines) ** 2 for lines, _ in runs)
+        return max(mean_seconds - slope * mean_lines, 0.0)
+
+    def report_parser_runs(self):
+        runs = self.state.get('parser_runs', [])
+        if not runs:
+            return
+        seconds = sum(seconds for _, seconds in runs)
+        line = "Parser: " + str(len(runs)) + " chunks, " + '{:.3f}'.format(seconds / len(runs)) + " s per chunk"
+        startup = self.parser_startup()
+        if startup is not None:
+            line += ", about " + '{:.3f}'.format(startup) + " s of it start-up (" + \
+                    '{:.1f}'.format(min(startup * len(runs) / seconds, 1.0) * 100) + "% of the parser time)"
+        print(line)
+
+    def commit(self, committed_chunks, committed_lines, committed_trees):
+        self.state['committed_chunks'] = committed_chunks
+        self.state['committed_lines'] = committed_lines
+        self.state['committed_trees'] = committed_trees
+        self.state['parser_startup_seconds'] = self.parser_startup()
+        temporary = self.checkpoint_path + CHECKPOINT_FILE + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.checkpoint_path + CHECKPOINT_FILE)
+
+    def merge_parser_outputs(self):
+        # writes the parser output of all chunks to the output directory, as a single parser run would
+        for output in PARSER_OUTPUTS:
+            with open(self.output_path + output, 'w') as merged:
+                for chunk_no in range(self.state['committed_chunks']):
+                    with open(self.chunk_path(chunk_no) + output) as file:
+                        for line in file:
+                            merged.write(line if line.endswith('\n') else line + '\n')
+
+    def apply_labels(self, parse_trees):
+        # labels the parse trees of the merged parser output with the committed labels of the chunks. Returns the
+        # number of trees a final pattern was applied to and the index of that pattern per tree, as
+        # label_parse_trees does.
+        if len(parse_trees) != self.state['committed_trees']:
+            raise RuntimeError('The checkpoint in ' + self.checkpoint_path + ' has labels for ' +
+                               str(self.state['committed_trees']) + ' parse trees, but the run has ' +
+                               str(len(parse_trees)))
+        count = 0
+        matched_patterns = []
+        for chunk_no in range(self.state['committed_chunks']):
+            with open(self.chunk_path(chunk_no) + LABELS_FILE) as file:
+                next(file)
+                for line in file:
+                    instance_no, applied, pattern_no, labelling = line.rstrip('\n').split(', ', 3)
+                    parse_trees[int(instance_no)].set_labelling(labelling.split(), applied == '1')
+                    count += applied == '1'
+                    matched_patterns.append(int(pattern_no))
+        return count, matched_patterns
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from Parser import ParseTree
+
+# one fixed-width binary file per column, plus a variable-width token column (utf-8 blob + offsets)
+COLUMNS = {
+    'sentence_id': np.int64,
+    'token_index': np.int32,
+    'head': np.int32,
+    'dependency_label': np.int16,
+    'pattern_label': np.int16,
+    'pattern_id': np.int32,
+}
+SCHEMA_FILE = 'schema.json'
+
+
+class ColumnarWriter:
+
+    def __init__(self, path: str, chunk_size: int = 100000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.dictionaries = {'dependency_label': {}, 'pattern_label': {}}
+        self.rows = 0
+        self.token_bytes = 0
+        self.sentences = 0
+        self._buffers = {column: [] for column in COLUMNS}
+        self._tokens = []
+        if not os.path.exists(path):
+            os.mkdir(path)
+        if not os.path.isdir(path):
+            raise RuntimeError('Columnar output path must be a directory')
+        self._files = {column: open(os.path.join(path, column + '.bin'), 'wb') for column in COLUMNS}
+        self._files['token'] = open(os.path.join(path, 'token.bin'), 'wb')
+        self._files['token_offset'] = open(os.path.join(path, 'token_offset.bin'), 'wb')
+        np.zeros(1, dtype=np.int64).tofile(self._files['token_offset'])
+
+    def __enter__(self) -> ColumnarWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _encode(self, column: str, value: str) -> int:
+        dictionary = self.dictionaries[column]
+        if value not in dictionary:
+            dictionary[value] = len(dictionary)
+        return dictionary[value]
+
+    def add(self, sentence_id: int, tree: ParseTree, pattern_id: Optional[int] = None):
+        if pattern_id is None:
+            pattern_id = -1
+        for node in tree.nodes:
+            self._buffers['sentence_id'].append(sentence_id)
+            self._buffers['token_index'].append(node.index)
+            self._buffers['head'].append(0 if node.parent is None else node.parent.index + 1)
+            self._buffers['dependency_label'].append(self._encode('dependency_label', node.label))
+            self._buffers['pattern_label'].append(self._encode('pattern_label', node.pattern_label))
+            self._buffers['pattern_id'].append(pattern_id)
+            self._tokens.append(node.word.encode('utf-8'))
+        self.sentences += 1
+        if len(self._tokens) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._tokens:
+            return
+        for column, dtype in COLUMNS.items():
+            np.asarray(self._buffers[column], dtype=dtype).tofile(self._files[column])
+            self._buffers[column] = []
+        lengths = np.fromiter((len(token) for token in self._tokens), dtype=np.int64, count=len(self._tokens))
+        (np.cumsum(lengths) + self.token_bytes).tofile(self._files['token_offset'])
+        self._files['token'].write(b''.join(self._tokens))
+        self.token_bytes += int(lengths.sum())
+        self.rows += len(self._tokens)
+        self._tokens = []
+
+    def close(self):
+        if self._files is None:
+            return
+        self.flush()
+        for file in self._files.values():
+            file.close()
+        self._files = None
+        schema = {
+            'rows': self.rows,
+            'sentences': self.sentences,
+            'columns': {column: np.dtype(dtype).str for column, dtype in COLUMNS.items()},
+            # dictionaries are stored as lists, the position being the encoded value
+            'dictionaries': {column: sorted(dictionary, key=dictionary.get)
+                             for column, dictionary in self.dictionaries.items()},
+        }
+        with open(os.path.join(self.path, SCHEMA_FILE), 'w') as file:
+            json.dump(schema, file, indent=2)
+
+
+class ColumnarCorpus:
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, SCHEMA_FILE)) as file:
+            schema = json.load(file)
+        self.rows = schema['rows']
+        self.sentences = schema['sentences']
+        self.dictionaries = schema['dictionaries']
+        self.columns = {column: self._map(path, column, np.dtype(dtype))
+                        for column, dtype in schema['columns'].items()}
+        self.token_offset = self._map(path, 'token_offset', np.dtype(np.int64))
+        self.token_blob = self._map(path, 'token', np.dtype(np.uint8))
+
+    @staticmethod
+    def _map(path: str, column: str, dtype: np.dtype) -> np.ndarray:
+        file_name = os.path.join(path, column + '.bin')
+        # np.memmap refuses empty files
+        if os.path.getsize(file_name) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file_name, dtype=dtype, mode='r')
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def token(self, row: int) -> str:
+        return bytes(self.token_blob[self.token_offset[row]:self.token_offset[row + 1]]).decode('utf-8')
+
+    def decode(self, column: str, values: np.ndarray) -> List[str]:
+        dictionary = self.dictionaries[column]
+        return [dictionary[value] for value in values]
+
+    def code(self, column: str, value: str) -> int:
+        # -1 never occurs in a column, so filtering by an unknown value yields an empty selection
+        dictionary = self.dictionaries[column]
+        return dictionary.index(value) if value in dictionary else -1
+
+    def rows_with(self, column: str, value: str) -> np.ndarray:
+        return np.flatnonzero(self.columns[column] == self.code(column, value))
+
+
+def read_columnar(path: str) -> ColumnarCorpus:
+    return ColumnarCorpus(path)
+
+
+def export_columnar(path: str, parse_trees: List[ParseTree], matched_patterns: List[int],
+                    chunk_size: int = 100000):
+    with ColumnarWriter(path, chunk_size) as writer:
+        for instance_no, (tree, pattern_id) in enumerate(zip(parse_trees, matched_patterns)):
+            writer.add(instance_no, tree, pattern_id)
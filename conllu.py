@@ -0,0 +1,278 @@
+from __future__ import annotations
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from Parser import ParseTree
+
+# Universal Dependencies (v2) relations and the Stanford dependencies the patterns are written for. Relations with a
+# subtype not listed here fall back to the entry of their base relation, unknown relations are kept as they are.
+# 'obl' and 'nmod' only keep these labels without a preposition, see to_stanford.
+UD_TO_STANFORD = {
+    'root': 'root',
+    'nsubj': 'nsubj',
+    'nsubj:pass': 'nsubjpass',
+    'nsubj:outer': 'nsubj',
+    'csubj': 'csubj',
+    'csubj:pass': 'csubjpass',
+    'obj': 'dobj',
+    'iobj': 'iobj',
+    'ccomp': 'ccomp',
+    'xcomp': 'xcomp',
+    'obl': 'npadvmod',
+    'obl:tmod': 'tmod',
+    'obl:npmod': 'npadvmod',
+    'advcl': 'advcl',
+    'advmod': 'advmod',
+    'amod': 'amod',
+    'aux': 'aux',
+    'aux:pass': 'auxpass',
+    'cop': 'cop',
+    'mark': 'mark',
+    'det': 'det',
+    'det:predet': 'predet',
+    'nummod': 'num',
+    'nmod': 'dep',
+    'nmod:poss': 'poss',
+    'nmod:tmod': 'tmod',
+    'nmod:npmod': 'npadvmod',
+    'appos': 'appos',
+    'acl': 'partmod',
+    'acl:relcl': 'rcmod',
+    'compound': 'nn',
+    'compound:prt': 'prt',
+    'flat': 'nn',
+    'fixed': 'mwe',
+    'conj': 'conj',
+    'cc': 'cc',
+    'cc:preconj': 'preconj',
+    'case': 'possessive',
+    'punct': 'punct',
+    'expl': 'expl',
+    'parataxis': 'parataxis',
+    'discourse': 'discourse',
+    'vocative': 'dep',
+    'dislocated': 'dep',
+    'orphan': 'dep',
+    'list': 'dep',
+    'goeswith': 'dep',
+    'reparandum': 'dep',
+    'dep': 'dep',
+}
+
+NEGATIONS = {'not', "n't", 'never', 'no'}
+# marks of clauses Stanford dependencies attach as 'prep' with a 'pcomp' below
+PREPOSITION_MARKS = {'by', 'for', 'of', 'in', 'on', 'with', 'without', 'after', 'before', 'upon', 'from', 'about', 'at',
+                     'into', 'during', 'instead', 'prior'}
+
+
+class ConlluSentence:
+    # one sentence of a CoNLL-U file: its comment lines, all its token lines (including multiword tokens and empty
+    # nodes) split into columns, and the index of the line of every word
+
+    def __init__(self, comments: List[str], rows: List[List[str]]):
+        self.comments = comments
+        self.rows = rows
+        self.word_rows = [row_no for row_no, row in enumerate(rows) if row[0].isdigit()]
+
+    @property
+    def words(self) -> List[str]:
+        return [self.rows[row_no][1] for row_no in self.word_rows]
+
+    @property
+    def heads(self) -> List[int]:
+        return [int(self.rows[row_no][6]) for row_no in self.word_rows]
+
+    @property
+    def relations(self) -> List[str]:
+        return [self.rows[row_no][7] for row_no in self.word_rows]
+
+
+def read_conllu(file: TextIO) -> Iterator[ConlluSentence]:
+    # streams the sentences of a CoNLL-U file
+    comments = []
+    rows = []
+    for line in file:
+        line = line.rstrip('\n')
+        if not line.strip():
+            if rows:
+                yield ConlluSentence(comments, rows)
+            comments = []
+            rows = []
+        elif line.startswith('#'):
+            comments.append(line)
+        else:
+            columns = line.split('\t')
+            if len(columns) != 10:
+                raise ValueError('CoNLL-U lines need 10 tab separated columns: ' + line)
+            rows.append(columns)
+    if rows:
+        yield ConlluSentence(comments, rows)
+
+
+def map_relation(relation: str, label_map: Dict[str, str]) -> str:
+    if relation in label_map:
+        return label_map[relation]
+    base = relation.split(':')[0]
+    return label_map.get(base, base)
+
+
+def to_stanford(heads: List[int], relations: List[str], words: List[str],
+                label_map: Optional[Dict[str, str]] = None) -> Tuple[List[int], List[str]]:
+    # converts UD heads and relations to Stanford dependencies. Besides renaming the relations, nominals with a
+    # preposition ('case') are attached below it, as Stanford's prep/pobj, and so are clauses with a prepositional
+    # mark (prep/pcomp).
+    if label_map is None:
+        label_map = UD_TO_STANFORD
+    heads = list(heads)
+    labels = [map_relation(relation, label_map) for relation in relations]
+    children: Dict[int, List[int]] = {}
+    for index, head in enumerate(heads):
+        children.setdefault(head - 1, []).append(index)
+
+    for index, relation in enumerate(relations):
+        base = relation.split(':')[0]
+        lower = words[index].lower()
+        if base == 'advmod' and lower in NEGATIONS:
+            labels[index] = 'neg'
+        elif relation == 'acl' and any(relations[child] == 'mark' and words[child].lower() == 'to'
+                                       for child in children.get(index, ())):
+            labels[index] = 'infmod'
+
+    for index, relation in enumerate(relations):
+        base = relation.split(':')[0]
+        if base in ('obl', 'nmod') and relation != 'nmod:poss':
+            marker_relation, object_label = 'case', 'pobj'
+        elif base in ('advcl', 'acl') and relation != 'acl:relcl':
+            marker_relation, object_label = 'mark', 'pcomp'
+        else:
+            continue
+        markers = [child for child in children.get(index, ()) if relations[child] == marker_relation
+                   and (marker_relation == 'case' or words[child].lower() in PREPOSITION_MARKS)]
+        if not markers:
+            continue
+        preposition = markers[0]
+        heads[preposition] = heads[index]
+        labels[preposition] = 'prep'
+        heads[index] = preposition + 1
+        labels[index] = object_label
+    return heads, labels
+
+
+def checked_heads(sentence: ConlluSentence) -> List[int]:
+    # the heads of the words, or a ValueError if they do not form a tree ParseTree can be built of
+    heads = sentence.heads
+    if any(head < 0 or head > len(heads) for head in heads):
+        raise ValueError('Head out of range: ' + ' '.join(str(head) for head in heads))
+    if 0 not in heads:
+        raise ValueError('No root: ' + ' '.join(str(head) for head in heads))
+    return heads
+
+
+def report_skipped(sentence_no: int, sentence: ConlluSentence, error: Exception):
+    print('Skipping sentence ' + str(sentence_no) + ': ' + str(error) + '\n' + ' '.join(sentence.words),
+          file=sys.stderr)
+
+
+def parse_tree(sentence: ConlluSentence, label_map: Optional[Dict[str, str]] = None) -> ParseTree:
+    heads, labels = to_stanford(checked_heads(sentence), sentence.relations, sentence.words, label_map)
+    return ParseTree(heads, labels, sentence.words)
+
+
+def read_parse_trees(file_name: str, label_map: Optional[Dict[str, str]] = None, keep_sentences: bool = True) \
+        -> Tuple[List[ParseTree], Optional[List[ConlluSentence]]]:
+    # streams the file into parse trees. A sentence no tree can be built of (a head that is '_' or out of range, no
+    # root) is reported on stderr and skipped, as build_parse_trees does with broken parser output. The sentences of
+    # the trees are only kept, for write_conllu, with keep_sentences.
+    parse_trees = []
+    sentences = [] if keep_sentences else None
+    with open(file_name) as file:
+        for sentence_no, sentence in enumerate(read_conllu(file)):
+            try:
+                parse_trees.append(parse_tree(sentence, label_map))
+            except (ValueError, IndexError) as error:
+                report_skipped(sentence_no, sentence, error)
+                continue
+            if keep_sentences:
+                sentences.append(sentence)
+    return parse_trees, sentences
+
+
+def read_tree_batches(file_name: str, batch_size: int = 100000, label_map: Optional[Dict[str, str]] = None):
+    # streams the file as TreeBatch objects of batch_size sentences, without building a ParseTree per sentence.
+    # Sentences no tree can be built of are skipped as in read_parse_trees.
+    from batch_matcher import TreeBatch
+
+    with open(file_name) as file:
+        heads, labels, words = [], [], []
+        for sentence_no, sentence in enumerate(read_conllu(file)):
+            try:
+                sentence_heads, sentence_labels = to_stanford(checked_heads(sentence), sentence.relations,
+                                                              sentence.words, label_map)
+            except ValueError as error:
+                report_skipped(sentence_no, sentence, error)
+                continue
+            heads.append(sentence_heads)
+            labels.append(sentence_labels)
+            words.append(sentence.words)
+            if len(heads) == batch_size:
+                yield TreeBatch.from_parser_output(heads, labels, words)
+                heads, labels, words = [], [], []
+        if heads:
+            yield TreeBatch.from_parser_output(heads, labels, words)
+
+
+def read_label_map(file_name: Optional[str]) -> Dict[str, str]:
+    # the default table, updated with the entries of a JSON file
+    label_map = dict(UD_TO_STANFORD)
+    if file_name is not None:
+        with open(file_name) as file:
+            label_map.update(json.load(file))
+    return label_map
+
+
+def write_conllu(file: TextIO, parse_trees: Sequence[ParseTree],
+                 sentences: Optional[Sequence[ConlluSentence]] = None):
+    # writes the trees with their pattern label in the MISC column ('PatternLabel=...'). Sentences read from CoNLL-U
+    # keep all their columns, others are written with their Stanford dependencies.
+    for sentence_no, tree in enumerate(parse_trees):
+        if sentences is not None:
+            sentence = sentences[sentence_no]
+            rows = [list(row) for row in sentence.rows]
+            for row_no, node in zip(sentence.word_rows, tree.nodes):
+                misc = rows[row_no][9]
+                rows[row_no][9] = ('' if misc == '_' else misc + '|') + 'PatternLabel=' + node.pattern_label
+            file.writelines(comment + '\n' for comment in sentence.comments)
+        else:
+            file.write('# text = ' + tree.sentence + '\n')
+            rows = [[str(node.index + 1), node.word, '_', '_', '_', '_',
+                     str(0 if node.parent is None else node.parent.index + 1), node.label, '_',
+                     'PatternLabel=' + node.pattern_label] for node in tree.nodes]
+        file.writelines('\t'.join(row) + '\n' for row in rows)
+        file.write('\n')
+
+
+def main(input_file, output_file, label_map_file, patterns_file):
+    from create_labels import label_parse_trees
+    from pattern_store import default_patterns, load_patterns
+
+    patterns = load_patterns(patterns_file) if patterns_file is not None else default_patterns()
+    parse_trees, sentences = read_parse_trees(input_file, read_label_map(label_map_file))
+    count, _ = label_parse_trees(parse_trees, patterns)
+    print("Labeled instances: " + str(count / len(parse_trees) * 100) + "%")
+    with open(output_file, 'w') as file:
+        write_conllu(file, parse_trees, sentences)
+
+
+parser = argparse.ArgumentParser(description="Labels the sentences of a CoNLL-U file with Universal Dependencies and "
+                                             "writes them back with the pattern labels in the MISC column.")
+parser.add_argument('--input-file', '-i', required=True, help="CoNLL-U file to label.")
+parser.add_argument('--output-file', '-o', required=True, help="CoNLL-U file to write.")
+parser.add_argument('--label-map', help="JSON file mapping UD relations to the Stanford labels of the patterns, on "
+                                        "top of the built-in table.")
+parser.add_argument('--patterns', help="Pattern file to use instead of the built-in patterns.")
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    main(arguments.input_file, arguments.output_file, arguments.label_map, arguments.patterns)
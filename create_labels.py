@@ -2,42 +2,8 @@ import argparse
 import os
 
 
-def main(input_file, output_path, human_labeling):
-
-    import sys
-    import csv
+def read_requirements(input_file):
     import nltk
-    from Parser import ParseTree, patterns
-    from sklearn.metrics import cohen_kappa_score
-    from tabulate import tabulate
-    from statistics import mean
-
-    labeling_exists = False
-    if not os.path.isfile(input_file):
-        raise RuntimeError("Input file path either doesn't exist or is not a file.")
-    if not input_file.endswith('.txt'):
-        raise RuntimeError('Unsupported format! Please provide input file as .txt!')
-    if human_labeling is not None:
-        labeling_exists = True
-        if not os.path.isfile(human_labeling):
-            raise RuntimeError(" Human labeling file path either doesn't exist or is not a file.")
-        if not human_labeling.endswith('.csv'):
-            raise RuntimeError('Unsupported format! Please provide human labeling file as .csv!')
-    if not os.path.exists(output_path):
-        os.mkdir(output_path)
-    if not os.path.isdir(output_path):
-        raise RuntimeError('Output path must be a directory')
-    if not output_path.endswith('/'):
-        output_path += '/'
-
-    lal_parser_path = os.getcwd() + '/LAL-Parser/'
-    os.system('python '
-              + lal_parser_path + 'src_joint/main.py parse --contributions 0 --input-path '
-              + input_file + ' --output-path-synconst '
-              + output_path + 'output_synconst --output-path-syndep '
-              + output_path + 'output_syndephead --output-path-synlabel '
-              + output_path + 'output_syndeplabel --embedding-path '
-              + lal_parser_path + 'data/glove.gz --model-path-base ' + lal_parser_path + 'best_parser.pt')
 
     with open(input_file) as file:
         requirements = []
@@ -46,8 +12,13 @@ def main(input_file, output_path, human_labeling):
     actual_reqs = []
     for requirement in requirements:
         actual_reqs.append(nltk.word_tokenize(requirement))
+    return actual_reqs
+
 
-    with open(output_path+'output_syndephead_0.txt') as file:
+def read_dependency_heads(file_name):
+    import csv
+
+    with open(file_name) as file:
         reader = csv.reader(file)
         dep_heads = []
         for line in reader:
@@ -55,8 +26,13 @@ def main(input_file, output_path, human_labeling):
             for item in line:
                 head_list.append(int(''.join(e for e in item if e.isnumeric())))
             dep_heads.append(head_list)
+    return dep_heads
+
+
+def read_dependency_labels(file_name):
+    import csv
 
-    with open(output_path+'output_syndeplabel_0.txt') as file:
+    with open(file_name) as file:
         reader = csv.reader(file)
         dep_labels = []
         for line in reader:
@@ -64,6 +40,12 @@ def main(input_file, output_path, human_labeling):
             for item in line:
                 label_list.append(''.join(e for e in item if e.isalnum()))
             dep_labels.append(label_list)
+    return dep_labels
+
+
+def build_parse_trees(dep_heads, dep_labels, actual_reqs):
+    import sys
+    from Parser import ParseTree
 
     parse_trees = []
     for dep_head, dep_label, text in zip(dep_heads, dep_labels, actual_reqs):
@@ -71,109 +53,387 @@ def main(input_file, output_path, human_labeling):
             parse_trees.append(ParseTree(dep_head, dep_label, text))
         except IndexError:
             print(str(dep_head) + "\n" + str(dep_label) + "\n" + str(text), file=sys.stderr)
+    return parse_trees
+
 
+def load_parse_trees(input_file, output_path):
+    # reads the LAL-Parser output of a previous run from the output directory
+    if not output_path.endswith('/'):
+        output_path += '/'
+    return build_parse_trees(read_dependency_heads(output_path + 'output_syndephead_0.txt'),
+                             read_dependency_labels(output_path + 'output_syndeplabel_0.txt'),
+                             read_requirements(input_file))
+
+
+def run_lal_parser(input_file, output_path):
+    lal_parser_path = os.getcwd() + '/LAL-Parser/'
+    os.system('python '
+              + lal_parser_path + 'src_joint/main.py parse --contributions 0 --input-path '
+              + input_file + ' --output-path-synconst '
+              + output_path + 'output_synconst --output-path-syndep '
+              + output_path + 'output_syndephead --output-path-synlabel '
+              + output_path + 'output_syndeplabel --embedding-path '
+              + lal_parser_path + 'data/glove.gz --model-path-base ' + lal_parser_path + 'best_parser.pt')
+
+
+def label_parse_trees(parse_trees, patterns, router=None, match_cache=None, vectorized=False, threads=1):
+    # returns the number of labelled trees and, for each tree, the index of the final pattern applied (or -1)
+    if vectorized and (router is not None or match_cache is not None):
+        raise RuntimeError('The vectorized matcher matches all patterns on all trees and cannot use a router or '
+                           'match cache!')
+    if threads > 1 and (vectorized or router is not None or match_cache is not None):
+        raise RuntimeError('Matching with several threads is done tree by tree with all patterns and cannot be '
+                           'combined with the vectorized matcher, a router or a match cache!')
     count = 0
     for tree in parse_trees:
         tree.clean_labelling()
 
-    for pattern in patterns:
-        for tree in parse_trees:
+    if threads > 1:
+        # ParseTree.match does not change the trees, so they can be matched from several threads
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(threads) as executor:
+            results = list(executor.map(lambda tree: tree.match(patterns), parse_trees))
+        for tree, (labels, pattern_no) in zip(parse_trees, results):
+            tree.set_labelling(labels, pattern_no != -1)
+        matched_patterns = [pattern_no for _, pattern_no in results]
+        return sum(pattern_no != -1 for pattern_no in matched_patterns), matched_patterns
+
+    if vectorized:
+        from batch_matcher import label_parse_trees as label_batch
+        return label_batch(parse_trees, patterns)
+
+    if match_cache is not None:
+        matched_patterns = [match_cache.apply(tree, router) for tree in parse_trees]
+        return sum(tree.pattern_applied for tree in parse_trees), matched_patterns
+    if router is not None:
+        matched_patterns = [router.apply(tree) for tree in parse_trees]
+        return sum(tree.pattern_applied for tree in parse_trees), matched_patterns
+
+    matched_patterns = [-1] * len(parse_trees)
+    for pattern_no, pattern in enumerate(patterns):
+        for instance_no, tree in enumerate(parse_trees):
             if not tree.pattern_applied:
                 success, output = tree.apply_pattern(**pattern)
                 if success:
                     count += 1
+                    matched_patterns[instance_no] = pattern_no
+    for tree in parse_trees:
+        tree.release_paths()
+    return count, matched_patterns
+
+
+def build_matchers(patterns, routing=False, match_cache_size=0):
+    router = None
+    if routing:
+        from pattern_routing import PatternRouter
+        router = PatternRouter(patterns)
+    match_cache = None
+    if match_cache_size > 0:
+        from match_cache import StructuralMatchCache
+        match_cache = StructuralMatchCache(patterns, match_cache_size)
+    return router, match_cache
+
+
+def write_labels(file_name, parse_trees, background=False):
+    # compressed if the file name ends with .gz or .zst
+    from label_writer import LabelWriter
+
+    with LabelWriter(file_name, background=background) as writer:
+        writer.write_trees(parse_trees)
+
+
+def prepare_output_dir(output_path):
+    # creates the output directory if needed and returns its path ending with '/'
+    if not os.path.exists(output_path):
+        os.mkdir(output_path)
+    if not os.path.isdir(output_path):
+        raise RuntimeError('Output path must be a directory')
+    if not output_path.endswith('/'):
+        output_path += '/'
+    return output_path
+
+
+def read_pattern_set(patterns_file=None, pattern_cache=None):
+    from pattern_store import default_patterns, load_patterns
+
+    if patterns_file is not None:
+        return load_patterns(patterns_file, pattern_cache)
+    return default_patterns()
+
+
+def main(input_file, output_path, human_labeling, columnar=False, patterns_file=None, pattern_cache=None,
+         routing=False, match_cache_size=0, bootstrap=0, bootstrap_unit='sentence', confidence=0.95, seed=None,
+         workers=1, checkpoint_lines=0, resume=False, skip_parser=False, vectorized=False, shard=None,
+         shard_mode='hash', conllu_output=False, label_map_file=None, threads=1, tracer=None,
+         labels_file='automated_labels.csv', background_writer=False):
+    # tracer is a tracing.Tracer timing the stages of the run, or None to trace nothing
+    from label_writer import LabelWriter
+    from tracing import NULL_TRACER
+
+    if tracer is None:
+        tracer = NULL_TRACER
+
+    labeling_exists = False
+    if not os.path.isfile(input_file):
+        raise RuntimeError("Input file path either doesn't exist or is not a file.")
+    if not input_file.endswith('.txt') and not input_file.endswith('.conllu'):
+        raise RuntimeError('Unsupported format! Please provide input file as .txt or, already parsed, as .conllu!')
+    if human_labeling is not None:
+        labeling_exists = True
+        if not os.path.isfile(human_labeling):
+            raise RuntimeError(" Human labeling file path either doesn't exist or is not a file.")
+        if not human_labeling.endswith('.csv'):
+            raise RuntimeError('Unsupported format! Please provide human labeling file as .csv!')
+    output_path = prepare_output_dir(output_path)
+
+    # fail on broken pattern files before the parser runs
+    with tracer.stage('patterns') as stage:
+        patterns = read_pattern_set(patterns_file, pattern_cache)
+        stage.items = len(patterns)
+
+    # the human labeling is checked against the input before the parser runs, and against the trees before matching
+    gold = None
+    if labeling_exists:
+        from gold_labels import GoldLabelStore
+        with tracer.stage('gold_labels') as stage:
+            gold = GoldLabelStore.load(human_labeling)
+            stage.items = gold.n_sentences
+
+    conllu_sentences = None
+    checkpointed_run = None
+    if input_file.endswith('.conllu'):
+        # already parsed, the LAL-Parser is not needed
+        from conllu import read_label_map, read_parse_trees
+        with tracer.stage('trees') as stage:
+            parse_trees, conllu_sentences = read_parse_trees(input_file, read_label_map(label_map_file),
+                                                             conllu_output)
+            stage.items = len(parse_trees)
+    elif shard is not None:
+        # the shards are merged and evaluated with sharding.py once all of them are done
+        from sharding import run_shard
+        router, match_cache = build_matchers(patterns, routing, match_cache_size)
+        run_shard(input_file, output_path, shard, shard_mode, patterns, run_lal_parser, router, match_cache,
+                  vectorized, skip_parser, threads)
+        return
+    else:
+        with tracer.stage('tokenization') as stage:
+            actual_reqs = read_requirements(input_file)
+            stage.items = len(actual_reqs)
+        if gold is not None:
+            gold.validate([len(tokens) for tokens in actual_reqs])
+        if skip_parser:
+            # the parser output is already in the output directory, e.g. from synthetic_corpus.py
+            pass
+        elif checkpoint_lines > 0:
+            from checkpointing import CheckpointedRun
+            # every chunk is labelled right after it is parsed, so that its labels are committed with it
+            with tracer.stage('parser'):
+                router, match_cache = build_matchers(patterns, routing, match_cache_size)
+                checkpointed_run = CheckpointedRun(input_file, output_path, checkpoint_lines, patterns, resume)
+                checkpointed_run.run(run_lal_parser, router, match_cache, vectorized, threads)
+                checkpointed_run.merge_parser_outputs()
+        else:
+            with tracer.stage('parser'):
+                run_lal_parser(input_file, output_path)
+        # load_parse_trees, in stages
+        with tracer.stage('read_parser_output') as stage:
+            dep_heads = read_dependency_heads(output_path + 'output_syndephead_0.txt')
+            dep_labels = read_dependency_labels(output_path + 'output_syndeplabel_0.txt')
+            stage.items = len(dep_heads)
+        with tracer.stage('trees') as stage:
+            parse_trees = build_parse_trees(dep_heads, dep_labels, actual_reqs)
+            stage.items = len(parse_trees)
+    if gold is not None:
+        gold.validate([len(tree.nodes) for tree in parse_trees], 'parse trees')
+
+    with tracer.stage('matching', len(parse_trees)):
+        if checkpointed_run is not None:
+            count, matched_patterns = checkpointed_run.apply_labels(parse_trees)
+        else:
+            router, match_cache = build_matchers(patterns, routing, match_cache_size)
+            count, matched_patterns = label_parse_trees(parse_trees, patterns, router, match_cache, vectorized,
+                                                        threads)
+    print("Number of patterns used:", str(len(patterns)))
+    print("Pattern version:", patterns.version)
+    print("Labeled instances: " + str(count / len(parse_trees) * 100) + "%")
+    print("No fitting labeling was found for", str(len(parse_trees) - count), "sentences")
+    if match_cache is not None:
+        print("Sentences labelled from the match cache:", str(match_cache.hits))
+
+    # with background_writer, the labels file is written while the other outputs and the kappa are computed
+    label_writer = LabelWriter(output_path+labels_file, background=background_writer)
+    completed = False
+    try:
+        with tracer.stage('write_labels', count):
+            label_writer.write_trees(parse_trees)
+
+        if columnar:
+            from columnar_export import export_columnar
+            with tracer.stage('columnar', len(parse_trees)):
+                export_columnar(output_path+'automated_labels.columns', parse_trees, matched_patterns)
+
+        if conllu_output:
+            from conllu import write_conllu
+            with tracer.stage('conllu', len(parse_trees)), open(output_path+'automated_labels.conllu', 'w') as file:
+                write_conllu(file, parse_trees, conllu_sentences)
+
+        if labeling_exists:
+            from evaluation import fast_kappa_rows, kappa_table
+            with tracer.stage('kappa') as stage:
+                labels = gold.labels()
+                automated = [tree.get_current_labelling() for tree in parse_trees]
+                table = kappa_table(fast_kappa_rows(labels, automated))
+                stage.items = len(labels)
+            print(table)
+            if bootstrap > 0:
+                from evaluation import bootstrap_kappa_rows
+                print("Bootstrap confidence intervals from", str(bootstrap), "resamples by", bootstrap_unit)
+                with tracer.stage('bootstrap', bootstrap):
+                    table = bootstrap_kappa_rows(labels, automated, bootstrap, confidence, bootstrap_unit, seed,
+                                                 workers)
+                print(table)
+        completed = True
+    finally:
+        # an error of writing the labels must not hide the exception the run failed with
+        with tracer.stage('close_labels'):
+            label_writer.close(raise_error=completed)
+
+
+def collect_input_files(input_dir=None, input_glob=None, manifest=None, output_path=None):
+    # the input files of a batch run and the name of each file's output, relative to the batch output directory.
+    # Files in the output directory, like the parser input and output of an earlier batch run, are left out.
+    import glob
+
+    if input_dir is not None:
+        if not os.path.isdir(input_dir):
+            raise RuntimeError("Input directory path either doesn't exist or is not a directory.")
+        root = input_dir
+        input_files = sorted(glob.glob(os.path.join(input_dir, '**', '*.txt'), recursive=True))
+    else:
+        if input_glob is not None:
+            input_files = sorted(glob.glob(input_glob, recursive=True))
+        else:
+            with open(manifest) as file:
+                input_files = [line.strip() for line in file if line.strip()]
+    if output_path is not None:
+        output_dir = os.path.abspath(output_path)
+        input_files = [input_file for input_file in input_files
+                       if os.path.commonpath([output_dir, os.path.abspath(input_file)]) != output_dir]
+    if input_dir is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(name)) for name in input_files]) \
+            if input_files else ''
+    if not input_files:
+        raise RuntimeError('No input files found.')
+    for input_file in input_files:
+        if not os.path.isfile(input_file):
+            raise RuntimeError("Input file path " + input_file + " either doesn't exist or is not a file.")
+        if not input_file.endswith('.txt'):
+            raise RuntimeError('Unsupported format! Please provide input file ' + input_file + ' as .txt!')
+    names = [os.path.relpath(os.path.abspath(input_file), os.path.abspath(root))[:-len('.txt')]
+             for input_file in input_files]
+    return input_files, names
+
+
+def concatenate_inputs(input_files, batch_file):
+    # writes all input files into one parser input and returns the number of sentences of each file
+    line_counts = []
+    with open(batch_file, 'w') as batch:
+        for input_file in input_files:
+            count = 0
+            with open(input_file) as file:
+                for line in file:
+                    if not line.endswith('\n'):
+                        line += '\n'
+                    batch.write(line)
+                    count += 1
+            line_counts.append(count)
+    return line_counts
+
+
+def main_batch(input_files, names, output_path, merged=False, columnar=False, patterns_file=None,
+               pattern_cache=None, routing=False, match_cache_size=0, labels_file='automated_labels.csv',
+               background_writer=False):
+    # labels many input files with one parser run and one pattern set. The inputs are parsed together; the parse
+    # trees are split by file afterwards, so each file is labelled exactly as in a run of its own.
+    output_path = prepare_output_dir(output_path)
+    patterns = read_pattern_set(patterns_file, pattern_cache)
+
+    batch_file = output_path + 'batch_input.txt'
+    line_counts = concatenate_inputs(input_files, batch_file)
+    run_lal_parser(batch_file, output_path)
+
+    dep_heads = read_dependency_heads(output_path + 'output_syndephead_0.txt')
+    dep_labels = read_dependency_labels(output_path + 'output_syndeplabel_0.txt')
+    actual_reqs = read_requirements(batch_file)
+    file_trees = []
+    start = 0
+    for line_count in line_counts:
+        end = start + line_count
+        file_trees.append(build_parse_trees(dep_heads[start:end], dep_labels[start:end], actual_reqs[start:end]))
+        start = end
+
+    router, match_cache = build_matchers(patterns, routing, match_cache_size)
+    parse_trees = [tree for trees in file_trees for tree in trees]
+    count, matched_patterns = label_parse_trees(parse_trees, patterns, router, match_cache)
+    print("Number of input files:", str(len(input_files)))
     print("Number of patterns used:", str(len(patterns)))
+    print("Pattern version:", patterns.version)
     print("Labeled instances: " + str(count / len(parse_trees) * 100) + "%")
     print("No fitting labeling was found for", str(len(parse_trees) - count), "sentences")
+    if match_cache is not None:
+        print("Sentences labelled from the match cache:", str(match_cache.hits))
 
-    with open(output_path+'automated_labels.csv', 'w') as file:
-        file.write('ID,labeling\n')
-        for instance_no, tree in enumerate(parse_trees):
-            if tree.pattern_applied:
-                file.write(str(instance_no)+', ')
-                for label in tree.get_current_labelling():
-                    file.write(label+' ')
-                file.write('\n')
+    if merged:
+        from label_writer import LabelWriter, csv_field
+        with LabelWriter(output_path + labels_file, 'file,ID,labeling', background_writer) as writer:
+            for name, trees in zip(names, file_trees):
+                applied = [instance_no for instance_no, tree in enumerate(trees) if tree.pattern_applied]
+                field = csv_field(name)
+                writer.write_rows((field + ', ' + str(instance_no) for instance_no in applied),
+                                  (trees[instance_no].get_current_labelling() for instance_no in applied))
+    start = 0
+    for name, trees in zip(names, file_trees):
+        file_patterns = matched_patterns[start:start + len(trees)]
+        start += len(trees)
+        if merged and not columnar:
+            continue
+        file_path = output_path + name + '/'
+        if not os.path.exists(file_path):
+            os.makedirs(file_path)
+        if not merged:
+            write_labels(file_path + labels_file, trees, background_writer)
+        if columnar:
+            from columnar_export import export_columnar
+            export_columnar(file_path + 'automated_labels.columns', trees, file_patterns)
 
-    if labeling_exists:
-        with open(human_labeling, 'r') as file:
-            reader = csv.DictReader(file)
-            labels = {}
-            for line in reader:
-                labels[line['ID']] = line['labeling'].split()
-
-        adjusted_labels = {}
-        for instance_no, labelling in labels.items():
-            new_labelling = []
-            for label in labelling:
-                if label == '1':
-                    new_labelling.append('ent1')
-                elif label == '2':
-                    new_labelling.append('ent2')
-                elif label == 'c':
-                    new_labelling.append('cond')
-                elif label == 'O':
-                    new_labelling.append('O')
-                elif label == 'r':
-                    new_labelling.append('rel')
-                else:
-                    print('Error! Unknown label! ', label, file=sys.stderr)
-                    break
-            adjusted_labels[int(instance_no)] = new_labelling
-        labels = adjusted_labels
-
-        hl_list = []
-        al_list = []
-        human_labels = []
-        automated_labels = []
-        for instance_no, labelling in labels.items():
-            hl_list.append((instance_no, labelling))
-            human_labels.extend(labelling)
-            automated_labels.extend(parse_trees[instance_no].get_current_labelling())
-            al_list.append(parse_trees[instance_no].get_current_labelling())
-            if len(human_labels) - len(automated_labels) != 0:
-                raise RuntimeError("Human labeling of ID ", instance_no, " doesn't match length of original sentence!")
-
-        kappa_scores = []
-        ent1_kappa = []
-        ent2_kappa = []
-        rel_kappa = []
-        cond_kappa = []
-        for instance_no, labelling in labels.items():
-            auto_labelling = parse_trees[instance_no].get_current_labelling()
-            kappa_scores.append(cohen_kappa_score(labelling, auto_labelling))
-            ent1_kappa.append(cohen_kappa_score(['O' if hl != 'ent1' else 'ent1' for hl in labelling],
-                                                ['O' if al != 'ent1' else 'ent1' for al in auto_labelling]))
-            if 'ent2' in labelling or 'ent2' in auto_labelling:
-                ent2_kappa.append(cohen_kappa_score(['O' if hl != 'ent2' else 'ent2' for hl in labelling],
-                                                    ['O' if al != 'ent2' else 'ent2' for al in auto_labelling]))
-            rel_kappa.append(cohen_kappa_score(['O' if hl != 'rel' else 'rel' for hl in labelling],
-                                               ['O' if al != 'rel' else 'rel' for al in auto_labelling]))
-            if 'cond' in labelling or 'cond' in auto_labelling:
-                cond_kappa.append(cohen_kappa_score(['O' if hl != 'cond' else 'cond' for hl in labelling],
-                                                    ['O' if al != 'cond' else 'cond' for al in auto_labelling]))
-
-        only_ent1_human = ['O' if hl != 'ent1' else 'ent1' for hl in human_labels]
-        only_ent1_auto = ['O' if al != 'ent1' else 'ent1' for al in automated_labels]
-        only_ent2_human = ['O' if hl != 'ent2' else 'ent2' for hl in human_labels]
-        only_ent2_auto = ['O' if al != 'ent2' else 'ent2' for al in automated_labels]
-        only_cond_human = ['O' if hl != 'cond' else 'cond' for hl in human_labels]
-        only_cond_auto = ['O' if al != 'cond' else 'cond' for al in automated_labels]
-        only_rel_human = ['O' if hl != 'rel' else 'rel' for hl in human_labels]
-        only_rel_auto = ['O' if al != 'rel' else 'rel' for al in automated_labels]
-
-        table = tabulate([['All labels', mean(kappa_scores), cohen_kappa_score(human_labels, automated_labels)],
-                          ['rel only', mean(rel_kappa), cohen_kappa_score(only_rel_auto, only_rel_human)],
-                          ['ent1 only', mean(ent1_kappa), cohen_kappa_score(only_ent1_auto, only_ent1_human)],
-                          ['ent2 only', mean(ent2_kappa), cohen_kappa_score(only_ent2_auto, only_ent2_human)],
-                          ['cond only', mean(cond_kappa), cohen_kappa_score(only_cond_auto, only_cond_human)]],
-                         ['Labels considered', 'Sentence Average', 'Overall'], floatfmt='.3f', tablefmt='psql')
-        print(table)
 
+def shard_argument(value):
+    # fails on a malformed --shard while parsing the arguments, before anything is loaded
+    from sharding import parse_shard
+
+    try:
+        parse_shard(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
+
+
+# the stages main traces, in the order they run
+STAGES = ['patterns', 'gold_labels', 'tokenization', 'parser', 'read_parser_output', 'trees', 'matching',
+          'write_labels', 'columnar', 'conllu', 'kappa', 'bootstrap', 'close_labels']
 
 parser = argparse.ArgumentParser()
-parser.add_argument('--input-file', '-i', required=True, help="Path to the input file. Must be provided in .txt. "
-                                                              "Each line should be exactly one sentence.")
+inputs = parser.add_mutually_exclusive_group(required=True)
+inputs.add_argument('--input-file', '-i', help="Path to the input file. Must be provided in .txt. "
+                                               "Each line should be exactly one sentence. Sentences parsed "
+                                               "already can be provided as .conllu with Universal Dependencies "
+                                               "instead, the LAL-Parser is not run then.")
+inputs.add_argument('--input-dir', help="Batch mode: label every .txt file in this directory and its subdirectories "
+                                        "with a single parser run. Each file's labels are written to "
+                                        "<output dir>/<file name without .txt>/automated_labels.csv.")
+inputs.add_argument('--input-glob', help="Batch mode: label every file matching this glob pattern, e.g. "
+                                         "'projects/*/requirements.txt'.")
+inputs.add_argument('--manifest', help="Batch mode: label every file listed in this file, one path per line.")
 parser.add_argument('--output-dir', '-o', required=True, help="Path of output directory")
 parser.add_argument('--human_labeling', '-l', help="Path to the human labeling file for "
                                                    "Cohen's kappa calculation. Must be provided as .csv "
@@ -181,10 +441,151 @@ parser.add_argument('--human_labeling', '-l', help="Path to the human labeling f
                                                    "Each line should correspond to one sentence. '1' stands for ent1,"
                                                    "'2' for ent2, 'c' for cond and 'r' for rel. Each label is separated"
                                                    " by spaces.")
+parser.add_argument('--columnar', action='store_true', help="Additionally export the labelled corpus column-wise "
+                                                            "(sentence id, token index, token, dependency head, "
+                                                            "dependency label, pattern label and matched pattern id) "
+                                                            "to 'automated_labels.columns' in the output directory. "
+                                                            "The columns can be memory mapped with "
+                                                            "columnar_export.read_columnar.")
+parser.add_argument('--patterns', help="Path to a pattern file (.json, .yaml, .yml or .toml) to use instead of the "
+                                       "built-in patterns. Run pattern_store.py to export the built-in patterns.")
+parser.add_argument('--pattern-cache', help="Directory for compiled pattern files. Defaults to '.pattern_cache' next "
+                                            "to the pattern file.")
+parser.add_argument('--routing', action='store_true', help="Only try the patterns on a sentence that can match the "
+                                                           "dependencies of its root. Does not change the labelling.")
+parser.add_argument('--match-cache', type=int, default=0, help="Number of sentence structures whose labelling is "
+                                                               "cached, so that sentences differing only in words "
+                                                               "no pattern checks are not matched again. "
+                                                               "0 (default) disables the cache.")
+parser.add_argument('--vectorized', action='store_true', help="Match each path step for all sentences at once on "
+                                                              "flat arrays (batch_matcher.py) instead of tree by tree. "
+                                                              "Does not change the labelling.")
+parser.add_argument('--threads', type=int, default=1, help="Number of threads matching the trees. Only faster on "
+                                                            "free-threaded Python builds. Does not change the "
+                                                            "labelling.")
+parser.add_argument('--skip-parser', action='store_true', help="Do not run the LAL-Parser, but label the parser output "
+                                                               "already in the output directory, e.g. of a previous "
+                                                               "run or from synthetic_corpus.py.")
+parser.add_argument('--checkpoint', type=int, default=0, help="Parse the input in chunks of this many lines and "
+                                                              "commit the parser output and labels of every finished "
+                                                              "chunk to 'checkpoint' in the output directory. "
+                                                              "0 (default) parses the input in one go.")
+parser.add_argument('--resume', action='store_true', help="Continue an interrupted run with --checkpoint after the "
+                                                          "last committed chunk.")
+parser.add_argument('--conllu', action='store_true', help="Additionally write the labelled sentences as CoNLL-U to "
+                                                          "'automated_labels.conllu' in the output directory, with "
+                                                          "the pattern labels in the MISC column.")
+parser.add_argument('--label-map', help="JSON file mapping Universal Dependencies relations of a .conllu input file to "
+                                        "the Stanford labels of the patterns, on top of the table in conllu.py.")
+parser.add_argument('--shard', type=shard_argument, help="Only parse and label shard i of N of the input lines, "
+                                                         "given as i/N. Each shard writes its labels by input line to "
+                                                         "'shard_i_of_N' in the output directory; merge them with "
+                                                         "sharding.py.")
+parser.add_argument('--shard-by', choices=['hash', 'range'], default='hash', help="Assign the lines to the shards by "
+                                                                                  "the hash of their text (default) "
+                                                                                  "or in contiguous ranges.")
+parser.add_argument('--merged', action='store_true', help="Batch mode: write the labels of all files to a single "
+                                                         "'automated_labels.csv' with an additional file column.")
+parser.add_argument('--bootstrap', type=int, default=0, help="Number of bootstrap resamples for confidence intervals "
+                                                             "of the kappa scores. 0 (default) disables them.")
+parser.add_argument('--bootstrap-unit', choices=['sentence', 'token'], default='sentence',
+                    help="Resample the human labelled sentences (default) or their tokens for the overall kappa. The "
+                         "sentence average is always resampled by sentence.")
+parser.add_argument('--confidence', type=float, default=0.95, help="Confidence level of the intervals.")
+parser.add_argument('--seed', type=int, help="Seed of the bootstrap for reproducible intervals.")
+parser.add_argument('--workers', type=int, default=1, help="Number of processes computing the bootstrap.")
+parser.add_argument('--labels-file', default='automated_labels.csv', help="Name of the labels file in the output "
+                                                                           "directory. Compressed with gzip if it "
+                                                                           "ends with .gz and with zstd if it ends "
+                                                                           "with .zst.")
+parser.add_argument('--background-writer', action='store_true', help="Write the labels file from a background thread "
+                                                                     "while the other outputs and the kappa are "
+                                                                     "computed.")
+parser.add_argument('--trace', help="Write the wall and CPU time, number of items and peak memory of every stage of "
+                                    "the run (patterns, parser, tokenization, read_parser_output, trees, matching, "
+                                    "write_labels, ...) to this JSON file.")
+parser.add_argument('--trace-memory', action='store_true', help="Also trace the memory allocated by every stage with "
+                                                                "tracemalloc. Slows the run down considerably.")
+parser.add_argument('--profile-stage', choices=STAGES, help="Profile this stage with cProfile. The statistics are "
+                                                            "written next to the trace file as <trace file>.prof and "
+                                                            "the top functions added to the trace.")
+
+# options of a single input file that main_batch does not support
+BATCH_UNSUPPORTED = [('vectorized', '--vectorized'), ('threads', '--threads'), ('skip_parser', '--skip-parser'),
+                     ('checkpoint', '--checkpoint'), ('resume', '--resume'), ('conllu', '--conllu'),
+                     ('label_map', '--label-map'), ('shard', '--shard'), ('bootstrap', '--bootstrap'),
+                     ('trace', '--trace'), ('trace_memory', '--trace-memory'), ('profile_stage', '--profile-stage')]
+
+# options of the parser run, which a .conllu input file does not need
+CONLLU_UNSUPPORTED = [('shard', '--shard'), ('checkpoint', '--checkpoint'), ('resume', '--resume'),
+                      ('skip_parser', '--skip-parser')]
+
+# options of a whole run that a shard does not support
+SHARD_UNSUPPORTED = [('checkpoint', '--checkpoint'), ('resume', '--resume'), ('columnar', '--columnar'),
+                     ('conllu', '--conllu')]
 
 if __name__ == "__main__":
     abs_path = os.path.abspath(__file__)
     dir_name = os.path.dirname(abs_path)
     os.chdir(dir_name)
     arguments = parser.parse_args()
-    main(arguments.input_file, arguments.output_dir, arguments.human_labeling)
+    if not 0 < arguments.confidence < 1:
+        parser.error('--confidence must be between 0 and 1')
+    if arguments.shard is not None and arguments.human_labeling is not None:
+        parser.error('the kappa of a sharded run is computed when merging the shards with sharding.py')
+    if arguments.shard is not None:
+        unsupported = [option for dest, option in SHARD_UNSUPPORTED
+                       if getattr(arguments, dest) != parser.get_default(dest)]
+        if unsupported:
+            parser.error(', '.join(unsupported) + ' cannot be used with --shard')
+    if arguments.shard is not None and (arguments.labels_file != parser.get_default('labels_file')
+                                        or arguments.background_writer):
+        parser.error('the labels file of a sharded run is written when merging the shards, see sharding.py '
+                     '--labels-file')
+    if arguments.vectorized and (arguments.routing or arguments.match_cache > 0):
+        parser.error('--vectorized cannot be combined with --routing or --match-cache')
+    if arguments.input_file is not None and arguments.input_file.endswith('.conllu'):
+        unsupported = [option for dest, option in CONLLU_UNSUPPORTED
+                       if getattr(arguments, dest) != parser.get_default(dest)]
+        if unsupported:
+            parser.error(', '.join(unsupported) + ' cannot be used with an already parsed .conllu input file')
+    if arguments.threads > 1 and (arguments.vectorized or arguments.routing or arguments.match_cache > 0):
+        parser.error('--threads cannot be combined with --vectorized, --routing or --match-cache')
+    if arguments.resume and arguments.checkpoint <= 0:
+        parser.error('--resume continues a run with --checkpoint and needs the same --checkpoint')
+    if arguments.input_file is None:
+        if arguments.human_labeling is not None:
+            parser.error('the human labeling refers to the lines of a single input file and cannot be used in batch '
+                         'mode')
+        unsupported = [option for dest, option in BATCH_UNSUPPORTED
+                       if getattr(arguments, dest) != parser.get_default(dest)]
+        if unsupported:
+            parser.error(', '.join(unsupported) + ' cannot be used in batch mode')
+        input_files, names = collect_input_files(arguments.input_dir, arguments.input_glob, arguments.manifest,
+                                                 arguments.output_dir)
+        main_batch(input_files, names, arguments.output_dir, merged=arguments.merged, columnar=arguments.columnar,
+                   patterns_file=arguments.patterns, pattern_cache=arguments.pattern_cache,
+                   routing=arguments.routing, match_cache_size=arguments.match_cache,
+                   labels_file=arguments.labels_file, background_writer=arguments.background_writer)
+    else:
+        tracer = None
+        if arguments.trace is not None:
+            from tracing import Tracer
+            tracer = Tracer(memory=arguments.trace_memory, profile_stage=arguments.profile_stage,
+                            profile_file=arguments.trace + '.prof')
+        elif arguments.trace_memory or arguments.profile_stage is not None:
+            parser.error('--trace-memory and --profile-stage need a --trace file')
+        try:
+            main(arguments.input_file, arguments.output_dir, arguments.human_labeling, columnar=arguments.columnar,
+                 patterns_file=arguments.patterns, pattern_cache=arguments.pattern_cache, routing=arguments.routing,
+                 match_cache_size=arguments.match_cache, bootstrap=arguments.bootstrap,
+                 bootstrap_unit=arguments.bootstrap_unit, confidence=arguments.confidence, seed=arguments.seed,
+                 workers=arguments.workers, checkpoint_lines=arguments.checkpoint, resume=arguments.resume,
+                 skip_parser=arguments.skip_parser, vectorized=arguments.vectorized, shard=arguments.shard,
+                 shard_mode=arguments.shard_by, conllu_output=arguments.conllu, label_map_file=arguments.label_map,
+                 threads=arguments.threads, tracer=tracer, labels_file=arguments.labels_file,
+                 background_writer=arguments.background_writer)
+        finally:
+            # a failed run keeps the trace of its stages up to the failing one
+            if tracer is not None:
+                tracer.write(arguments.trace)
@@ -0,0 +1,275 @@
+from __future__ import annotations
+import warnings
+from statistics import mean
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.metrics import cohen_kappa_score
+from tabulate import tabulate
+
+KAPPA_HEADERS = ['Labels considered', 'Sentence Average', 'Overall']
+# label of every row of the kappa table after 'All labels', and whether the sentence average of that row only
+# includes sentences where the label occurs in the human or the automated labelling
+SINGLE_LABEL_ROWS = [('rel', False), ('ent1', False), ('ent2', True), ('cond', True)]
+# share of the resamples whose kappa has to be defined for a bootstrap interval, below it the interval is nan
+MIN_DEFINED_SHARE = 0.5
+
+
+def read_human_labels(human_labeling: str) -> Dict[int, List[str]]:
+    # fails on unknown labels like every other reader of the human labeling, see gold_labels.GoldLabelStore
+    from gold_labels import GoldLabelStore
+    return GoldLabelStore.encode(human_labeling).labels()
+
+
+def kappa_rows(labels: Dict[int, List[str]], automated: Sequence[List[str]]) -> List[list]:
+    # automated holds the automated labelling of every instance, indexed by instance number. Computes every kappa
+    # with scikit-learn, sentence by sentence; the runs use fast_kappa_rows, which is tested against this.
+    hl_list = []
+    al_list = []
+    human_labels = []
+    automated_labels = []
+    for instance_no, labelling in labels.items():
+        hl_list.append((instance_no, labelling))
+        human_labels.extend(labelling)
+        automated_labels.extend(automated[instance_no])
+        al_list.append(automated[instance_no])
+        if len(human_labels) - len(automated_labels) != 0:
+            raise RuntimeError("Human labeling of ID ", instance_no, " doesn't match length of original sentence!")
+
+    kappa_scores = []
+    ent1_kappa = []
+    ent2_kappa = []
+    rel_kappa = []
+    cond_kappa = []
+    for instance_no, labelling in labels.items():
+        auto_labelling = automated[instance_no]
+        kappa_scores.append(cohen_kappa_score(labelling, auto_labelling))
+        ent1_kappa.append(cohen_kappa_score(['O' if hl != 'ent1' else 'ent1' for hl in labelling],
+                                            ['O' if al != 'ent1' else 'ent1' for al in auto_labelling]))
+        if 'ent2' in labelling or 'ent2' in auto_labelling:
+            ent2_kappa.append(cohen_kappa_score(['O' if hl != 'ent2' else 'ent2' for hl in labelling],
+                                                ['O' if al != 'ent2' else 'ent2' for al in auto_labelling]))
+        rel_kappa.append(cohen_kappa_score(['O' if hl != 'rel' else 'rel' for hl in labelling],
+                                           ['O' if al != 'rel' else 'rel' for al in auto_labelling]))
+        if 'cond' in labelling or 'cond' in auto_labelling:
+            cond_kappa.append(cohen_kappa_score(['O' if hl != 'cond' else 'cond' for hl in labelling],
+                                                ['O' if al != 'cond' else 'cond' for al in auto_labelling]))
+
+    only_ent1_human = ['O' if hl != 'ent1' else 'ent1' for hl in human_labels]
+    only_ent1_auto = ['O' if al != 'ent1' else 'ent1' for al in automated_labels]
+    only_ent2_human = ['O' if hl != 'ent2' else 'ent2' for hl in human_labels]
+    only_ent2_auto = ['O' if al != 'ent2' else 'ent2' for al in automated_labels]
+    only_cond_human = ['O' if hl != 'cond' else 'cond' for hl in human_labels]
+    only_cond_auto = ['O' if al != 'cond' else 'cond' for al in automated_labels]
+    only_rel_human = ['O' if hl != 'rel' else 'rel' for hl in human_labels]
+    only_rel_auto = ['O' if al != 'rel' else 'rel' for al in automated_labels]
+
+    return [['All labels', mean(kappa_scores), cohen_kappa_score(human_labels, automated_labels)],
+            ['rel only', mean(rel_kappa), cohen_kappa_score(only_rel_auto, only_rel_human)],
+            ['ent1 only', mean(ent1_kappa), cohen_kappa_score(only_ent1_auto, only_ent1_human)],
+            ['ent2 only', mean(ent2_kappa), cohen_kappa_score(only_ent2_auto, only_ent2_human)],
+            ['cond only', mean(cond_kappa), cohen_kappa_score(only_cond_auto, only_cond_human)]]
+
+
+def kappa_table(rows: List[list]) -> str:
+    return tabulate(rows, KAPPA_HEADERS, floatfmt='.3f', tablefmt='psql')
+
+
+def confusion_matrices(labels: Dict[int, List[str]], automated: Sequence[List[str]],
+                       label_names: List[str]) -> np.ndarray:
+    # one confusion matrix (human x automated label) per instance of the human labelling, in its order
+    label_codes = {label: code for code, label in enumerate(label_names)}
+    size = len(label_names)
+    human_codes = []
+    automated_codes = []
+    sentence_codes = []
+    for sentence_no, (instance_no, labelling) in enumerate(labels.items()):
+        auto_labelling = automated[instance_no]
+        if len(labelling) != len(auto_labelling):
+            raise RuntimeError("Human labeling of ID ", instance_no, " doesn't match length of original sentence!")
+        human_codes.extend(label_codes[label] for label in labelling)
+        automated_codes.extend(label_codes[label] for label in auto_labelling)
+        sentence_codes.extend([sentence_no] * len(labelling))
+    flat = (np.array(sentence_codes, dtype=np.int64) * size + np.array(human_codes, dtype=np.int64)) * size \
+        + np.array(automated_codes, dtype=np.int64)
+    return np.bincount(flat, minlength=len(labels) * size * size).reshape(len(labels), size, size)
+
+
+def kappa_from_confusion(confusion: np.ndarray) -> np.ndarray:
+    # Cohen's kappa of every confusion matrix in the last two axes, computed as sklearn's cohen_kappa_score does.
+    # Undefined values (both labellings use the same single label) are nan.
+    total = confusion.sum(axis=(-2, -1))
+    expected = confusion.sum(axis=-1)[..., :, None] * confusion.sum(axis=-2)[..., None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = expected / total[..., None, None]
+        observed_disagreement = total - np.trace(confusion, axis1=-2, axis2=-1)
+        expected_disagreement = total - np.trace(expected, axis1=-2, axis2=-1)
+        return 1 - observed_disagreement / expected_disagreement
+
+
+def binary_confusion(confusion: np.ndarray, code: int) -> np.ndarray:
+    # collapses the confusion matrices in the last two axes to 'label' versus 'any other label'
+    both = confusion[..., code, code]
+    human = confusion[..., code, :].sum(axis=-1) - both
+    automated = confusion[..., :, code].sum(axis=-1) - both
+    neither = confusion.sum(axis=(-2, -1)) - both - human - automated
+    return np.stack([np.stack([both, human], axis=-1), np.stack([automated, neither], axis=-1)], axis=-2)
+
+
+def kappa_rows_from_confusion(confusion: np.ndarray, label_names: List[str]) -> List[list]:
+    # the rows of kappa_rows from the per-sentence confusion matrices
+    rows = [['All labels', float(kappa_from_confusion(confusion).mean()),
+             float(kappa_from_confusion(confusion.sum(axis=0)))]]
+    for label, only_occurring in SINGLE_LABEL_ROWS:
+        if label not in label_names:
+            rows.append([label + ' only', float('nan'), float('nan')])
+            continue
+        code = label_names.index(label)
+        binary = binary_confusion(confusion, code)
+        sentence_kappa = kappa_from_confusion(binary)
+        if only_occurring:
+            occurs = (confusion[:, code, :].sum(axis=-1) + confusion[:, :, code].sum(axis=-1)) > 0
+            sentence_kappa = sentence_kappa[occurs]
+        sentence_average = sentence_kappa.mean() if len(sentence_kappa) else float('nan')
+        rows.append([label + ' only', float(sentence_average), float(kappa_from_confusion(binary.sum(axis=0)))])
+    return rows
+
+
+def kappa_rows_from_codes(human_codes: np.ndarray, automated_codes: np.ndarray, sentences: np.ndarray,
+                          label_names: List[str]) -> List[list]:
+    # the rows of kappa_rows from the encoded labels of all human labelled tokens and the number of the human
+    # labelled sentence each token belongs to
+    size = len(label_names)
+    n_sentences = int(sentences[-1]) + 1 if len(sentences) else 0
+    flat = (sentences.astype(np.int64) * size + human_codes) * size + automated_codes
+    confusion = np.bincount(flat, minlength=n_sentences * size * size).reshape(n_sentences, size, size)
+    return kappa_rows_from_confusion(confusion, label_names)
+
+
+def _label_names(labels: Dict[int, List[str]], automated: Sequence[List[str]]) -> List[str]:
+    return sorted(set(label for labelling in labels.values() for label in labelling)
+                  | set(label for instance_no in labels for label in automated[instance_no]))
+
+
+def fast_kappa_rows(labels: Dict[int, List[str]], automated: Sequence[List[str]]) -> List[list]:
+    # same table as kappa_rows without one cohen_kappa_score call per sentence and label
+    label_names = _label_names(labels, automated)
+    return kappa_rows_from_confusion(confusion_matrices(labels, automated, label_names), label_names)
+
+
+def _sentence_kappas(confusion: np.ndarray, label_names: List[str]) -> List[tuple]:
+    # per row of the kappa table: the kappa of every sentence and whether the sentence counts for the average
+    everything = np.ones(len(confusion), dtype=bool)
+    sentence_kappas = [(kappa_from_confusion(confusion), everything)]
+    for label, only_occurring in SINGLE_LABEL_ROWS:
+        if label not in label_names:
+            sentence_kappas.append((np.full(len(confusion), np.nan), everything))
+            continue
+        code = label_names.index(label)
+        include = everything
+        if only_occurring:
+            include = (confusion[:, code, :].sum(axis=-1) + confusion[:, :, code].sum(axis=-1)) > 0
+        sentence_kappas.append((kappa_from_confusion(binary_confusion(confusion, code)), include))
+    return sentence_kappas
+
+
+def _pooled_kappas(pooled: np.ndarray, label_names: List[str]) -> List[np.ndarray]:
+    # per row of the kappa table: the overall kappa of every pooled confusion matrix
+    kappas = [kappa_from_confusion(pooled)]
+    for label, _ in SINGLE_LABEL_ROWS:
+        if label not in label_names:
+            kappas.append(np.full(len(pooled), np.nan))
+        else:
+            kappas.append(kappa_from_confusion(binary_confusion(pooled, label_names.index(label))))
+    return kappas
+
+
+def _bootstrap_chunk(confusion: np.ndarray, label_names: List[str], seed: np.random.SeedSequence, resamples: int,
+                     unit: str) -> np.ndarray:
+    # kappa table of 'resamples' bootstrap samples, shaped resamples x rows x (sentence average, overall)
+    rng = np.random.default_rng(seed)
+    n_sentences = len(confusion)
+    # how often every sentence is drawn in every resample
+    weights = rng.multinomial(n_sentences, np.full(n_sentences, 1 / n_sentences), size=resamples).astype(np.float64)
+    if unit == 'sentence':
+        pooled = (weights @ confusion.reshape(n_sentences, -1)).reshape((resamples,) + confusion.shape[1:])
+    else:
+        total = confusion.sum(axis=0)
+        pooled = rng.multinomial(total.sum(), total.ravel() / total.sum(), size=resamples).reshape(
+            (resamples,) + total.shape)
+
+    statistics = np.empty((resamples, len(SINGLE_LABEL_ROWS) + 1, 2))
+    for row_no, (kappas, include) in enumerate(_sentence_kappas(confusion, label_names)):
+        undefined = np.isnan(kappas) & include
+        row_weights = weights * include
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = (row_weights @ np.where(include, np.nan_to_num(kappas), 0)) / row_weights.sum(axis=1)
+        # like the point estimate, the average is undefined as soon as one undefined sentence is drawn
+        average[(weights @ undefined) > 0] = np.nan
+        statistics[:, row_no, 0] = average
+    for row_no, kappas in enumerate(_pooled_kappas(pooled, label_names)):
+        statistics[:, row_no, 1] = kappas
+    return statistics
+
+
+def bootstrap_kappa_intervals(confusion: np.ndarray, label_names: List[str], resamples: int = 10000,
+                              confidence: float = 0.95, unit: str = 'sentence', seed: Optional[int] = None,
+                              workers: int = 1, chunk_size: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
+    # percentile bootstrap intervals of the kappa table, shaped rows x (sentence average, overall) x (low, high),
+    # and the number of resamples left out of every interval because their kappa is undefined (rows x 2). Intervals
+    # of fewer than MIN_DEFINED_SHARE defined resamples are nan, a few draws give no meaningful percentiles.
+    # The sentence average is always resampled by sentence; the overall kappa either by sentence or by token.
+    if unit not in ('sentence', 'token'):
+        raise ValueError('Unknown resampling unit ' + unit)
+    if not 0 < confidence < 1:
+        raise ValueError('The confidence level must be between 0 and 1, not ' + str(confidence))
+    chunks = [min(chunk_size, resamples - start) for start in range(0, resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    arguments = [(confusion, label_names, chunk_seed, chunk, unit) for chunk_seed, chunk in zip(seeds, chunks)]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            statistics = list(executor.map(_bootstrap_chunk, *zip(*arguments)))
+    else:
+        statistics = [_bootstrap_chunk(*chunk_arguments) for chunk_arguments in arguments]
+    statistics = np.concatenate(statistics)
+    alpha = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        # intervals whose resamples are all undefined stay nan
+        warnings.simplefilter('ignore', RuntimeWarning)
+        intervals = np.moveaxis(np.nanpercentile(statistics, [alpha, 100 - alpha], axis=0), 0, -1)
+    dropped = np.isnan(statistics).sum(axis=0)
+    intervals[resamples - dropped < MIN_DEFINED_SHARE * resamples] = np.nan
+    return intervals, dropped
+
+
+def kappa_interval_table(rows: List[list], intervals: np.ndarray, confidence: float,
+                         dropped: Optional[np.ndarray] = None, resamples: Optional[int] = None) -> str:
+    ci = '{:.0f}% CI'.format(confidence * 100)
+    table = []
+    for row, (average, overall) in zip(rows, intervals):
+        table.append([row[0], row[1], '[{:.3f}, {:.3f}]'.format(*average), row[2],
+                      '[{:.3f}, {:.3f}]'.format(*overall)])
+    output = tabulate(table, [KAPPA_HEADERS[0], KAPPA_HEADERS[1], ci, KAPPA_HEADERS[2], ci], floatfmt='.3f',
+                      tablefmt='psql')
+    if dropped is not None:
+        for row, row_dropped in zip(rows, dropped):
+            for column, count in zip(KAPPA_HEADERS[1:], row_dropped):
+                if count:
+                    output += '\n' + row[0] + ', ' + column + ': ' + str(int(count)) + ' of ' + str(resamples) \
+                        + ' resamples left out, their kappa is undefined'
+                    if resamples - count < MIN_DEFINED_SHARE * resamples:
+                        output += '; too few are left for an interval'
+    return output
+
+
+def bootstrap_kappa_rows(labels: Dict[int, List[str]], automated: Sequence[List[str]], resamples: int = 10000,
+                         confidence: float = 0.95, unit: str = 'sentence', seed: Optional[int] = None,
+                         workers: int = 1) -> str:
+    # the kappa table with a bootstrap confidence interval next to both columns
+    label_names = _label_names(labels, automated)
+    confusion = confusion_matrices(labels, automated, label_names)
+    intervals, dropped = bootstrap_kappa_intervals(confusion, label_names, resamples, confidence, unit, seed,
+                                                   workers)
+    return kappa_interval_table(kappa_rows_from_confusion(confusion, label_names), intervals, confidence, dropped,
+                                resamples)
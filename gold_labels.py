@@ -0,0 +1,164 @@
+from __future__ import annotations
+import argparse
+import csv
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# the labels of the human labeling files and the names the patterns use for them
+GOLD_LABELS = {'O': 'O', '1': 'ent1', '2': 'ent2', 'c': 'cond', 'r': 'rel'}
+LABEL_NAMES = ['O', 'ent1', 'ent2', 'cond', 'rel']
+# bump whenever the stored arrays change, so that stale cache entries are not used
+STORE_FORMAT = 1
+CACHE_DIR = '.gold_cache'
+WHITESPACE = np.frombuffer(b' \t\n\r\x0b\x0c', dtype=np.uint8)
+
+
+class GoldLabelStore:
+    # the human labeling as integer arrays: the ID of every labelled sentence in file order, the offsets of its labels
+    # and the code of every label (an index into LABEL_NAMES). IDs given twice keep the position of their first row
+    # and the labels of their last one.
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray, codes: np.ndarray, source: Optional[str] = None):
+        self.ids = ids
+        self.offsets = offsets
+        self.codes = codes
+        self.source = source
+
+    @property
+    def n_sentences(self) -> int:
+        return len(self.ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @classmethod
+    def encode(cls, file_name: str) -> GoldLabelStore:
+        # reads a human labeling file with 'ID' and 'labeling' columns. The labels of all rows are encoded at once on
+        # their bytes, as every label is a single character.
+        with open(file_name, newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            if 'ID' not in header or 'labeling' not in header:
+                raise RuntimeError("Human labeling file must have 'ID' and 'labeling' columns!")
+            id_column = header.index('ID')
+            labeling_column = header.index('labeling')
+            ids = []
+            labelings = []
+            for row in reader:
+                ids.append(int(row[id_column]))
+                labelings.append(row[labeling_column].encode())
+        ids = np.array(ids, dtype=np.int64)
+
+        row_starts = np.zeros(len(labelings) + 1, dtype=np.int64)
+        row_starts[1:] = np.cumsum([len(labeling) + 1 for labeling in labelings])
+        text = np.frombuffer(b'\n'.join(labelings) + b'\n', dtype=np.uint8)
+        space = np.isin(text, WHITESPACE)
+        follows_space = np.concatenate([[True], space[:-1]])
+        longer = np.flatnonzero(~space & ~follows_space)
+        starts = np.flatnonzero(~space & follows_space)
+        table = np.full(256, -1, dtype=np.int8)
+        for label, name in GOLD_LABELS.items():
+            table[ord(label)] = LABEL_NAMES.index(name)
+        codes = table[text[starts]]
+        unknown = np.flatnonzero(codes < 0)
+        if len(longer) or len(unknown):
+            position = min(longer[:1].tolist() + starts[unknown[:1]].tolist())
+            row_no = int(np.searchsorted(row_starts, position, 'right')) - 1
+            label = next(label for label in labelings[row_no].decode().split() if label not in GOLD_LABELS)
+            raise RuntimeError('Unknown label ' + label + ' in the human labeling of ID ' + str(ids[row_no]))
+        rows = np.searchsorted(row_starts, starts, 'right') - 1
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(rows, minlength=len(ids)))
+
+        if len(np.unique(ids)) < len(ids):
+            last_rows = {}
+            for row_no, instance_no in enumerate(ids.tolist()):
+                last_rows[instance_no] = row_no
+            print('Human labeling gives', str(len(ids) - len(last_rows)), 'IDs more than once, their last row is used',
+                  file=sys.stderr)
+            keep = list(last_rows.values())
+            ids = ids[keep]
+            codes = np.concatenate([codes[offsets[row_no]:offsets[row_no + 1]] for row_no in keep]
+                                   + [np.zeros(0, dtype=np.int8)])
+            offsets = np.concatenate([[0], np.cumsum(np.diff(offsets)[keep])]).astype(np.int64)
+        return cls(ids, offsets, codes, file_name)
+
+    @classmethod
+    def load(cls, file_name: str, cache_dir: Optional[str] = None) -> GoldLabelStore:
+        # encodes the file or loads its encoded form from the cache, keyed by the hash of its content
+        from checkpointing import file_hash
+
+        if not os.path.isfile(file_name):
+            raise RuntimeError(" Human labeling file path either doesn't exist or is not a file.")
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_name)), CACHE_DIR)
+        cache_file = os.path.join(cache_dir, file_hash(file_name) + '.' + str(STORE_FORMAT) + '.npz')
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as data:
+                return cls(data['ids'], data['offsets'], data['codes'], file_name)
+
+        store = cls.encode(file_name)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        # write to a temporary file first, so concurrent runs never read a partially written cache entry
+        temporary_file = cache_file + '.' + str(os.getpid()) + '.npz'
+        np.savez(temporary_file, ids=store.ids, offsets=store.offsets, codes=store.codes)
+        os.replace(temporary_file, cache_file)
+        return store
+
+    def validate(self, token_counts: Sequence[int], what: str = 'input'):
+        # fails if an ID is no sentence of the input or its number of labels differs from the number of tokens
+        token_counts = np.asarray(token_counts, dtype=np.int64)
+        outside = np.flatnonzero((self.ids < 0) | (self.ids >= len(token_counts)))
+        if len(outside):
+            raise RuntimeError('Human labeling of ID ' + str(self.ids[outside[0]]) + ' refers to no sentence of the '
+                               + what + ', which has ' + str(len(token_counts)) + ' sentences')
+        mismatches = np.flatnonzero(token_counts[self.ids] != self.lengths)
+        if len(mismatches):
+            instance_no = self.ids[mismatches[0]]
+            raise RuntimeError('Human labeling of ' + str(len(mismatches)) + " IDs doesn't match the length of the "
+                               'original sentence, e.g. ID ' + str(instance_no) + ' has ' +
+                               str(self.lengths[mismatches[0]]) + ' labels for ' + str(token_counts[instance_no])
+                               + ' tokens of the ' + what)
+
+    def subset(self, keep: np.ndarray) -> GoldLabelStore:
+        # the store of the sentences where keep is True
+        offsets = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(self.lengths[keep])
+        return GoldLabelStore(self.ids[keep], offsets, self.codes[np.repeat(keep, self.lengths)], self.source)
+
+    def labelling(self, sentence_no: int) -> List[str]:
+        return [LABEL_NAMES[code] for code in self.codes[self.offsets[sentence_no]:self.offsets[sentence_no + 1]]]
+
+    def labels(self) -> Dict[int, List[str]]:
+        # the labeling by ID, as a dictionary of label lists
+        return {int(instance_no): self.labelling(sentence_no) for sentence_no, instance_no in enumerate(self.ids)}
+
+
+def main(human_labeling, input_file, cache_dir):
+    import time
+
+    started = time.perf_counter()
+    store = GoldLabelStore.load(human_labeling, cache_dir)
+    print("Human labelled sentences:", str(store.n_sentences), "with", str(len(store.codes)), "labels, loaded in",
+          '%.3f' % (time.perf_counter() - started), "s")
+    if input_file is not None:
+        from create_labels import read_requirements
+        store.validate([len(tokens) for tokens in read_requirements(input_file)])
+        print("The human labeling matches the sentences of", input_file)
+
+
+parser = argparse.ArgumentParser(description="Encodes a human labeling file into the cache used by create_labels.py "
+                                             "and checks it against the sentences of an input file.")
+parser.add_argument('--human_labeling', '-l', required=True, help="Human labeling file (.csv).")
+parser.add_argument('--input-file', '-i', help="Input file whose tokenized sentences the labeling has to match.")
+parser.add_argument('--cache-dir', help="Directory of the encoded files. Defaults to '.gold_cache' next to the human "
+                                        "labeling file.")
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    main(arguments.human_labeling, arguments.input_file, arguments.cache_dir)
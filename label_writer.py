@@ -0,0 +1,124 @@
+from __future__ import annotations
+import os
+import queue
+import threading
+from typing import Iterable, List, Optional, Sequence, TextIO
+
+# rows formatted and handed to the file at once
+CHUNK_ROWS = 65536
+BUFFER_SIZE = 1 << 20
+
+
+def open_output(file_name: str) -> TextIO:
+    # a text file, compressed with gzip for .gz and with zstd for .zst/.zstd file names
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.gz':
+        import gzip
+        return gzip.open(file_name, 'wt', compresslevel=6)
+    if extension in ('.zst', '.zstd'):
+        try:
+            from compression import zstd
+        except ImportError:
+            try:
+                import zstandard as zstd
+            except ImportError:
+                raise RuntimeError('Writing zstd compressed labels requires Python 3.14 or zstandard to be installed!')
+        return zstd.open(file_name, 'wt')
+    return open(file_name, 'w', buffering=BUFFER_SIZE)
+
+
+def format_row(instance_id, labelling: Sequence[str]) -> str:
+    # 'ID, label label ... \n' with a space after every label, as in all labels files
+    return str(instance_id) + ', ' + (' '.join(labelling) + ' ' if labelling else '') + '\n'
+
+
+def csv_field(value: str) -> str:
+    # value as a single CSV field, quoted if needed
+    import csv
+    import io
+
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow([value])
+    return buffer.getvalue()
+
+
+class LabelWriter:
+    # writes the rows of a labels file in chunks of formatted rows instead of one write per label. With background,
+    # the chunks are written (and compressed) by a thread, so the caller can go on while the file is written.
+    # close has to be called to finish the file; it raises any error of the writing thread, unless another exception
+    # is already propagating.
+
+    def __init__(self, file_name: str, header: str = 'ID,labeling', background: bool = False,
+                 chunk_rows: int = CHUNK_ROWS):
+        self.file_name = file_name
+        self.chunk_rows = chunk_rows
+        self._file = open_output(file_name)
+        self._queue: Optional[queue.Queue] = None
+        self._thread = None
+        self._error = None
+        if background:
+            self._queue = queue.Queue(maxsize=4)
+            self._thread = threading.Thread(target=self._write_queued, name='label-writer', daemon=True)
+            self._thread.start()
+        self._write(header + '\n')
+
+    def _write_queued(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is None:
+                try:
+                    self._file.write(chunk)
+                except BaseException as error:
+                    # keep taking chunks, so the caller never blocks on a full queue
+                    self._error = error
+
+    def _write(self, chunk: str):
+        if self._queue is None:
+            self._file.write(chunk)
+        else:
+            if self._error is not None:
+                raise self._error
+            self._queue.put(chunk)
+
+    def write_rows(self, instance_ids: Iterable, labellings: Iterable[Sequence[str]]):
+        rows: List[str] = []
+        for instance_id, labelling in zip(instance_ids, labellings):
+            rows.append(format_row(instance_id, labelling))
+            if len(rows) == self.chunk_rows:
+                self._write(''.join(rows))
+                rows = []
+        if rows:
+            self._write(''.join(rows))
+
+    def write_trees(self, parse_trees: Sequence, first_id: int = 0):
+        # the rows of all trees a final pattern was applied to, by their index
+        applied = [instance_no for instance_no, tree in enumerate(parse_trees) if tree.pattern_applied]
+        self.write_rows((first_id + instance_no for instance_no in applied),
+                        (parse_trees[instance_no].get_current_labelling() for instance_no in applied))
+
+    def close(self, raise_error: bool = True):
+        # with raise_error False, errors of writing the file are dropped instead of hiding the exception at hand
+        if self._file is None:
+            return
+        error = None
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            error = self._error
+        try:
+            self._file.close()
+        except Exception as close_error:
+            error = error or close_error
+        finally:
+            self._file = None
+        if error is not None and raise_error:
+            raise error
+
+    def __enter__(self) -> LabelWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(raise_error=exc_type is None)
+        return False
@@ -0,0 +1,60 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+from Parser import ParseTree
+
+
+def constrained_words(patterns: List[dict]) -> Dict[str, Set[str]]:
+    # dependency label -> lowercased words some 'label=word' step of the patterns compares against.
+    # The root step is skipped, as its word is never compared.
+    words = {}
+    for pattern in patterns:
+        for _, path, _ in pattern['pattern']:
+            for step in path[1:]:
+                if '=' in step and not step.startswith('!'):
+                    label, word = step.split('=')
+                    words.setdefault(label, set()).add(word.lower())
+    return words
+
+
+def structural_signature(tree: ParseTree, words: Dict[str, Set[str]]) -> tuple:
+    # the outcome of matching only depends on the heads and dependency labels and on the words checked by some
+    # 'label=word' step, so all other words are left out. Trees with the same signature are labelled alike.
+    signature = []
+    for node in tree.nodes:
+        word = node.word.lower()
+        if word not in words.get(node.label, ()):
+            word = None
+        signature.append((-1 if node.parent is None else node.parent.index, node.label, word))
+    return tuple(signature)
+
+
+class StructuralMatchCache:
+    # LRU cache from structural signature to the index of the final pattern applied (-1 if none) and the labelling
+
+    def __init__(self, patterns: List[dict], max_size: int = 100000):
+        self.patterns = patterns
+        self.max_size = max_size
+        self.words = constrained_words(patterns)
+        self.entries: OrderedDict[tuple, Tuple[int, List[str]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def apply(self, tree: ParseTree, router=None) -> int:
+        # labels a clean tree like ParseTree.apply_patterns or router.apply do and returns the pattern index
+        signature = structural_signature(tree, self.words)
+        entry = self.entries.get(signature)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(signature)
+            pattern_no, labels = entry
+            tree.set_labelling(labels, pattern_no != -1)
+            return pattern_no
+
+        self.misses += 1
+        pattern_no = router.apply(tree) if router is not None else tree.apply_patterns(self.patterns)
+        self.entries[signature] = (pattern_no, tree.get_current_labelling())
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return pattern_no
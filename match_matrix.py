@@ -0,0 +1,228 @@
+from __future__ import annotations
+import argparse
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Parser import ParseTree
+
+# label code of tokens a pattern does not label
+UNTOUCHED = -1
+
+
+def pattern_outcome(tree: ParseTree, pattern: dict, label_codes: Dict[str, int]) -> Optional[List[int]]:
+    # None if the pattern does not match the tree, else the label code it sets on every token (UNTOUCHED if none)
+    labels = tree.pattern_labelling(pattern['pattern'], ['O'] * len(tree.nodes))
+    if labels is None:
+        return None
+    # starting from 'O' everywhere, every token still labelled 'O' has not been touched by the pattern
+    return [UNTOUCHED if label == 'O' else label_codes[label] for label in labels]
+
+
+class MatchMatrix:
+    # the outcome of every pattern evaluated on its own against every tree: a bit matrix of which patterns match
+    # which sentences and, per pattern, the labels it sets on the tokens of the sentences it matches. Paths resolve
+    # independently of the labels, so the labelling of any ordering or subset of the patterns follows from this.
+
+    def __init__(self, matches: np.ndarray, final: np.ndarray, codes: List[np.ndarray], label_names: List[str],
+                 sentence_offsets: np.ndarray, version: Optional[str] = None):
+        # matches: patterns x sentences, bool
+        self.matches = matches
+        self.final = final
+        # codes[p]: label codes for the tokens of all sentences matched by pattern p, in sentence order
+        self.codes = codes
+        self.label_names = label_names
+        self.sentence_offsets = sentence_offsets
+        self.token_sentence = np.repeat(np.arange(len(sentence_offsets) - 1), np.diff(sentence_offsets))
+        self.version = version
+        self._encoded = None
+
+    @property
+    def n_patterns(self) -> int:
+        return self.matches.shape[0]
+
+    @property
+    def n_sentences(self) -> int:
+        return self.matches.shape[1]
+
+    @classmethod
+    def build(cls, parse_trees: List[ParseTree], patterns: List[dict]) -> MatchMatrix:
+        label_names = ['O']
+        label_codes = {'O': 0}
+        for pattern in patterns:
+            for entity, _, _ in pattern['pattern']:
+                if entity not in label_codes:
+                    label_codes[entity] = len(label_names)
+                    label_names.append(entity)
+
+        matches = np.zeros((len(patterns), len(parse_trees)), dtype=bool)
+        codes = [[] for _ in patterns]
+        for instance_no, tree in enumerate(parse_trees):
+            for pattern_no, pattern in enumerate(patterns):
+                sentence_codes = pattern_outcome(tree, pattern, label_codes)
+                if sentence_codes is not None:
+                    matches[pattern_no, instance_no] = True
+                    codes[pattern_no].append(sentence_codes)
+            tree.release_paths()
+        sentence_offsets = np.zeros(len(parse_trees) + 1, dtype=np.int64)
+        sentence_offsets[1:] = np.cumsum([len(tree.nodes) for tree in parse_trees])
+        codes = [np.fromiter((code for sentence_codes in pattern_codes for code in sentence_codes), dtype=np.int8)
+                 for pattern_codes in codes]
+        final = np.array([pattern['final'] for pattern in patterns], dtype=bool)
+        return cls(matches, final, codes, label_names, sentence_offsets, getattr(patterns, 'version', None))
+
+    def resolve(self, order: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # first-match-wins over the patterns in the given order (all patterns by default). Returns the label code
+        # of every token and, for every sentence, the index of the final pattern applied or -1.
+        if order is None:
+            order = range(self.n_patterns)
+        labels = np.zeros(len(self.token_sentence), dtype=np.int8)
+        matched = np.full(self.n_sentences, -1, dtype=np.int32)
+        applied = np.zeros(self.n_sentences, dtype=bool)
+        for pattern_no in order:
+            row = self.matches[pattern_no]
+            active = row & ~applied
+            if not active.any():
+                continue
+            positions = np.flatnonzero(row[self.token_sentence])
+            codes = self.codes[pattern_no]
+            write = active[self.token_sentence[positions]] & (codes != UNTOUCHED)
+            labels[positions[write]] = codes[write]
+            if self.final[pattern_no]:
+                applied |= active
+                matched[active] = pattern_no
+        return labels, matched
+
+    def labelling(self, labels: np.ndarray, instance_no: int) -> List[str]:
+        start, end = self.sentence_offsets[instance_no], self.sentence_offsets[instance_no + 1]
+        return [self.label_names[code] for code in labels[start:end]]
+
+    def encode_human_labels(self, human_labels: Dict[int, List[str]]) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+        # token positions of the human labelled sentences, the number of the human labelled sentence of each of
+        # these tokens, their human label codes and the names of all codes
+        label_names = list(self.label_names)
+        positions = []
+        codes = []
+        for instance_no, labelling in human_labels.items():
+            start, end = self.sentence_offsets[instance_no], self.sentence_offsets[instance_no + 1]
+            if end - start != len(labelling):
+                raise RuntimeError("Human labeling of ID ", instance_no,
+                                   " doesn't match length of original sentence!")
+            for label in labelling:
+                if label not in label_names:
+                    label_names.append(label)
+                codes.append(label_names.index(label))
+            positions.append(np.arange(start, end))
+        sentences = np.repeat(np.arange(len(positions)), [len(sentence) for sentence in positions])
+        positions = np.concatenate(positions + [np.zeros(0, dtype=np.int64)])
+        return positions, sentences, np.array(codes, dtype=np.int64), label_names
+
+    def evaluate(self, order: Optional[Sequence[int]] = None,
+                 human_labels: Optional[Dict[int, List[str]]] = None) -> Tuple[int, Optional[List[list]]]:
+        # number of labelled sentences and, if human labels are given, the rows of the kappa table
+        from evaluation import kappa_rows_from_codes
+
+        labels, matched = self.resolve(order)
+        rows = None
+        if human_labels is not None:
+            if self._encoded is None or self._encoded[0] is not human_labels:
+                self._encoded = (human_labels,) + self.encode_human_labels(human_labels)
+            _, positions, sentences, human_codes, label_names = self._encoded
+            rows = kappa_rows_from_codes(human_codes, labels[positions], sentences, label_names)
+        return int((matched != -1).sum()), rows
+
+    def save(self, file_name: str):
+        np.savez_compressed(file_name, matches=np.packbits(self.matches, axis=1), n_sentences=self.n_sentences,
+                            final=self.final, codes=np.concatenate(self.codes + [np.zeros(0, dtype=np.int8)]),
+                            code_offsets=np.cumsum([0] + [len(codes) for codes in self.codes]),
+                            label_names=np.array(self.label_names), sentence_offsets=self.sentence_offsets,
+                            version=np.array('' if self.version is None else self.version))
+
+    @classmethod
+    def load(cls, file_name: str) -> MatchMatrix:
+        with np.load(file_name) as data:
+            matches = np.unpackbits(data['matches'], axis=1, count=int(data['n_sentences'])).astype(bool)
+            offsets = data['code_offsets']
+            codes = [data['codes'][offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            version = str(data['version']) or None
+            return cls(matches, data['final'], codes, [str(name) for name in data['label_names']],
+                       data['sentence_offsets'], version)
+
+
+def parse_order(order: str) -> List[int]:
+    return [int(pattern_no) for pattern_no in order.split(',') if pattern_no.strip()]
+
+
+def main(input_file, output_path, patterns_file, matrix_file, human_labeling, order, ablate):
+    from tabulate import tabulate
+    from pattern_store import default_patterns, load_patterns
+
+    patterns = load_patterns(patterns_file) if patterns_file is not None else default_patterns()
+    gold = None
+    if human_labeling is not None:
+        from gold_labels import GoldLabelStore
+        gold = GoldLabelStore.load(human_labeling)
+    if matrix_file is not None and os.path.isfile(matrix_file):
+        matrix = MatchMatrix.load(matrix_file)
+        if matrix.version != patterns.version:
+            raise RuntimeError('The match matrix was built for other patterns (version ' + str(matrix.version) + ')')
+    else:
+        from create_labels import load_parse_trees
+        if input_file is None or output_path is None:
+            raise RuntimeError('Input file and output directory of a previous run are needed to build the matrix')
+        matrix = MatchMatrix.build(load_parse_trees(input_file, output_path), patterns)
+        if matrix_file is not None:
+            matrix.save(matrix_file)
+
+    human_labels = None
+    if gold is not None:
+        gold.validate(np.diff(matrix.sentence_offsets), 'parse trees')
+        human_labels = gold.labels()
+
+    order = parse_order(order) if order is not None else list(range(matrix.n_patterns))
+    count, rows = matrix.evaluate(order, human_labels)
+    print("Number of patterns used:", str(len(order)))
+    print("Labeled instances: " + str(count / matrix.n_sentences * 100) + "%")
+    if rows is not None:
+        from evaluation import kappa_table
+        print(kappa_table(rows))
+
+    if ablate:
+        # the effect of removing each pattern on its own
+        table = []
+        for pattern_no in order:
+            ablated_count, ablated_rows = matrix.evaluate([other for other in order if other != pattern_no],
+                                                          human_labels)
+            row = [pattern_no, (ablated_count - count) / matrix.n_sentences * 100]
+            if rows is not None:
+                row += [ablated_rows[0][1] - rows[0][1], ablated_rows[0][2] - rows[0][2]]
+            table.append(row)
+        headers = ['Removed pattern', 'Labeled instances delta (%)']
+        if rows is not None:
+            headers += ['Sentence Average delta', 'Overall delta']
+        print(tabulate(table, headers, floatfmt='.3f', tablefmt='psql'))
+
+
+parser = argparse.ArgumentParser(description="Evaluates every pattern once against every sentence of a previous "
+                                             "create_labels.py run and computes the labelling of any ordering or "
+                                             "subset of the patterns from that.")
+parser.add_argument('--input-file', '-i', help="Input file of the previous run.")
+parser.add_argument('--output-dir', '-o', help="Output directory of the previous run.")
+parser.add_argument('--patterns', help="Pattern file to use instead of the built-in patterns.")
+parser.add_argument('--matrix', '-m', help="Match matrix file (.npz). Loaded if it exists, otherwise built from the "
+                                           "previous run and saved.")
+parser.add_argument('--human_labeling', '-l', help="Human labeling file for the kappa calculation.")
+parser.add_argument('--order', help="Comma separated pattern indices to apply, in this order. Defaults to all "
+                                    "patterns in their original order.")
+parser.add_argument('--ablate', action='store_true', help="Report the change in coverage and kappa when removing "
+                                                          "each pattern on its own.")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    arguments = parser.parse_args()
+    main(arguments.input_file, arguments.output_dir, arguments.patterns, arguments.matrix,
+         arguments.human_labeling, arguments.order, arguments.ablate)
@@ -0,0 +1,249 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+from itertools import combinations
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from Parser import ParseTree, Node
+
+KEYS_FILE = 'keys.json'
+POSTINGS_FILE = 'postings.npy'
+OFFSETS_FILE = 'offsets.npy'
+# the trees as flat arrays over all tokens (see batch_matcher.TreeBatch), for the steps the keys cannot answer
+TREE_FILES = {'heads': 'tree_heads.npy', 'labels': 'tree_labels.npy', 'words': 'tree_words.npy',
+              'offsets': 'tree_offsets.npy'}
+
+
+def _path_keys(steps: List[Node], max_words: int) -> List[str]:
+    # all index keys of a downward path: every step with its label, and up to max_words of the steps with their
+    # word as well. A path of d steps has sum(d choose i for i <= max_words) keys instead of 2^d with all words.
+    labels = [node.label for node in steps]
+    keys = []
+    for count in range(min(max_words, len(steps)) + 1):
+        for positions in combinations(range(len(steps)), count):
+            variant = list(labels)
+            for position in positions:
+                variant[position] += '=' + steps[position].word.lower()
+            keys.append('/'.join(['root'] + variant))
+    return keys
+
+
+def _save_trees(parse_trees: List[ParseTree], index_path: str) -> Dict[str, List[str]]:
+    # heads (1-based, 0 for tokens without a parent), label and lowercase word ids and sentence offsets of all trees
+    label_codes: Dict[str, int] = {}
+    word_codes: Dict[str, int] = {}
+    heads, label_ids, word_ids, lengths = [], [], [], []
+    for tree in parse_trees:
+        for node in tree.nodes:
+            heads.append(0 if node.parent is None else node.parent.index + 1)
+            label_ids.append(label_codes.setdefault(node.label, len(label_codes)))
+            word_ids.append(word_codes.setdefault(node.word.lower(), len(word_codes)))
+        lengths.append(len(tree.nodes))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    for name, values, dtype in (('heads', heads, np.int32), ('labels', label_ids, np.int32),
+                                ('words', word_ids, np.int32), ('offsets', offsets, np.int64)):
+        np.save(os.path.join(index_path, TREE_FILES[name]), np.asarray(values, dtype=dtype))
+    return {'label_names': list(label_codes), 'word_names': list(word_codes)}
+
+
+def build_index(parse_trees: List[ParseTree], index_path: str, depth: int = 4, words: bool = False,
+                max_words: int = 2):
+    # maps every root-anchored downward dependency path of up to 'depth' steps to the ids of the sentences
+    # (their index in parse_trees) containing it. With words, keys carry the words of up to max_words steps.
+    if not words:
+        max_words = 0
+    postings: Dict[str, List[int]] = {}
+    for instance_no, tree in enumerate(parse_trees):
+        keys = set()
+        stack = [(tree.root, [])]
+        while stack:
+            node, steps = stack.pop()
+            if steps:
+                keys.update(_path_keys(steps, max_words))
+            if len(steps) < depth:
+                for children in node.children.values():
+                    for child in children:
+                        stack.append((child, steps + [child]))
+        for key in keys:
+            postings.setdefault(key, []).append(instance_no)
+
+    if not os.path.exists(index_path):
+        os.makedirs(index_path)
+    keys = sorted(postings)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[key]) for key in keys])
+    # sentence ids are appended in increasing order, so every posting list is sorted
+    np.save(os.path.join(index_path, POSTINGS_FILE),
+            np.fromiter((instance_no for key in keys for instance_no in postings[key]), dtype=np.int64,
+                        count=int(offsets[-1])))
+    np.save(os.path.join(index_path, OFFSETS_FILE), offsets)
+    vocabularies = _save_trees(parse_trees, index_path)
+    with open(os.path.join(index_path, KEYS_FILE), 'w') as file:
+        json.dump(dict({'depth': depth, 'words': words, 'max_words': max_words, 'sentences': len(parse_trees),
+                        'keys': keys}, **vocabularies), file)
+
+
+def split_path(path: Union[str, List[str]]) -> List[str]:
+    if isinstance(path, str):
+        path = path.strip('/').split('/')
+    if not path or path[0].split('=')[0] != 'root':
+        raise ValueError('Pattern must start from the root! Your pattern starts with ' + str(path[:1]))
+    return list(path)
+
+
+class PathIndex:
+
+    def __init__(self, index_path: str):
+        with open(os.path.join(index_path, KEYS_FILE)) as file:
+            meta = json.load(file)
+        self.depth = meta['depth']
+        self.words = meta['words']
+        # indexes written before the cap carry all words
+        self.max_words = meta.get('max_words', self.depth if self.words else 0)
+        self.sentences = meta['sentences']
+        self.keys = {key: position for position, key in enumerate(meta['keys'])}
+        self.postings = np.load(os.path.join(index_path, POSTINGS_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(index_path, OFFSETS_FILE))
+        self.trees = None
+        if 'label_names' in meta:
+            self.trees = {name: np.load(os.path.join(index_path, file_name), mmap_mode='r')
+                          for name, file_name in TREE_FILES.items()}
+            self.label_names = meta['label_names']
+            self.word_names = meta['word_names']
+            self._word_codes = None
+
+    def posting(self, key: str) -> np.ndarray:
+        if key == 'root':
+            return np.arange(self.sentences)
+        if key not in self.keys:
+            return np.zeros(0, dtype=np.int64)
+        position = self.keys[key]
+        return np.asarray(self.postings[self.offsets[position]:self.offsets[position + 1]])
+
+    def requirements(self, path: List[str]) -> List[str]:
+        # downward paths every matching sentence must contain: filters ('!') are left out and '..' steps back up.
+        # Paths deeper than the index are cut off and words are dropped if they are not indexed, as both only make
+        # the requirement weaker.
+        required = []
+        stack = []
+        for step in path[1:]:
+            if step.startswith('!'):
+                continue
+            if step == '..':
+                if stack:
+                    stack.pop()
+                continue
+            if '=' in step:
+                label, word = step.split('=')
+                step = label + '=' + word.lower()
+            stack.append(step)
+            # the words of the first max_words steps of the key are kept
+            key = []
+            words = 0
+            for key_step in stack[:self.depth]:
+                if '=' in key_step:
+                    if words == self.max_words:
+                        key_step = key_step.split('=')[0]
+                    else:
+                        words += 1
+                key.append(key_step)
+            required.append('/'.join(['root'] + key))
+        return required or ['root']
+
+    def is_exact(self, path: List[str]) -> bool:
+        # whether the candidates of a path are exactly the sentences it matches
+        return all(not step.startswith('!') and step != '..' for step in path[1:]) \
+            and len(path) - 1 <= self.depth and sum('=' in step for step in path[1:]) <= self.max_words
+
+    def candidates(self, path: Union[str, List[str]]) -> np.ndarray:
+        # superset of the ids of all sentences the path resolves to at least one node in
+        path = split_path(path)
+        result = None
+        for key in sorted(set(self.requirements(path)), key=lambda key: -key.count('/')):
+            posting = self.posting(key)
+            result = posting if result is None else np.intersect1d(result, posting, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+    def check(self, candidates: np.ndarray, path: List[str]) -> np.ndarray:
+        # the candidates the path resolves to at least one node in, on the trees stored in the index. Only the
+        # tokens of the candidates are read.
+        from batch_matcher import TreeBatch, _ranges
+
+        if len(candidates) == 0:
+            return candidates
+        if self._word_codes is None:
+            self._word_codes = {word: code for code, word in enumerate(self.word_names)}
+        starts = self.trees['offsets'][candidates]
+        lengths = self.trees['offsets'][candidates + 1] - starts
+        tokens = _ranges(starts, lengths)
+        offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        batch = TreeBatch(self.trees['heads'][tokens].astype(np.int64), self.trees['labels'][tokens],
+                          self.trees['words'][tokens], offsets, self.label_names, self.word_names, self._word_codes)
+        return candidates[np.unique(batch.sentence[batch.resolve_path(path)])]
+
+    def query(self, path: Union[str, List[str]], parse_trees: Optional[List[ParseTree]] = None) -> np.ndarray:
+        # ids of all sentences the path resolves to at least one node in, using the same path syntax as the
+        # patterns. Paths with '!' or '..' steps (or deeper than the index) are checked on the trees stored in the
+        # index, or on the given trees for indexes built without them.
+        path = split_path(path)
+        candidates = self.candidates(path)
+        if self.is_exact(path):
+            return candidates
+        if self.trees is not None:
+            return self.check(candidates, path)
+        if parse_trees is None:
+            raise RuntimeError("The parse trees are needed to check the '!' and '..' steps of " + '/'.join(path))
+        return np.array([instance_no for instance_no in candidates if parse_trees[instance_no].resolve_path(path)],
+                        dtype=np.int64)
+
+
+def main(command, index_path, input_file, output_path, depth, words, max_words, paths):
+    from create_labels import load_parse_trees
+
+    if command == 'build':
+        if input_file is None or output_path is None:
+            raise RuntimeError('Input file and output directory of a previous run are needed to build the index')
+        build_index(load_parse_trees(input_file, output_path), index_path, depth, words, max_words)
+        return
+    index = PathIndex(index_path)
+    # the trees of the run are only loaded for indexes built without trees
+    parse_trees = None
+    if index.trees is None and input_file is not None and output_path is not None:
+        parse_trees = load_parse_trees(input_file, output_path)
+    for path in paths:
+        result = index.query(path, parse_trees)
+        print(path + ':', str(len(result)), 'sentences')
+        print(' '.join(str(instance_no) for instance_no in result))
+
+
+parser = argparse.ArgumentParser(description="Builds and queries an index from root-anchored dependency paths to the "
+                                             "sentences of a previous create_labels.py run containing them.")
+parser.add_argument('command', choices=['build', 'query'])
+parser.add_argument('paths', nargs='*', help="Paths to query in the pattern syntax, e.g. 'root/prep=in/pobj=case/..' "
+                                             "or 'root/!dobj/xcomp'.")
+parser.add_argument('--index', required=True, help="Directory of the index.")
+parser.add_argument('--input-file', '-i', help="Input file of the previous run. Needed to build the index.")
+parser.add_argument('--output-dir', '-o', help="Output directory of the previous run.")
+parser.add_argument('--depth', type=int, default=4, help="Maximum number of steps of an indexed path.")
+parser.add_argument('--words', action='store_true', help="Also index the steps together with their word, so "
+                                                         "'label=word' steps are answered from the index.")
+parser.add_argument('--max-words', type=int, default=2, help="With --words, the most steps of an indexed path that "
+                                                             "carry their word. Every path of d steps has one key per "
+                                                             "choice of up to this many of its steps, instead of 2^d. "
+                                                             "Queries with more word steps are checked on the trees.")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    # the paths may be given before or after the options
+    arguments = parser.parse_intermixed_args()
+    main(arguments.command, arguments.index, arguments.input_file, arguments.output_dir, arguments.depth,
+         arguments.words, arguments.max_words, arguments.paths)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import argparse
+import os
+import pprint
+from typing import Dict, List, Optional, Tuple
+
+# a compiled pattern is a tuple of (entity, path, only_root) entries with the paths normalized:
+# the root step is dropped and filters on the root ('!label' steps directly after it) of ANY path are moved to
+# the front of EVERY path, sorted. The root is unique, so this does not change when a pattern matches.
+CompiledPath = Tuple[str, ...]
+CompiledEntry = Tuple[str, CompiledPath, bool]
+
+
+class CompiledPattern:
+
+    def __init__(self, index: int, pattern: dict):
+        self.index = index
+        self.pattern = pattern
+        self.final = pattern['final']
+        self.root_filters = set()
+        for _, path, _ in pattern['pattern']:
+            for step in path[1:]:
+                if not step.startswith('!'):
+                    break
+                self.root_filters.add(step)
+        self.entries = []
+        for entity, path, only_root in pattern['pattern']:
+            steps = list(path[1:])
+            while steps and steps[0].startswith('!'):
+                steps.pop(0)
+            self.entries.append((entity, tuple(sorted(self.root_filters)) + tuple(steps), only_root))
+        self.paths = set(path for _, path, _ in self.entries)
+
+    def key(self) -> Tuple[Tuple[CompiledEntry, ...], bool]:
+        return tuple(self.entries), self.final
+
+
+def compile_patterns(patterns: List[dict]) -> List[CompiledPattern]:
+    return [CompiledPattern(index, pattern) for index, pattern in enumerate(patterns)]
+
+
+def path_implies(specific: CompiledPath, general: CompiledPath) -> bool:
+    # True if every tree on which 'specific' resolves to at least one node does so for 'general' as well.
+    # The steps of 'specific' are walked while keeping its node set a subset of the node set of 'general':
+    # equal steps keep the relation, 'label=word' is a subset of 'label' and an additional filter in 'specific'
+    # only removes nodes. Any remaining steps of 'specific' can only remove nodes, too.
+    position = 0
+    for step in specific:
+        if position == len(general):
+            return True
+        general_step = general[position]
+        if step == general_step:
+            position += 1
+        elif not general_step.startswith('!') and general_step != '..' and '=' not in general_step \
+                and not step.startswith('!') and step.split('=')[0] == general_step:
+            position += 1
+        elif step.startswith('!'):
+            continue
+        else:
+            return False
+    return position == len(general)
+
+
+def pattern_implies(specific: CompiledPattern, general: CompiledPattern) -> bool:
+    # True if 'general' matches every tree 'specific' matches
+    return all(any(path_implies(path, general_path) for path in specific.paths) for general_path in general.paths)
+
+
+def contradiction(pattern: CompiledPattern) -> Optional[str]:
+    # a child step right after filters on the same nodes that forbid that very child can never match
+    for path in pattern.paths:
+        forbidden = set()
+        for step in path:
+            if step.startswith('!'):
+                forbidden.add(step[1:])
+                continue
+            if step.split('=')[0] in forbidden:
+                return "'" + '/'.join(('root',) + path) + "' requires a dependency it excludes"
+            forbidden = set()
+    return None
+
+
+class PatternReport:
+
+    def __init__(self):
+        # index -> reason
+        self.unreachable: Dict[int, str] = {}
+        # index -> index of the identical, earlier pattern
+        self.duplicates: Dict[int, int] = {}
+        # index -> index of the earlier, final pattern that matches whenever this one does
+        self.shadowed: Dict[int, int] = {}
+        # (pattern index, entry index) -> index of the identical, later entry in the same pattern
+        self.redundant_entries: Dict[Tuple[int, int], int] = {}
+
+    def removed_patterns(self) -> List[int]:
+        return sorted(set(self.unreachable) | set(self.duplicates) | set(self.shadowed))
+
+    def __str__(self):
+        output = ''
+        for index, reason in sorted(self.unreachable.items()):
+            output += 'Pattern ' + str(index) + ' can never match: ' + reason + '\n'
+        for index, original in sorted(self.duplicates.items()):
+            output += 'Pattern ' + str(index) + ' is a duplicate of pattern ' + str(original) + '\n'
+        for index, general in sorted(self.shadowed.items()):
+            output += 'Pattern ' + str(index) + ' is shadowed by the more general pattern ' + str(general) + '\n'
+        for (index, entry), later in sorted(self.redundant_entries.items()):
+            output += 'Entry ' + str(entry) + ' of pattern ' + str(index) + ' is repeated by entry ' + str(later) \
+                      + '\n'
+        output += str(len(self.removed_patterns())) + ' patterns and ' + str(len(self.redundant_entries)) \
+            + ' entries can be removed'
+        return output
+
+
+def analyze_patterns(patterns: List[dict]) -> PatternReport:
+    report = PatternReport()
+    compiled = compile_patterns(patterns)
+    seen = {}
+    live_finals = []
+    for pattern in compiled:
+        reason = contradiction(pattern)
+        if reason is not None:
+            report.unreachable[pattern.index] = reason
+            continue
+        # repeating a non-final pattern can overwrite labels set in between, so only final ones are duplicates
+        if pattern.final and pattern.key() in seen:
+            report.duplicates[pattern.index] = seen[pattern.key()]
+            continue
+        seen[pattern.key()] = pattern.index
+        general = next((general for general in live_finals if pattern_implies(pattern, general)), None)
+        if general is not None:
+            report.shadowed[pattern.index] = general.index
+            continue
+        if pattern.final:
+            live_finals.append(pattern)
+
+        # paths resolve independently of the labels, so an entry that is repeated later in the same pattern only
+        # sets labels which the repetition overwrites again
+        entries = pattern.pattern['pattern']
+        for entry_no, (entity, path, only_root) in enumerate(entries):
+            for later_no in range(entry_no + 1, len(entries)):
+                if entries[later_no][0] == entity and list(entries[later_no][1]) == list(path) \
+                        and entries[later_no][2] == only_root:
+                    report.redundant_entries[(pattern.index, entry_no)] = later_no
+                    break
+    return report
+
+
+def prune_patterns(patterns: List[dict], report: PatternReport) -> List[dict]:
+    removed = set(report.removed_patterns())
+    pruned = []
+    for index, pattern in enumerate(patterns):
+        if index in removed:
+            continue
+        entries = [entry for entry_no, entry in enumerate(pattern['pattern'])
+                   if (index, entry_no) not in report.redundant_entries]
+        pruned.append({'pattern': entries, 'final': pattern['final']})
+    return pruned
+
+
+def confirm_pruning(patterns: List[dict], pruned: List[dict], parse_trees: list) -> List[int]:
+    # returns the indices of all trees which are labelled differently by the two tables
+    from create_labels import label_parse_trees
+
+    label_parse_trees(parse_trees, patterns)
+    expected = [(tree.pattern_applied, tree.get_current_labelling()) for tree in parse_trees]
+    label_parse_trees(parse_trees, pruned)
+    return [instance_no for instance_no, tree in enumerate(parse_trees)
+            if (tree.pattern_applied, tree.get_current_labelling()) != expected[instance_no]]
+
+
+def main(prune_output, input_file, output_path, patterns_file=None):
+    import sys
+    from pattern_store import default_patterns, dump_patterns, load_patterns
+
+    patterns = load_patterns(patterns_file) if patterns_file is not None else default_patterns()
+
+    report = analyze_patterns(patterns)
+    print(report)
+    pruned = prune_patterns(patterns, report)
+
+    if input_file is not None:
+        from create_labels import load_parse_trees
+        if output_path is None:
+            raise RuntimeError('The parser output directory is needed to confirm the analysis on a corpus')
+        parse_trees = load_parse_trees(input_file, output_path)
+        mismatches = confirm_pruning(patterns, pruned, parse_trees)
+        if mismatches:
+            print('The pruned patterns label', str(len(mismatches)), 'of', str(len(parse_trees)),
+                  'sentences differently, e.g. sentence', str(mismatches[0]), file=sys.stderr)
+            raise RuntimeError('Pruned patterns are not equivalent on the given corpus!')
+        print('The pruned patterns label all', str(len(parse_trees)), 'sentences identically')
+
+    if prune_output is not None:
+        if prune_output.endswith('.py'):
+            with open(prune_output, 'w') as file:
+                file.write('patterns = ' + pprint.pformat(pruned, indent=4, width=120) + '\n')
+        else:
+            dump_patterns(pruned, prune_output)
+        print('Wrote', str(len(pruned)), 'patterns to', prune_output)
+
+
+parser = argparse.ArgumentParser(description="Reports patterns that can never match, duplicate patterns, patterns "
+                                             "shadowed by an earlier, more general final pattern and entries that "
+                                             "are repeated within a pattern.")
+parser.add_argument('--prune-output', '-p', help="Write the pattern table without the reported patterns and entries "
+                                                 "to this Python (.py) or pattern file (.json, .yaml or .yml).")
+parser.add_argument('--patterns', help="Pattern file to analyze instead of the built-in patterns.")
+parser.add_argument('--input-file', '-i', help="Input file of a previous create_labels.py run. If given, the pruned "
+                                               "table is confirmed to label this corpus identically.")
+parser.add_argument('--output-dir', '-o', help="Output directory of that run containing the parser output.")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    arguments = parser.parse_args()
+    main(arguments.prune_output, arguments.input_file, arguments.output_dir, arguments.patterns)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Parser import ParseTree
+from match_matrix import UNTOUCHED, pattern_outcome
+
+
+def pattern_key(pattern: dict) -> str:
+    return json.dumps([[entity, list(path), only_root] for entity, path, only_root in pattern['pattern']])
+
+
+class PatternOutcomes:
+    # outcome of one pattern on the sentences it has been evaluated on so far
+
+    def __init__(self, n_sentences: int, n_tokens: int):
+        self.evaluated = np.zeros(n_sentences, dtype=bool)
+        self.matches = np.zeros(n_sentences, dtype=bool)
+        self.codes = np.full(n_tokens, UNTOUCHED, dtype=np.int8)
+
+
+class PatternSession:
+    # keeps the parse trees, the human labels and the outcome of every pattern seen so far in memory. After the
+    # patterns change, only new or edited patterns are evaluated, and only on the sentences whose first match could
+    # have changed: those not labelled by a final pattern in front of the first changed position.
+
+    def __init__(self, parse_trees: List[ParseTree], human_labels: Optional[Dict[int, List[str]]] = None):
+        self.parse_trees = parse_trees
+        self.human_labels = human_labels
+        self.sentence_offsets = np.zeros(len(parse_trees) + 1, dtype=np.int64)
+        self.sentence_offsets[1:] = np.cumsum([len(tree.nodes) for tree in parse_trees])
+        self.token_sentence = np.repeat(np.arange(len(parse_trees)), np.diff(self.sentence_offsets))
+        self.label_names = ['O']
+        self.label_codes = {'O': 0}
+        self.outcomes: Dict[str, PatternOutcomes] = {}
+        self.keys: List[str] = []
+        self.finals: List[bool] = []
+        self.labels = np.zeros(len(self.token_sentence), dtype=np.int8)
+        self.matched = np.full(len(parse_trees), -1, dtype=np.int32)
+        # pattern evaluations of the last update and the sentences they were made on
+        self.evaluations = 0
+        self.evaluated_sentences = np.zeros(len(parse_trees), dtype=bool)
+        self.human = None
+        if human_labels is not None:
+            for instance_no, labelling in human_labels.items():
+                if len(labelling) != len(parse_trees[instance_no].nodes):
+                    raise RuntimeError("Human labeling of ID ", instance_no,
+                                       " doesn't match length of original sentence!")
+            for labelling in human_labels.values():
+                for label in labelling:
+                    self._code(label)
+            self.human = (np.concatenate([np.arange(self.sentence_offsets[instance_no],
+                                                    self.sentence_offsets[instance_no + 1])
+                                          for instance_no in human_labels] + [np.zeros(0, dtype=np.int64)]),
+                          np.repeat(np.arange(len(human_labels)), [len(labels) for labels in human_labels.values()]),
+                          np.array([self.label_codes[label] for labelling in human_labels.values()
+                                    for label in labelling], dtype=np.int64))
+
+    def _code(self, label: str) -> int:
+        if label not in self.label_codes:
+            self.label_codes[label] = len(self.label_names)
+            self.label_names.append(label)
+        return self.label_codes[label]
+
+    def _outcomes(self, key: str, pattern: dict, sentences: np.ndarray) -> PatternOutcomes:
+        if key not in self.outcomes:
+            self.outcomes[key] = PatternOutcomes(len(self.parse_trees), len(self.token_sentence))
+        outcomes = self.outcomes[key]
+        for entity, _, _ in pattern['pattern']:
+            self._code(entity)
+        for instance_no in sentences[~outcomes.evaluated[sentences]]:
+            self.evaluations += 1
+            self.evaluated_sentences[instance_no] = True
+            tree = self.parse_trees[instance_no]
+            sentence_codes = pattern_outcome(tree, pattern, self.label_codes)
+            outcomes.evaluated[instance_no] = True
+            if sentence_codes is not None:
+                outcomes.matches[instance_no] = True
+                start = self.sentence_offsets[instance_no]
+                outcomes.codes[start:start + len(sentence_codes)] = sentence_codes
+        return outcomes
+
+    def update(self, patterns: List[dict]) -> Tuple[int, int, int]:
+        # labels with the new patterns. Returns the number of sentences whose first match could have changed, the
+        # number of them a pattern was actually evaluated on (the others only needed known outcomes) and the number
+        # of pattern evaluations.
+        self.evaluations = 0
+        self.evaluated_sentences = np.zeros(len(self.parse_trees), dtype=bool)
+        keys = [pattern_key(pattern) for pattern in patterns]
+        finals = [bool(pattern['final']) for pattern in patterns]
+        first_change = 0
+        while first_change < min(len(keys), len(self.keys)) and keys[first_change] == self.keys[first_change] \
+                and finals[first_change] == self.finals[first_change]:
+            first_change += 1
+        if first_change == len(keys) == len(self.keys):
+            return 0, 0, 0
+        affected = np.flatnonzero((self.matched == -1) | (self.matched >= first_change))
+
+        labels = np.zeros(len(self.token_sentence), dtype=np.int8)
+        matched = np.full(len(self.parse_trees), -1, dtype=np.int32)
+        active = np.zeros(len(self.parse_trees), dtype=bool)
+        active[affected] = True
+        try:
+            for pattern_no, (key, pattern) in enumerate(zip(keys, patterns)):
+                sentences = np.flatnonzero(active)
+                if len(sentences) == 0:
+                    break
+                outcomes = self._outcomes(key, pattern, sentences)
+                hit = active & outcomes.matches
+                positions = np.flatnonzero(hit[self.token_sentence])
+                write = positions[outcomes.codes[positions] != UNTOUCHED]
+                labels[write] = outcomes.codes[write]
+                if finals[pattern_no]:
+                    matched[hit] = pattern_no
+                    active &= ~hit
+        finally:
+            # the outcomes are kept, the resolved paths are not needed any more
+            for instance_no in np.flatnonzero(self.evaluated_sentences):
+                self.parse_trees[instance_no].release_paths()
+
+        token_affected = np.zeros(len(self.parse_trees), dtype=bool)
+        token_affected[affected] = True
+        token_affected = token_affected[self.token_sentence]
+        self.labels[token_affected] = labels[token_affected]
+        self.matched[affected] = matched[affected]
+        self.keys = keys
+        self.finals = finals
+        return len(affected), int(self.evaluated_sentences.sum()), self.evaluations
+
+    def evaluate(self) -> Tuple[int, Optional[List[list]]]:
+        from evaluation import kappa_rows_from_codes
+
+        rows = None
+        if self.human is not None:
+            positions, sentences, human_codes = self.human
+            rows = kappa_rows_from_codes(human_codes, self.labels[positions], sentences, self.label_names)
+        return int((self.matched != -1).sum()), rows
+
+
+def read_patterns(file_name: str) -> List[dict]:
+    # either a pattern file or a Python file defining 'patterns', like Parser.py
+    if file_name.endswith('.py'):
+        import runpy
+        from pattern_store import compile_patterns
+        return compile_patterns(runpy.run_path(file_name)['patterns'])
+    from pattern_store import load_patterns
+    return load_patterns(file_name)
+
+
+def report(session: PatternSession, previous: Optional[Tuple[int, Optional[List[list]]]],
+           update: Tuple[int, int, int], seconds: float) -> Tuple[int, Optional[List[list]]]:
+    from tabulate import tabulate
+
+    count, rows = session.evaluate()
+    sentences = len(session.parse_trees)
+    line = "Labeled instances: " + str(count / sentences * 100) + "%"
+    if previous is not None:
+        line += " (" + '{:+.3f}'.format((count - previous[0]) / sentences * 100) + ")"
+    print(line)
+    if rows is not None:
+        table = []
+        for row_no, row in enumerate(rows):
+            table_row = list(row)
+            if previous is not None:
+                table_row += [row[1] - previous[1][row_no][1], row[2] - previous[1][row_no][2]]
+            table.append(table_row)
+        headers = ['Labels considered', 'Sentence Average', 'Overall']
+        if previous is not None:
+            headers += ['Sentence Average delta', 'Overall delta']
+        print(tabulate(table, headers, floatfmt='.3f', tablefmt='psql'))
+    affected, evaluated, evaluations = update
+    print("Re-evaluated", str(evaluated), "of", str(sentences), "sentences (" + str(evaluations), "pattern "
+          "evaluations,", str(affected), "sentences affected) in", '{:.3f}'.format(seconds), "s")
+    return count, rows
+
+
+def main(input_file, output_path, human_labeling, patterns_file, interval):
+    from create_labels import load_parse_trees
+
+    gold = None
+    if human_labeling is not None:
+        from gold_labels import GoldLabelStore
+        gold = GoldLabelStore.load(human_labeling)
+    parse_trees = load_parse_trees(input_file, output_path)
+    human_labels = None
+    if gold is not None:
+        gold.validate([len(tree.nodes) for tree in parse_trees], 'parse trees')
+        human_labels = gold.labels()
+    session = PatternSession(parse_trees, human_labels)
+
+    start = time.perf_counter()
+    update = session.update(read_patterns(patterns_file))
+    result = report(session, None, update, time.perf_counter() - start)
+    modified = os.stat(patterns_file).st_mtime_ns
+    print("Watching", patterns_file, "for changes, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(interval)
+            current = os.stat(patterns_file).st_mtime_ns
+            if current == modified:
+                continue
+            modified = current
+            start = time.perf_counter()
+            try:
+                patterns = read_patterns(patterns_file)
+                update = session.update(patterns)
+            except Exception as error:
+                # keep watching, the author is probably in the middle of an edit. The session only takes over the
+                # new patterns once all of them are evaluated.
+                print("Could not apply the patterns:", repr(error))
+                continue
+            print("Number of patterns used:", str(len(patterns)))
+            result = report(session, result, update, time.perf_counter() - start)
+    except KeyboardInterrupt:
+        pass
+
+
+parser = argparse.ArgumentParser(description="Loads the parser output of a previous create_labels.py run once, "
+                                             "watches a pattern definition and reports the change in coverage and "
+                                             "kappa every time it is saved.")
+parser.add_argument('--input-file', '-i', required=True, help="Input file of the previous run.")
+parser.add_argument('--output-dir', '-o', required=True, help="Output directory of the previous run.")
+parser.add_argument('--human_labeling', '-l', help="Human labeling file for the kappa calculation.")
+parser.add_argument('--patterns', default='Parser.py', help="Pattern file or Python file defining 'patterns' to "
+                                                            "watch. Defaults to Parser.py.")
+parser.add_argument('--interval', type=float, default=0.2, help="Seconds between two checks for changes.")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    arguments = parser.parse_args()
+    main(arguments.input_file, arguments.output_dir, arguments.human_labeling, arguments.patterns,
+         arguments.interval)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import argparse
+import os
+import pprint
+from typing import List, Sequence
+
+import numpy as np
+
+from match_matrix import MatchMatrix
+from pattern_routing import root_requirements
+
+# Two patterns that can never match the same tree can be swapped without changing any labelling: on every tree at
+# most one of them matches, so the other one is skipped either way. Any order keeping the relative order of every
+# pair that is not provably disjoint therefore tries the patterns matching a given tree in the original order, and
+# labels it identically. Disjointness is proven at the root, which is unique: one pattern needs a dependency of the
+# root that the other one forbids ('!label' directly after the root).
+
+
+def exclusive(patterns: List[dict]) -> np.ndarray:
+    # patterns x patterns, True where the two patterns provably never match the same tree
+    requirements = [root_requirements(pattern) for pattern in patterns]
+    disjoint = np.zeros((len(patterns), len(patterns)), dtype=bool)
+    for first, (required, forbidden) in enumerate(requirements):
+        for second, (other_required, other_forbidden) in enumerate(requirements):
+            disjoint[first, second] = bool(required & other_forbidden or forbidden & other_required)
+    return disjoint
+
+
+def predecessors(patterns: List[dict]) -> np.ndarray:
+    # patterns x patterns, True where the first pattern has to stay before the second one: directly, as an earlier
+    # pattern that is not disjoint, or through a chain of such patterns
+    disjoint = exclusive(patterns)
+    before = np.zeros_like(disjoint)
+    for pattern_no in range(len(patterns)):
+        for earlier in np.flatnonzero(~disjoint[:pattern_no, pattern_no]):
+            before[:, pattern_no] |= before[:, earlier]
+            before[earlier, pattern_no] = True
+    return before
+
+
+def attempts(matrix: MatchMatrix, order: Sequence[int]) -> np.ndarray:
+    # number of patterns tried on every sentence until a final one matches, or all of them if none does
+    order = np.asarray(order)
+    position = np.full(matrix.n_patterns, len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    stops = matrix.matches & matrix.final[:, None]
+    first = np.where(stops, position[:, None], len(order)).min(axis=0, initial=len(order))
+    return np.minimum(first + 1, len(order))
+
+
+def order_patterns(matrix: MatchMatrix, patterns: List[dict]) -> List[int]:
+    # greedy order by the hits on the corpus of the matrix: next comes the pattern that, together with the patterns
+    # still to be placed before it, stops the most sentences still being matched per pattern. The group is placed
+    # in the original order, ties go to the earlier pattern, so patterns without hits keep their original order.
+    before = predecessors(patterns)
+    # sentences with the same final patterns matching are interchangeable
+    stops, weights = np.unique(matrix.matches[matrix.final].T, axis=0, return_counts=True)
+    finals = np.flatnonzero(matrix.final)
+    open_sentences = np.ones(len(weights), dtype=bool)
+    placed = np.zeros(matrix.n_patterns, dtype=bool)
+    order = []
+    while not placed.all():
+        groups = before & ~placed[:, None]
+        groups[np.arange(matrix.n_patterns), np.arange(matrix.n_patterns)] = True
+        groups[placed] = False
+        stopped = groups[finals].T.astype(np.float32) @ stops[open_sentences].T.astype(np.float32) > 0
+        gain = stopped @ weights[open_sentences] / groups.sum(axis=0).clip(1)
+        gain[placed] = -1
+        chosen = int(np.argmax(gain))
+        group = np.flatnonzero(groups[:, chosen])
+        order.extend(int(pattern_no) for pattern_no in group)
+        placed[group] = True
+        open_sentences &= ~stops[:, np.isin(finals, group)].any(axis=1)
+    return order
+
+
+def verify_order(matrix: MatchMatrix, order: Sequence[int]) -> List[int]:
+    # returns the indices of all sentences which are labelled differently in the original order
+    labels, matched = matrix.resolve()
+    ordered_labels, ordered_matched = matrix.resolve(order)
+    differing = set(np.flatnonzero(matched != ordered_matched))
+    differing |= set(matrix.token_sentence[labels != ordered_labels])
+    return sorted(int(instance_no) for instance_no in differing)
+
+
+def main(input_file, output_path, patterns_file, matrix_file, ordered_output):
+    from pattern_store import default_patterns, dump_patterns, load_patterns
+
+    patterns = load_patterns(patterns_file) if patterns_file is not None else default_patterns()
+    if matrix_file is not None and os.path.isfile(matrix_file):
+        matrix = MatchMatrix.load(matrix_file)
+        if matrix.version != patterns.version:
+            raise RuntimeError('The match matrix was built for other patterns (version ' + str(matrix.version) + ')')
+    else:
+        from create_labels import load_parse_trees
+        if input_file is None or output_path is None:
+            raise RuntimeError('Input file and output directory of a previous run are needed to build the matrix')
+        matrix = MatchMatrix.build(load_parse_trees(input_file, output_path), patterns)
+        if matrix_file is not None:
+            matrix.save(matrix_file)
+
+    order = order_patterns(matrix, patterns)
+    mismatches = verify_order(matrix, order)
+    if mismatches:
+        raise RuntimeError('The new order changes the labelling of ' + str(len(mismatches)) + ' sentences, e.g. '
+                           'sentence ' + str(mismatches[0]))
+    moved = sum(pattern_no != original for original, pattern_no in enumerate(order))
+    print("Number of patterns used:", str(len(patterns)))
+    print("Patterns moved:", str(moved))
+    print("Average patterns tried per sentence:", str(attempts(matrix, range(len(patterns))).mean()), "before,",
+          str(attempts(matrix, order).mean()), "after")
+    print('The new order labels all', str(matrix.n_sentences), 'sentences identically')
+    print("Order:", ','.join(str(pattern_no) for pattern_no in order))
+
+    if ordered_output is not None:
+        ordered = [{'pattern': patterns[pattern_no]['pattern'], 'final': patterns[pattern_no]['final']}
+                   for pattern_no in order]
+        if ordered_output.endswith('.py'):
+            with open(ordered_output, 'w') as file:
+                file.write('patterns = ' + pprint.pformat(ordered, indent=4, width=120) + '\n')
+        else:
+            dump_patterns(ordered, ordered_output)
+        print('Wrote', str(len(ordered)), 'patterns to', ordered_output)
+
+
+parser = argparse.ArgumentParser(description="Reorders the patterns so that the ones matching most sentences of a "
+                                             "previous create_labels.py run are tried first. Only patterns that can "
+                                             "never match the same sentence are swapped, so the labelling of every "
+                                             "sentence stays the same.")
+parser.add_argument('--input-file', '-i', help="Input file of the previous run.")
+parser.add_argument('--output-dir', '-o', help="Output directory of the previous run.")
+parser.add_argument('--patterns', help="Pattern file to reorder instead of the built-in patterns.")
+parser.add_argument('--matrix', '-m', help="Match matrix file (.npz) of match_matrix.py. Loaded if it exists, "
+                                           "otherwise built from the previous run and saved.")
+parser.add_argument('--ordered-output', '-w', help="Write the reordered table to this Python (.py) or pattern file "
+                                                   "(.json, .yaml or .yml).")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    arguments = parser.parse_args()
+    main(arguments.input_file, arguments.output_dir, arguments.patterns, arguments.matrix, arguments.ordered_output)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import argparse
+import os
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+from Parser import ParseTree
+
+
+def root_requirements(pattern: dict) -> Tuple[Set[str], Set[str]]:
+    # dependencies the root must have and must not have for the pattern to match. The root is unique, so this
+    # can be decided from the dependencies of the root alone.
+    required = set()
+    forbidden = set()
+    for _, path, _ in pattern['pattern']:
+        for step in path[1:]:
+            if step.startswith('!'):
+                forbidden.add(step[1:])
+            else:
+                if step != '..':
+                    required.add(step.split('=')[0])
+                break
+    return required, forbidden
+
+
+class PatternRouter:
+    # sends every tree to the patterns that can match given the dependencies of its root. The routed pattern set
+    # keeps the order of the global one and only drops patterns which would fail anyway, so the labelling is
+    # identical to trying every pattern in turn.
+
+    def __init__(self, patterns: List[dict]):
+        self.patterns = patterns
+        self.requirements = [root_requirements(pattern) for pattern in patterns]
+        self.relevant_labels = set()
+        for required, forbidden in self.requirements:
+            self.relevant_labels |= required | forbidden
+        self.routes: Dict[FrozenSet[str], List[Tuple[int, dict]]] = {}
+
+    def signature(self, tree: ParseTree) -> FrozenSet[str]:
+        return frozenset(label for label in tree.root.children if label in self.relevant_labels)
+
+    def route(self, tree: ParseTree) -> List[Tuple[int, dict]]:
+        signature = self.signature(tree)
+        if signature not in self.routes:
+            self.routes[signature] = [(pattern_no, pattern) for pattern_no, (pattern, (required, forbidden))
+                                      in enumerate(zip(self.patterns, self.requirements))
+                                      if required <= signature and not forbidden & signature]
+        return self.routes[signature]
+
+    def apply(self, tree: ParseTree) -> int:
+        # returns the index of the final pattern applied or -1
+        matched = -1
+        for pattern_no, pattern in self.route(tree):
+            success, output = tree.apply_pattern(**pattern)
+            if success:
+                matched = pattern_no
+                break
+        tree.release_paths()
+        return matched
+
+
+def verify_routing(parse_trees: List[ParseTree], patterns: List[dict]) -> List[int]:
+    # returns the indices of all trees which are labelled differently with and without routing
+    from create_labels import label_parse_trees
+
+    label_parse_trees(parse_trees, patterns)
+    expected = [(tree.pattern_applied, tree.get_current_labelling()) for tree in parse_trees]
+    label_parse_trees(parse_trees, patterns, PatternRouter(patterns))
+    return [instance_no for instance_no, tree in enumerate(parse_trees)
+            if (tree.pattern_applied, tree.get_current_labelling()) != expected[instance_no]]
+
+
+def main(input_file, output_path, patterns_file=None):
+    from statistics import mean
+    from create_labels import load_parse_trees
+    from pattern_store import default_patterns, load_patterns
+
+    patterns = load_patterns(patterns_file) if patterns_file is not None else default_patterns()
+    parse_trees = load_parse_trees(input_file, output_path)
+    router = PatternRouter(patterns)
+    routes = [router.route(tree) for tree in parse_trees]
+    print("Number of patterns used:", str(len(patterns)))
+    print("Number of routes:", str(len(router.routes)))
+    print("Average patterns per sentence:", str(mean(len(route) for route in routes)))
+    mismatches = verify_routing(parse_trees, patterns)
+    if mismatches:
+        raise RuntimeError('Routing changes the labelling of ' + str(len(mismatches)) + ' sentences, e.g. sentence '
+                           + str(mismatches[0]))
+    print('Routing labels all', str(len(parse_trees)), 'sentences identically')
+
+
+parser = argparse.ArgumentParser(description="Shows how the patterns are routed for the parser output of a previous "
+                                             "create_labels.py run and verifies that routing does not change the "
+                                             "labelling.")
+parser.add_argument('--input-file', '-i', required=True, help="Input file of the previous run.")
+parser.add_argument('--output-dir', '-o', required=True, help="Output directory of the previous run.")
+parser.add_argument('--patterns', help="Pattern file to use instead of the built-in patterns.")
+
+if __name__ == "__main__":
+    abs_path = os.path.abspath(__file__)
+    dir_name = os.path.dirname(abs_path)
+    os.chdir(dir_name)
+    arguments = parser.parse_args()
+    main(arguments.input_file, arguments.output_dir, arguments.patterns)
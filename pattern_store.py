@@ -0,0 +1,159 @@
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+# bump whenever the compiled form changes, so that stale cache entries are not used
+COMPILED_FORMAT = 2
+CACHE_DIR = '.pattern_cache'
+
+
+class PatternSet(list):
+    # a validated list of patterns in the format of Parser.patterns ({'pattern': [(entity, path, only_root)],
+    # 'final': bool}) which knows the hash of the definition it was compiled from
+    def __init__(self, patterns: List[dict], version: str, source: Optional[str] = None):
+        super().__init__(patterns)
+        self.version = version
+        self.source = source
+
+
+def pattern_version(patterns: List[dict]) -> str:
+    # hash of a canonical serialization, so equal tables get the same version regardless of their source
+    canonical = json.dumps([{'pattern': [[entity, list(path), only_root] for entity, path, only_root in
+                                         pattern['pattern']], 'final': pattern['final']} for pattern in patterns],
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _compile_entry(entry, pattern_no: int) -> tuple:
+    if isinstance(entry, dict):
+        entry = (entry['entity'], entry['path'], entry.get('only_root', False))
+    if len(entry) != 3:
+        raise ValueError('Entry ' + str(entry) + ' of pattern ' + str(pattern_no)
+                         + ' must consist of entity, path and only_root!')
+    entity, path, only_root = entry
+    if not isinstance(entity, str) or not isinstance(only_root, bool):
+        raise ValueError('Entry ' + str(entry) + ' of pattern ' + str(pattern_no)
+                         + ' must have a string entity and a boolean only_root!')
+    if not path or not all(isinstance(step, str) for step in path):
+        raise ValueError('Path of pattern ' + str(pattern_no) + ' must be a non-empty list of strings!')
+    if path[0].split('=')[0] != 'root':
+        raise ValueError('Pattern must start from the root! Your pattern starts with ' + path[0])
+    return entity, list(path), only_root
+
+
+def compile_patterns(patterns: List[dict], version: Optional[str] = None,
+                     source: Optional[str] = None) -> PatternSet:
+    compiled = []
+    for pattern_no, pattern in enumerate(patterns):
+        if 'pattern' not in pattern:
+            raise ValueError('Pattern ' + str(pattern_no) + " has no 'pattern' entry!")
+        compiled.append({'pattern': [_compile_entry(entry, pattern_no) for entry in pattern['pattern']],
+                         'final': bool(pattern.get('final', False))})
+    if version is None:
+        version = pattern_version(compiled)
+    return PatternSet(compiled, version, source)
+
+
+def _parse(content: bytes, file_name: str):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.json':
+        return json.loads(content.decode('utf-8'))
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError('Loading patterns from YAML requires PyYAML to be installed!')
+        return yaml.safe_load(content.decode('utf-8'))
+    if extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError('Loading patterns from TOML requires Python 3.11 or tomli to be installed!')
+        return tomllib.loads(content.decode('utf-8'))
+    raise RuntimeError('Unsupported format! Please provide the patterns as .json, .yaml, .yml or .toml!')
+
+
+def load_patterns(file_name: str, cache_dir: Optional[str] = None) -> PatternSet:
+    # the file may either contain the list of patterns or a mapping with a 'patterns' key
+    if not os.path.isfile(file_name):
+        raise RuntimeError("Pattern file path either doesn't exist or is not a file.")
+    with open(file_name, 'rb') as file:
+        content = file.read()
+    file_hash = hashlib.sha256(content).hexdigest()
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_name)), CACHE_DIR)
+    # the cache holds plain JSON rather than a pickle, so a planted cache file can at worst yield wrong patterns
+    cache_file = os.path.join(cache_dir, file_hash + '.' + str(COMPILED_FORMAT) + '.json')
+    if os.path.isfile(cache_file):
+        with open(cache_file) as file:
+            cached = json.load(file)
+        return PatternSet([{'pattern': [(entity, path, only_root) for entity, path, only_root in pattern['pattern']],
+                            'final': pattern['final']} for pattern in cached['patterns']],
+                          cached['version'], file_name)
+
+    definition = _parse(content, file_name)
+    if isinstance(definition, dict):
+        definition = definition.get('patterns')
+    if not isinstance(definition, list):
+        raise RuntimeError("Pattern file must contain a list of patterns or a mapping with a 'patterns' list!")
+    compiled = compile_patterns(definition, source=file_name)
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    # write to a temporary file first, so concurrent runs never read a partially written cache entry
+    temporary_file = cache_file + '.' + str(os.getpid())
+    with open(temporary_file, 'w') as file:
+        json.dump({'version': compiled.version, 'patterns': [{'pattern': [[entity, path, only_root] for entity, path,
+                                                                           only_root in pattern['pattern']],
+                                                              'final': pattern['final']} for pattern in compiled]},
+                  file)
+    os.replace(temporary_file, cache_file)
+    return compiled
+
+
+def dump_patterns(patterns: List[dict], file_name: str):
+    definition = {'patterns': [{'final': pattern['final'],
+                                'pattern': [{'entity': entity, 'path': list(path), 'only_root': only_root}
+                                            for entity, path, only_root in pattern['pattern']]}
+                               for pattern in patterns]}
+    # the format and its library are checked before the file is opened, so a failure leaves existing files alone
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.json':
+        def dump(file):
+            json.dump(definition, file, indent=2)
+    elif extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError('Writing patterns as YAML requires PyYAML to be installed!')
+
+        def dump(file):
+            yaml.safe_dump(definition, file, sort_keys=False)
+    else:
+        raise RuntimeError('Unsupported format! Patterns can be written as .json, .yaml or .yml!')
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(file_name, 'w') as file:
+        dump(file)
+
+
+def default_patterns() -> PatternSet:
+    from Parser import patterns
+    return compile_patterns(patterns)
+
+
+parser = argparse.ArgumentParser(description="Writes the built-in pattern table (Parser.patterns) to a pattern file "
+                                             "that can be edited and passed to create_labels.py with --patterns.")
+parser.add_argument('output_file', help="Path of the pattern file to write. Must end with .json, .yaml or .yml.")
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    dump_patterns(default_patterns(), arguments.output_file)
@@ -0,0 +1,179 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import zlib
+
+import numpy as np
+
+SHARD_FILE = 'shard.json'
+LABELS_FILE = 'labels.csv'
+
+
+def parse_shard(shard):
+    # 'i/N' with 0 <= i < N
+    try:
+        shard_no, shards = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise ValueError('Shard must be given as i/N, e.g. 0/4, not ' + shard)
+    if shards < 1:
+        raise ValueError('Number of shards must be at least 1, not ' + str(shards))
+    if not 0 <= shard_no < shards:
+        raise ValueError('Shard number must be between 0 and ' + str(shards - 1))
+    return shard_no, shards
+
+
+def shard_path(output_path, shard_no, shards):
+    return output_path + 'shard_' + str(shard_no) + '_of_' + str(shards) + '/'
+
+
+def select_lines(input_file, shard_no, shards, mode='hash'):
+    # the line numbers and lines of the input file belonging to the shard. 'hash' assigns every line by the CRC32 of its
+    # text, so identical lines end up in the same shard; 'range' assigns contiguous blocks of lines.
+    with open(input_file) as file:
+        lines = [line if line.endswith('\n') else line + '\n' for line in file]
+    if mode == 'range':
+        start = shard_no * len(lines) // shards
+        end = (shard_no + 1) * len(lines) // shards
+        return list(range(start, end)), lines[start:end], len(lines)
+    if mode != 'hash':
+        raise ValueError('Unknown shard mode ' + mode)
+    line_numbers = [line_no for line_no, line in enumerate(lines) if zlib.crc32(line.encode()) % shards == shard_no]
+    return line_numbers, [lines[line_no] for line_no in line_numbers], len(lines)
+
+
+def run_shard(input_file, output_path, shard, mode, patterns, run_parser, router=None, match_cache=None,
+              vectorized=False, skip_parser=False, threads=1):
+    # parses and labels one shard of the input file. The shard directory holds the labels of all its sentences by
+    # input line and, written last, a description of the shard for merge_shards.
+    from Parser import ParseTree
+    from checkpointing import file_hash
+    from create_labels import label_parse_trees, read_dependency_heads, read_dependency_labels, read_requirements
+
+    shard_no, shards = parse_shard(shard)
+    path = shard_path(output_path, shard_no, shards)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    if os.path.isfile(path + SHARD_FILE):
+        os.remove(path + SHARD_FILE)
+    line_numbers, lines, n_lines = select_lines(input_file, shard_no, shards, mode)
+    with open(path + 'input.txt', 'w') as file:
+        file.writelines(lines)
+    if not skip_parser:
+        run_parser(path + 'input.txt', path)
+
+    parse_trees = []
+    tree_lines = []
+    unparsed = []
+    for line_no, dep_head, dep_label, text in zip(line_numbers,
+                                                  read_dependency_heads(path + 'output_syndephead_0.txt'),
+                                                  read_dependency_labels(path + 'output_syndeplabel_0.txt'),
+                                                  read_requirements(path + 'input.txt')):
+        try:
+            parse_trees.append(ParseTree(dep_head, dep_label, text))
+            tree_lines.append(line_no)
+        except IndexError:
+            print(str(dep_head) + "\n" + str(dep_label) + "\n" + str(text), file=sys.stderr)
+            unparsed.append(line_no)
+    count, matched_patterns = label_parse_trees(parse_trees, patterns, router, match_cache, vectorized, threads)
+
+    with open(path + LABELS_FILE, 'w') as file:
+        file.write('ID,applied,pattern,labeling\n')
+        for line_no, tree, pattern_no in zip(tree_lines, parse_trees, matched_patterns):
+            file.write(str(line_no) + ', ' + str(int(tree.pattern_applied)) + ', ' + str(pattern_no) + ', '
+                       + ' '.join(tree.get_current_labelling()) + '\n')
+    description = {'shard': shard_no, 'shards': shards, 'mode': mode, 'input_file': os.path.abspath(input_file),
+                   'input_hash': file_hash(input_file), 'input_lines': n_lines, 'lines': len(line_numbers),
+                   'sentences': len(parse_trees), 'labelled': count, 'unparsed_lines': unparsed,
+                   'pattern_version': getattr(patterns, 'version', None), 'patterns': len(patterns)}
+    with open(path + SHARD_FILE + '.tmp', 'w') as file:
+        json.dump(description, file, indent=1)
+    os.replace(path + SHARD_FILE + '.tmp', path + SHARD_FILE)
+    print("Shard", str(shard_no), "of", str(shards) + ":", str(len(line_numbers)), "lines,", str(count),
+          "sentences labelled")
+    return description
+
+
+def read_shards(output_path):
+    # descriptions and labels of all shards in the output directory; all shards of the run have to be finished
+    descriptions = []
+    for description_file in sorted(glob.glob(output_path + 'shard_*_of_*/' + SHARD_FILE)):
+        with open(description_file) as file:
+            descriptions.append((os.path.dirname(description_file) + '/', json.load(file)))
+    if not descriptions:
+        raise RuntimeError('No finished shards found in ' + output_path)
+    first = descriptions[0][1]
+    for _, description in descriptions:
+        for key in ('shards', 'mode', 'input_hash', 'pattern_version'):
+            if description[key] != first[key]:
+                raise RuntimeError('Shards differ in ' + key + ': ' + str(description[key]) + ' and '
+                                   + str(first[key]))
+    missing = set(range(first['shards'])) - {description['shard'] for _, description in descriptions}
+    if missing:
+        raise RuntimeError('Shards ' + ', '.join(str(shard_no) for shard_no in sorted(missing)) + ' of '
+                           + str(first['shards']) + ' are not finished')
+    automated = {}
+    applied = set()
+    for path, _ in descriptions:
+        with open(path + LABELS_FILE) as file:
+            next(file)
+            for line in file:
+                line_no, was_applied, _, labelling = line.rstrip('\n').split(', ', 3)
+                automated[int(line_no)] = labelling.split()
+                if was_applied == '1':
+                    applied.add(int(line_no))
+    return [description for _, description in descriptions], automated, applied
+
+
+def merge_shards(output_path, human_labeling=None, labels_file='automated_labels.csv'):
+    # combines the shards into one labels file (by input line) and reports the statistics of the whole run
+    if not output_path.endswith('/'):
+        output_path += '/'
+    gold = None
+    if human_labeling is not None:
+        # fail on a broken human labeling before the shards are read
+        from gold_labels import GoldLabelStore
+        gold = GoldLabelStore.load(human_labeling)
+    descriptions, automated, applied = read_shards(output_path)
+    sentences = sum(description['sentences'] for description in descriptions)
+    print("Number of shards:", str(len(descriptions)))
+    print("Number of patterns used:", str(descriptions[0]['patterns']))
+    print("Pattern version:", descriptions[0]['pattern_version'])
+    print("Labeled instances: " + str(len(applied) / sentences * 100) + "%")
+    print("No fitting labeling was found for", str(sentences - len(applied)), "sentences")
+
+    from label_writer import LabelWriter
+    with LabelWriter(output_path + labels_file) as writer:
+        line_numbers = sorted(applied)
+        writer.write_rows(line_numbers, (automated[line_no] for line_no in line_numbers))
+
+    if gold is not None:
+        from evaluation import fast_kappa_rows, kappa_table
+        # number of tokens of every input line, -1 for the lines the parser output gave no tree for
+        token_counts = np.full(descriptions[0]['input_lines'], -1, dtype=np.int64)
+        for line_no, labelling in automated.items():
+            token_counts[line_no] = len(labelling)
+        inside = (gold.ids >= 0) & (gold.ids < len(token_counts))
+        missing = inside & (token_counts[np.where(inside, gold.ids, 0)] == -1)
+        if missing.any():
+            print('Human labelled lines without a parse tree are left out of the kappa:',
+                  ', '.join(str(line_no) for line_no in gold.ids[missing]), file=sys.stderr)
+            gold = gold.subset(~missing)
+        gold.validate(token_counts, 'parsed input lines')
+        print(kappa_table(fast_kappa_rows(gold.labels(), automated)))
+
+
+parser = argparse.ArgumentParser(description="Merges the shards of a create_labels.py --shard run into one "
+                                             "automated_labels.csv and reports the statistics and kappa of the whole "
+                                             "run.")
+parser.add_argument('--output-dir', '-o', required=True, help="Output directory shared by all shards.")
+parser.add_argument('--human_labeling', '-l', help="Human labeling file for the kappa calculation.")
+parser.add_argument('--labels-file', default='automated_labels.csv', help="Name of the merged labels file in the "
+                                                                           "output directory. Compressed with gzip if "
+                                                                           "it ends with .gz and with zstd if it ends "
+                                                                           "with .zst.")
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    merge_shards(arguments.output_dir, arguments.human_labeling, arguments.labels_file)
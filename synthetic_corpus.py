@@ -0,0 +1,270 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+from bisect import bisect
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+# a small hand-written profile of requirement sentences ("The system shall provide a report of the data."). For every
+# parent label: the probability of having 0, 1, 2, ... children of each child label.
+DEFAULT_PROFILE = {
+    'children': {
+        'root': {'nsubj': [0.2, 0.8], 'nsubjpass': [0.85, 0.15], 'aux': [0.1, 0.9], 'auxpass': [0.85, 0.15],
+                 'dobj': [0.45, 0.55], 'prep': [0.45, 0.4, 0.15], 'xcomp': [0.85, 0.15], 'ccomp': [0.95, 0.05],
+                 'advcl': [0.85, 0.15], 'advmod': [0.9, 0.1], 'neg': [0.96, 0.04], 'cop': [0.9, 0.1],
+                 'acomp': [0.92, 0.08], 'conj': [0.88, 0.12], 'cc': [0.88, 0.12], 'punct': [0.1, 0.9]},
+        'nsubj': {'det': [0.3, 0.7], 'amod': [0.8, 0.2], 'nn': [0.7, 0.3], 'prep': [0.92, 0.08],
+                  'rcmod': [0.96, 0.04]},
+        'nsubjpass': {'det': [0.3, 0.7], 'amod': [0.8, 0.2], 'nn': [0.7, 0.3], 'prep': [0.9, 0.1]},
+        'dobj': {'det': [0.4, 0.6], 'amod': [0.7, 0.3], 'nn': [0.7, 0.3], 'prep': [0.6, 0.4],
+                 'rcmod': [0.93, 0.07], 'infmod': [0.95, 0.05], 'partmod': [0.95, 0.05], 'conj': [0.9, 0.1],
+                 'cc': [0.9, 0.1]},
+        'pobj': {'det': [0.45, 0.55], 'amod': [0.75, 0.25], 'nn': [0.7, 0.3], 'prep': [0.75, 0.25],
+                 'rcmod': [0.96, 0.04], 'conj': [0.92, 0.08], 'cc': [0.92, 0.08]},
+        'prep': {'pobj': [0.05, 0.95], 'pcomp': [0.95, 0.05]},
+        'pcomp': {'dobj': [0.5, 0.5], 'prep': [0.7, 0.3]},
+        'xcomp': {'aux': [0.2, 0.8], 'dobj': [0.4, 0.6], 'prep': [0.6, 0.3, 0.1], 'advmod': [0.95, 0.05]},
+        'ccomp': {'mark': [0.4, 0.6], 'nsubj': [0.2, 0.8], 'aux': [0.4, 0.6], 'dobj': [0.5, 0.5],
+                  'prep': [0.6, 0.4]},
+        'advcl': {'mark': [0.2, 0.8], 'nsubj': [0.3, 0.7], 'nsubjpass': [0.85, 0.15], 'aux': [0.5, 0.5],
+                  'auxpass': [0.85, 0.15], 'dobj': [0.5, 0.5], 'prep': [0.6, 0.4]},
+        'rcmod': {'nsubj': [0.3, 0.7], 'aux': [0.5, 0.5], 'dobj': [0.5, 0.5], 'prep': [0.7, 0.3]},
+        'infmod': {'aux': [0.1, 0.9], 'dobj': [0.4, 0.6], 'prep': [0.7, 0.3]},
+        'partmod': {'dobj': [0.6, 0.4], 'prep': [0.4, 0.6]},
+        'conj': {'dobj': [0.6, 0.4], 'prep': [0.7, 0.3], 'amod': [0.85, 0.15], 'det': [0.8, 0.2]},
+        'acomp': {'prep': [0.5, 0.5], 'xcomp': [0.8, 0.2]},
+    },
+    # probability of a label being placed in front of its head
+    'left': {'nsubj': 1.0, 'nsubjpass': 1.0, 'aux': 1.0, 'auxpass': 1.0, 'det': 1.0, 'amod': 1.0, 'nn': 1.0,
+             'neg': 1.0, 'mark': 1.0, 'cop': 1.0, 'advmod': 0.5, 'advcl': 0.3, 'cc': 0.0},
+    'words': {
+        'root': {'provide': 5, 'allow': 5, 'display': 4, 'store': 3, 'support': 4, 'be': 2, 'capable': 2,
+                 'able': 2, 'generate': 3, 'send': 2, 'notify': 2, 'ensure': 2, 'use': 2},
+        'nsubj': {'system': 10, 'user': 4, 'application': 3, 'administrator': 2, 'it': 2, 'product': 2},
+        'nsubjpass': {'data': 3, 'report': 2, 'password': 2, 'access': 2, 'system': 2},
+        'aux': {'shall': 10, 'should': 4, 'must': 3, 'will': 2, 'to': 4},
+        'auxpass': {'be': 5},
+        'cop': {'be': 5},
+        'neg': {'not': 5},
+        'det': {'the': 10, 'a': 4, 'all': 2, 'each': 2, 'any': 1},
+        'amod': {'new': 2, 'current': 2, 'available': 2, 'secure': 1, 'multiple': 1, 'same': 1},
+        'nn': {'user': 3, 'data': 3, 'system': 2, 'status': 2, 'error': 2, 'access': 1},
+        'dobj': {'report': 3, 'data': 3, 'capability': 2, 'access': 2, 'list': 2, 'message': 2, 'information': 2},
+        'pobj': {'user': 3, 'data': 3, 'system': 3, 'case': 2, 'time': 2, 'database': 2, 'request': 2, 'screen': 2},
+        'prep': {'of': 8, 'to': 5, 'in': 4, 'with': 3, 'for': 3, 'during': 1, 'as': 1, 'upon': 1, 'onto': 1,
+                 'on': 2, 'into': 1, 'by': 2, 'before': 1, 'at': 1, 'across': 1},
+        'pcomp': {'using': 2, 'making': 1},
+        'mark': {'if': 4, 'when': 3, 'that': 3, 'while': 1},
+        'advmod': {'prior': 1, 'automatically': 2, 'only': 2, 'also': 2, 'when': 1},
+        'acomp': {'capable': 2, 'able': 2, 'available': 1},
+        'cc': {'and': 5, 'or': 3},
+        'punct': {'.': 10},
+    },
+    'default_words': {'item': 1, 'value': 1, 'record': 1, 'process': 1},
+}
+
+
+def _cumulative(weights) -> List[float]:
+    # normalized cumulative weights; the last one is exactly 1, so bisect with a random number in [0, 1) always
+    # returns a valid index
+    cumulative = list(accumulate(weights))
+    cumulative = [weight / cumulative[-1] for weight in cumulative]
+    cumulative[-1] = 1.0
+    return cumulative
+
+
+class CorpusModel:
+    # samples dependency trees from a profile: every node draws its number of children per child label from the
+    # distribution of its own label, and the children are placed left or right of their head.
+
+    def __init__(self, profile: dict, max_depth: int = 12, chain: float = 0.0, tail_alpha: float = 0.0,
+                 tail_probability: float = 0.0):
+        self.max_depth = max_depth
+        # probability of every pobj starting another prep/pobj step, on top of the profile
+        self.chain = chain
+        # share of sentences with extra coordinated clauses, their number is Pareto distributed with tail_alpha
+        self.tail_alpha = tail_alpha
+        self.tail_probability = tail_probability
+        self.children = {parent: [(child, _cumulative(counts)) for child, counts in sorted(children.items())]
+                         for parent, children in profile['children'].items()}
+        self.left = profile['left']
+        self.words = {label: (list(words), _cumulative(words.values())) for label, words in profile['words'].items()}
+        self.default_words = (list(profile['default_words']), _cumulative(profile['default_words'].values()))
+
+    def _word(self, rng: random.Random, label: str) -> str:
+        words, cumulative = self.words.get(label, self.default_words)
+        return words[bisect(cumulative, rng.random())]
+
+    def _children(self, rng: random.Random, label: str, depth: int) -> List[str]:
+        children = []
+        if depth >= self.max_depth:
+            return children
+        random = rng.random
+        for child, cumulative in self.children.get(label, ()):
+            count = bisect(cumulative, random())
+            if count:
+                children.extend([child] * count)
+        if label == 'pobj' and self.chain and rng.random() < self.chain:
+            children.append('prep')
+        return children
+
+    def sentence(self, rng: random.Random) -> Tuple[List[int], List[str], List[str]]:
+        # heads (1-based, 0 for the root), labels and tokens of one sentence
+        # node: [label, word, depth (later its position), head, left children, right children]
+        root = ['root', self._word(rng, 'root'), 0, None, [], []]
+        labels = self._children(rng, 'root', 0)
+        if self.tail_probability and rng.random() < self.tail_probability:
+            labels += ['conj'] * int(rng.paretovariate(self.tail_alpha))
+        stack = [(root, labels)]
+        while stack:
+            node, labels = stack.pop()
+            for label in labels:
+                child = [label, self._word(rng, label), node[2] + 1, node, [], []]
+                node[4 if rng.random() < self.left.get(label, 0.0) else 5].append(child)
+                stack.append((child, self._children(rng, label, child[2])))
+
+        # in order: left children, the node, right children. The depth is bounded by max_depth.
+        order = []
+
+        def place(node):
+            for child in node[4]:
+                place(child)
+            node[2] = len(order)
+            order.append(node)
+            for child in node[5]:
+                place(child)
+        place(root)
+        heads = [0 if node[3] is None else node[3][2] + 1 for node in order]
+        return heads, [node[0] for node in order], [node[1] for node in order]
+
+
+def fit_profile(parse_trees: list, max_words: int = 200) -> dict:
+    # estimates the child count distributions, the placement and the words of every label from real parses
+    child_counts: Dict[str, Dict[str, Dict[int, int]]] = {}
+    parents: Dict[str, int] = {}
+    left: Dict[str, List[int]] = {}
+    words: Dict[str, Dict[str, int]] = {}
+    for tree in parse_trees:
+        for node in tree.nodes:
+            parents[node.label] = parents.get(node.label, 0) + 1
+            for label, children in node.children.items():
+                counts = child_counts.setdefault(node.label, {}).setdefault(label, {})
+                counts[len(children)] = counts.get(len(children), 0) + 1
+                for child in children:
+                    placement = left.setdefault(label, [0, 0])
+                    placement[0] += child.index < node.index
+                    placement[1] += 1
+            label_words = words.setdefault(node.label, {})
+            label_words[node.word.lower()] = label_words.get(node.word.lower(), 0) + 1
+
+    children = {}
+    for parent, labels in child_counts.items():
+        children[parent] = {}
+        for label, counts in labels.items():
+            distribution = [0] * (max(counts) + 1)
+            for count, frequency in counts.items():
+                distribution[count] = frequency
+            # nodes of this label without such a child
+            distribution[0] = parents[parent] - sum(distribution[1:])
+            children[parent][label] = [frequency / parents[parent] for frequency in distribution]
+    return {
+        'children': children,
+        'left': {label: placement[0] / placement[1] for label, placement in left.items()},
+        'words': {label: dict(sorted(label_words.items(), key=lambda item: -item[1])[:max_words])
+                  for label, label_words in words.items()},
+        'default_words': DEFAULT_PROFILE['default_words'],
+    }
+
+
+def _generate_chunk(arguments: tuple) -> Tuple[List[str], List[str], List[str]]:
+    profile, model_arguments, seed, count = arguments
+    model = CorpusModel(profile, *model_arguments)
+    rng = random.Random(seed)
+    heads, labels, tokens = [], [], []
+    for _ in range(count):
+        sentence_heads, sentence_labels, sentence_tokens = model.sentence(rng)
+        heads.append(str(sentence_heads) + '\n')
+        labels.append(str(sentence_labels) + '\n')
+        tokens.append(' '.join(sentence_tokens) + '\n')
+    return heads, labels, tokens
+
+
+def generate_corpus(output_path: str, sentences: int, profile: Optional[dict] = None, seed: int = 0,
+                    max_depth: int = 12, chain: float = 0.0, tail_alpha: float = 1.5, tail_probability: float = 0.0,
+                    workers: int = 1, chunk_size: int = 20000):
+    # writes 'input.txt' and the two parser output files create_labels.py reads to the output directory. The
+    # sentences are generated in chunks with their own seed, so the corpus does not depend on the number of workers.
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    if not output_path.endswith('/'):
+        output_path += '/'
+    model_arguments = (max_depth, chain, tail_alpha, tail_probability)
+    chunks = [(profile, model_arguments, seed * 1000003 + chunk_no, min(chunk_size, sentences - start))
+              for chunk_no, start in enumerate(range(0, sentences, chunk_size))]
+    with open(output_path + 'input.txt', 'w') as input_file, \
+            open(output_path + 'output_syndephead_0.txt', 'w') as heads_file, \
+            open(output_path + 'output_syndeplabel_0.txt', 'w') as labels_file:
+        if workers > 1:
+            from multiprocessing import Pool
+            with Pool(workers) as pool:
+                for heads, labels, tokens in pool.imap(_generate_chunk, chunks):
+                    heads_file.writelines(heads)
+                    labels_file.writelines(labels)
+                    input_file.writelines(tokens)
+        else:
+            for chunk in chunks:
+                heads, labels, tokens = _generate_chunk(chunk)
+                heads_file.writelines(heads)
+                labels_file.writelines(labels)
+                input_file.writelines(tokens)
+
+
+def main(output_path, sentences, seed, profile_file, fit_input, fit_output, save_profile, max_depth, chain,
+         tail_alpha, tail_probability, workers):
+    profile = None
+    if fit_input is not None:
+        from create_labels import load_parse_trees
+        profile = fit_profile(load_parse_trees(fit_input, fit_output))
+    elif profile_file is not None:
+        with open(profile_file) as file:
+            profile = json.load(file)
+    if save_profile is not None:
+        with open(save_profile, 'w') as file:
+            json.dump(profile or DEFAULT_PROFILE, file, indent=1)
+    if sentences > 0:
+        generate_corpus(output_path, sentences, profile, seed, max_depth, chain, tail_alpha, tail_probability,
+                        workers)
+
+
+parser = argparse.ArgumentParser(description="Generates a synthetic corpus of dependency parses in the format of the "
+                                             "LAL-Parser output, to be labelled with create_labels.py --skip-parser.")
+parser.add_argument('--output-dir', '-o', required=True, help="Directory to write input.txt and the parser output to.")
+parser.add_argument('--sentences', '-n', type=int, default=100000, help="Number of sentences.")
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--profile', help="Profile (.json) of the label distributions to sample from. Defaults to a small "
+                                      "built-in profile of requirement sentences.")
+parser.add_argument('--fit-input', help="Input file of a previous create_labels.py run to fit the profile to.")
+parser.add_argument('--fit-output', help="Output directory of that run.")
+parser.add_argument('--save-profile', help="Write the profile used to this file, e.g. to adjust a fitted profile.")
+parser.add_argument('--max-depth', type=int, default=12, help="Maximum depth of the trees.")
+parser.add_argument('--chain', type=float, default=0.0, help="Probability of every pobj having another prep/pobj "
+                                                             "below it, on top of the profile, for deep chains.")
+parser.add_argument('--tail', type=float, default=0.0, help="Share of sentences with additional coordinated "
+                                                            "clauses, for a long tail of sentence lengths.")
+parser.add_argument('--tail-alpha', type=float, default=1.5, help="Pareto shape of the number of additional "
+                                                                  "clauses. Smaller values give longer sentences.")
+parser.add_argument('--workers', type=int, default=1, help="Number of processes generating sentences.")
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    if (arguments.fit_input is None) != (arguments.fit_output is None):
+        parser.error('--fit-input and --fit-output have to be given together')
+    if arguments.fit_input is not None and arguments.profile is not None:
+        parser.error('--profile cannot be used with a profile fitted by --fit-input')
+    main(arguments.output_dir, arguments.sentences, arguments.seed, arguments.profile, arguments.fit_input,
+         arguments.fit_output, arguments.save_profile, arguments.max_depth, arguments.chain, arguments.tail_alpha,
+         arguments.tail, arguments.workers)
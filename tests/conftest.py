@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# the modules live in the repository root, next to create_labels.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def tokenizer_available():
+    # read_requirements tokenizes with nltk, which needs the punkt data to be downloaded
+    import nltk
+    try:
+        nltk.word_tokenize('The system shall log events.')
+    except LookupError:
+        return False
+    return True
+
+
+@pytest.fixture
+def tokenizer():
+    if not tokenizer_available():
+        pytest.skip("nltk's punkt tokenizer data is not installed")
@@ -0,0 +1,89 @@
+import pytest
+
+from checkpointing import CheckpointedRun
+from create_labels import build_parse_trees, label_parse_trees, read_dependency_heads, read_dependency_labels, \
+    read_requirements
+from pattern_store import compile_patterns, default_patterns
+from synthetic_corpus import generate_corpus
+
+SENTENCES = 700
+CHUNK_LINES = 150
+
+
+class FakeParser:
+    # writes the parser output of the synthetic corpus for the lines of a chunk, and fails on the given call to
+    # interrupt the run
+    def __init__(self, corpus_path, fail_at=-1):
+        with open(corpus_path + 'input.txt') as file:
+            self.lines = file.read().splitlines()
+        with open(corpus_path + 'output_syndephead_0.txt') as file:
+            self.heads = file.read().splitlines()
+        with open(corpus_path + 'output_syndeplabel_0.txt') as file:
+            self.labels = file.read().splitlines()
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def __call__(self, input_file, output_path):
+        if self.calls == self.fail_at:
+            raise KeyboardInterrupt
+        self.calls += 1
+        with open(input_file) as file:
+            lines = file.read().splitlines()
+        start = next(line_no for line_no in range(len(self.lines))
+                     if self.lines[line_no:line_no + len(lines)] == lines)
+        with open(output_path + 'output_syndephead_0.txt', 'w') as file:
+            file.writelines(line + '\n' for line in self.heads[start:start + len(lines)])
+        with open(output_path + 'output_syndeplabel_0.txt', 'w') as file:
+            file.writelines(line + '\n' for line in self.labels[start:start + len(lines)])
+
+
+@pytest.fixture(scope='module')
+def corpus_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('corpus')) + '/'
+    generate_corpus(path, SENTENCES, seed=2, chain=0.3)
+    return path
+
+
+def finish(checkpointed_run, input_file, output_path):
+    # what create_labels.main does after the chunks are parsed
+    checkpointed_run.merge_parser_outputs()
+    parse_trees = build_parse_trees(read_dependency_heads(output_path + 'output_syndephead_0.txt'),
+                                    read_dependency_labels(output_path + 'output_syndeplabel_0.txt'),
+                                    read_requirements(input_file))
+    count, matched_patterns = checkpointed_run.apply_labels(parse_trees)
+    return count, matched_patterns, [tree.get_current_labelling() for tree in parse_trees]
+
+
+def test_resumed_run_labels_like_a_single_run(tokenizer, corpus_path, tmp_path):
+    patterns = default_patterns()
+    input_file = corpus_path + 'input.txt'
+    parse_trees = build_parse_trees(read_dependency_heads(corpus_path + 'output_syndephead_0.txt'),
+                                    read_dependency_labels(corpus_path + 'output_syndeplabel_0.txt'),
+                                    read_requirements(input_file))
+    count, matched_patterns = label_parse_trees(parse_trees, patterns)
+    assert count > 0
+    expected = count, matched_patterns, [tree.get_current_labelling() for tree in parse_trees]
+
+    output_path = str(tmp_path) + '/'
+    with pytest.raises(KeyboardInterrupt):
+        CheckpointedRun(input_file, output_path, CHUNK_LINES, patterns).run(FakeParser(corpus_path, fail_at=2))
+    # a resumed run only parses the chunks that were not committed
+    parser = FakeParser(corpus_path)
+    checkpointed_run = CheckpointedRun(input_file, output_path, CHUNK_LINES, patterns, resume=True)
+    assert checkpointed_run.state['committed_chunks'] == 2
+    checkpointed_run.run(parser)
+    assert parser.calls == -(-SENTENCES // CHUNK_LINES) - 2
+    assert len(checkpointed_run.state['parser_runs']) == -(-SENTENCES // CHUNK_LINES)
+    assert finish(checkpointed_run, input_file, output_path) == expected
+
+
+def test_resume_rejects_other_patterns(tokenizer, corpus_path, tmp_path):
+    patterns = default_patterns()
+    input_file = corpus_path + 'input.txt'
+    output_path = str(tmp_path) + '/'
+    with pytest.raises(KeyboardInterrupt):
+        CheckpointedRun(input_file, output_path, CHUNK_LINES, patterns).run(FakeParser(corpus_path, fail_at=1))
+    with pytest.raises(RuntimeError):
+        CheckpointedRun(input_file, output_path, CHUNK_LINES, compile_patterns(patterns[1:]), resume=True)
+    with pytest.raises(RuntimeError):
+        CheckpointedRun(input_file, output_path, CHUNK_LINES + 1, patterns, resume=True)
@@ -0,0 +1,56 @@
+import random
+
+import numpy as np
+import pytest
+
+from evaluation import MIN_DEFINED_SHARE, _label_names, bootstrap_kappa_intervals, confusion_matrices, \
+    fast_kappa_rows, kappa_rows
+
+LABELS = ['O', 'ent1', 'ent2', 'cond', 'rel']
+
+# cohen_kappa_score warns on every sentence with an undefined kappa
+pytestmark = pytest.mark.filterwarnings('ignore')
+
+
+def random_labelling(rng, length, labels):
+    return [rng.choice(labels) for _ in range(length)]
+
+
+def assert_same_rows(rows, expected):
+    assert [row[0] for row in rows] == [row[0] for row in expected]
+    assert np.allclose([row[1:] for row in rows], [row[1:] for row in expected], equal_nan=True)
+
+
+def test_fast_kappa_rows_matches_kappa_rows():
+    rng = random.Random(0)
+    automated = []
+    labels = {}
+    for instance_no in range(300):
+        length = rng.randint(1, 25)
+        # some sentences only use a few of the labels, some none but 'O', so that kappas are undefined too
+        used = rng.choice([LABELS, LABELS[:2], ['O', 'rel', 'cond'], ['O']])
+        automated.append(random_labelling(rng, length, used))
+        if rng.random() < 0.5:
+            labels[instance_no] = random_labelling(rng, length, used) if rng.random() < 0.7 \
+                else list(automated[-1])
+    assert_same_rows(fast_kappa_rows(labels, automated), kappa_rows(labels, automated))
+
+
+
+def test_bootstrap_interval_needs_enough_defined_resamples():
+    rng = random.Random(2)
+    automated = [random_labelling(rng, 10, LABELS[:2]) for _ in range(200)]
+    labels = {instance_no: random_labelling(rng, 10, LABELS[:2]) for instance_no in range(200)}
+    label_names = _label_names(labels, automated)
+    intervals, dropped = bootstrap_kappa_intervals(confusion_matrices(labels, automated, label_names), label_names,
+                                                   2000, seed=0)
+    assert not np.isnan(intervals[0, 0]).any() and dropped[0, 0] == 0
+
+    # a single sentence with an undefined kappa is drawn into about 63% of the resamples, which makes their
+    # sentence average undefined, so too few are left for an interval
+    automated[0] = labels[0] = ['O'] * 10
+    intervals, dropped = bootstrap_kappa_intervals(confusion_matrices(labels, automated, label_names), label_names,
+                                                   2000, seed=0)
+    assert 2000 - dropped[0, 0] < MIN_DEFINED_SHARE * 2000
+    assert np.isnan(intervals[0, 0]).all()
+    assert not np.isnan(intervals[0, 1]).any()
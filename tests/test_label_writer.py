@@ -0,0 +1,60 @@
+import gzip
+import random
+
+import pytest
+
+from label_writer import LabelWriter
+
+LABELS = ['O', 'ent1', 'ent2', 'rel', 'cond']
+
+
+@pytest.fixture(scope='module')
+def rows():
+    rng = random.Random(4)
+    # sparse IDs as in a labels file, some sentences without any label
+    instance_ids = sorted(rng.sample(range(5000), 1000))
+    return instance_ids, [[rng.choice(LABELS) for _ in range(rng.randrange(0, 30))] for _ in instance_ids]
+
+
+def expected_content(rows):
+    # the row format of the labels files written before LabelWriter
+    return 'ID,labeling\n' + ''.join(str(instance_id) + ', ' + ''.join(label + ' ' for label in labelling) + '\n'
+                                     for instance_id, labelling in zip(*rows))
+
+
+def read_text(file_name):
+    if file_name.endswith('.gz'):
+        with gzip.open(file_name, 'rt') as file:
+            return file.read()
+    if file_name.endswith('.zst'):
+        try:
+            from compression import zstd
+        except ImportError:
+            import zstandard as zstd
+        with zstd.open(file_name, 'rt') as file:
+            return file.read()
+    with open(file_name) as file:
+        return file.read()
+
+
+def zstd_available():
+    try:
+        from compression import zstd  # noqa: F401
+    except ImportError:
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.csv.gz', pytest.param('.csv.zst', marks=pytest.mark.skipif(
+    not zstd_available(), reason='needs Python 3.14 or zstandard'))])
+@pytest.mark.parametrize('background', [False, True])
+@pytest.mark.parametrize('chunk_rows', [7, 65536])
+def test_content_is_independent_of_the_writer(rows, tmp_path, extension, background, chunk_rows):
+    file_name = str(tmp_path / ('automated_labels' + extension))
+    with LabelWriter(file_name, background=background, chunk_rows=chunk_rows) as writer:
+        writer.write_rows(*rows)
+    assert read_text(file_name) == expected_content(rows)
+
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from Parser import ParseTree
+from create_labels import build_matchers, label_parse_trees
+from match_matrix import MatchMatrix
+from pattern_ordering import order_patterns, verify_order
+from pattern_store import default_patterns
+from synthetic_corpus import DEFAULT_PROFILE, CorpusModel
+
+SENTENCES = 1500
+
+
+@pytest.fixture(scope='module')
+def patterns():
+    return default_patterns()
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    # parser output of a synthetic corpus, with deep prep/pobj chains and long coordinated sentences
+    model = CorpusModel(DEFAULT_PROFILE, chain=0.3, tail_alpha=1.5, tail_probability=0.1)
+    rng = random.Random(0)
+    return [model.sentence(rng) for _ in range(SENTENCES)]
+
+
+def make_trees(corpus):
+    return [ParseTree(heads, labels, tokens) for heads, labels, tokens in corpus]
+
+
+def baseline(parse_trees, patterns):
+    # the original first-match-wins loop over ParseTree.apply_pattern
+    matched_patterns = [-1] * len(parse_trees)
+    for pattern_no, pattern in enumerate(patterns):
+        for instance_no, tree in enumerate(parse_trees):
+            if not tree.pattern_applied:
+                success, _ = tree.apply_pattern(**pattern)
+                if success:
+                    matched_patterns[instance_no] = pattern_no
+    return [tree.get_current_labelling() for tree in parse_trees], matched_patterns
+
+
+@pytest.fixture(scope='module')
+def expected(corpus, patterns):
+    labellings, matched_patterns = baseline(make_trees(corpus), patterns)
+    # the corpus has to exercise the patterns for the comparisons to mean anything
+    assert sum(pattern_no != -1 for pattern_no in matched_patterns) > SENTENCES // 10
+    return labellings, matched_patterns
+
+
+@pytest.mark.parametrize('routing, match_cache_size, vectorized, threads', [
+    (False, 0, False, 1),
+    (True, 0, False, 1),
+    (False, 100, False, 1),
+    (True, 100, False, 1),
+    (False, 0, True, 1),
+    (False, 0, False, 4),
+])
+def test_label_parse_trees_matches_baseline(corpus, patterns, expected, routing, match_cache_size, vectorized,
+                                            threads):
+    parse_trees = make_trees(corpus)
+    router, match_cache = build_matchers(patterns, routing, match_cache_size)
+    count, matched_patterns = label_parse_trees(parse_trees, patterns, router, match_cache, vectorized, threads)
+    assert [tree.get_current_labelling() for tree in parse_trees] == expected[0]
+    assert matched_patterns == expected[1]
+    assert count == sum(pattern_no != -1 for pattern_no in expected[1])
+    assert [tree.pattern_applied for tree in parse_trees] == [pattern_no != -1 for pattern_no in expected[1]]
+
+
+def test_vectorized_matcher_rejects_router(corpus, patterns):
+    router, _ = build_matchers(patterns, True)
+    with pytest.raises(RuntimeError):
+        label_parse_trees(make_trees(corpus[:10]), patterns, router, vectorized=True)
+
+
+def test_threads_reject_match_cache(corpus, patterns):
+    _, match_cache = build_matchers(patterns, match_cache_size=100)
+    with pytest.raises(RuntimeError):
+        label_parse_trees(make_trees(corpus[:10]), patterns, match_cache=match_cache, threads=2)
+
+
+@pytest.fixture(scope='module')
+def matrix(corpus, patterns):
+    return MatchMatrix.build(make_trees(corpus), patterns)
+
+
+def test_match_matrix_resolves_to_baseline(matrix, expected):
+    labels, matched = matrix.resolve()
+    assert [matrix.labelling(labels, instance_no) for instance_no in range(SENTENCES)] == expected[0]
+    assert matched.tolist() == expected[1]
+
+
+def test_reordered_patterns_label_identically(corpus, patterns, matrix, expected):
+    order = order_patterns(matrix, patterns)
+    assert sorted(order) == list(range(len(patterns)))
+    assert verify_order(matrix, order) == []
+    # the reordered table labels the trees themselves identically, only the pattern indices change
+    ordered = [patterns[pattern_no] for pattern_no in order]
+    labellings, matched_patterns = baseline(make_trees(corpus), ordered)
+    assert labellings == expected[0]
+    assert [-1 if pattern_no == -1 else order[pattern_no] for pattern_no in matched_patterns] == expected[1]
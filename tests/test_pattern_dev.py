@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+import pytest
+
+from Parser import ParseTree
+from pattern_dev import PatternSession
+from pattern_store import compile_patterns, default_patterns
+from synthetic_corpus import DEFAULT_PROFILE, CorpusModel
+
+SENTENCES = 800
+
+
+@pytest.fixture(scope='module')
+def patterns():
+    return default_patterns()
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    model = CorpusModel(DEFAULT_PROFILE, chain=0.3)
+    rng = random.Random(1)
+    return [model.sentence(rng) for _ in range(SENTENCES)]
+
+
+def make_trees(corpus):
+    return [ParseTree(heads, labels, tokens) for heads, labels, tokens in corpus]
+
+
+def human_labels(corpus, patterns):
+    # the labels of the full pattern table on every other sentence, as a stand-in for a human labeling
+    session = PatternSession(make_trees(corpus))
+    session.update(patterns)
+    return {instance_no: decoded(session, instance_no) for instance_no in range(0, SENTENCES, 2)}
+
+
+def decoded(session, instance_no):
+    start, end = session.sentence_offsets[instance_no], session.sentence_offsets[instance_no + 1]
+    return [session.label_names[code] for code in session.labels[start:end]]
+
+
+def edits(patterns):
+    # a sequence of pattern tables as an author would save them
+    patterns = list(patterns)
+    new_pattern = compile_patterns([{'pattern': [('Action', ['root', 'dobj'], False)], 'final': True}])[0]
+    yield patterns[:-5]
+    yield patterns
+    yield patterns[:10] + patterns[11:]
+    yield [new_pattern] + patterns
+    yield patterns[:20] + [dict(pattern, final=not pattern['final']) for pattern in patterns[20:30]] + patterns[30:]
+    yield list(reversed(patterns))
+
+
+def test_update_matches_full_evaluation(corpus, patterns):
+    human = human_labels(corpus, patterns)
+    session = PatternSession(make_trees(corpus), human)
+    incremental_evaluations = full_evaluations = 0
+    for edited in edits(patterns):
+        affected, evaluated, evaluations = session.update(edited)
+        full = PatternSession(make_trees(corpus), human)
+        full_update = full.update(edited)
+        assert [decoded(session, instance_no) for instance_no in range(SENTENCES)] == \
+               [decoded(full, instance_no) for instance_no in range(SENTENCES)]
+        assert session.matched.tolist() == full.matched.tolist()
+        # the sentence average is nan for some labels on either side
+        np.testing.assert_equal(session.evaluate(), full.evaluate())
+        # only the patterns not seen before are evaluated
+        assert evaluated <= affected <= SENTENCES
+        assert evaluations <= full_update[2]
+        incremental_evaluations += evaluations
+        full_evaluations += full_update[2]
+    assert incremental_evaluations < full_evaluations / 2
+    assert session.update(list(reversed(patterns))) == (0, 0, 0)
+
+
+def test_update_labels_like_the_trees(corpus, patterns):
+    session = PatternSession(make_trees(corpus))
+    session.update(patterns)
+    parse_trees = make_trees(corpus)
+    for tree in parse_trees:
+        tree.apply_patterns(patterns)
+    assert [decoded(session, instance_no) for instance_no in range(SENTENCES)] == \
+           [tree.get_current_labelling() for tree in parse_trees]
+    assert (session.matched != -1).tolist() == [tree.pattern_applied for tree in parse_trees]
@@ -0,0 +1,76 @@
+import pytest
+
+from create_labels import build_parse_trees, label_parse_trees, read_dependency_heads, read_dependency_labels, \
+    read_requirements
+from label_writer import LabelWriter
+from pattern_store import default_patterns
+from sharding import merge_shards, parse_shard, run_shard
+from synthetic_corpus import generate_corpus
+
+SENTENCES = 600
+
+
+@pytest.fixture(scope='module')
+def corpus_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('corpus')) + '/'
+    generate_corpus(path, SENTENCES, seed=3, chain=0.3)
+    return path
+
+
+class FakeParser:
+    # writes the parser output of the synthetic corpus for the lines of a shard, found by their text
+    def __init__(self, corpus_path):
+        with open(corpus_path + 'input.txt') as file:
+            lines = file.read().splitlines()
+        with open(corpus_path + 'output_syndephead_0.txt') as file:
+            heads = file.read().splitlines()
+        with open(corpus_path + 'output_syndeplabel_0.txt') as file:
+            labels = file.read().splitlines()
+        self.outputs = dict(zip(lines, zip(heads, labels)))
+
+    def __call__(self, input_file, output_path):
+        with open(input_file) as file:
+            outputs = [self.outputs[line] for line in file.read().splitlines()]
+        with open(output_path + 'output_syndephead_0.txt', 'w') as file:
+            file.writelines(heads + '\n' for heads, _ in outputs)
+        with open(output_path + 'output_syndeplabel_0.txt', 'w') as file:
+            file.writelines(labels + '\n' for _, labels in outputs)
+
+
+@pytest.mark.parametrize('mode, shards', [('hash', 3), ('range', 4), ('range', 1)])
+def test_merged_shards_label_like_a_single_run(tokenizer, corpus_path, tmp_path, mode, shards):
+    patterns = default_patterns()
+    input_file = corpus_path + 'input.txt'
+    # a single run over the whole input, its labels written as create_labels.main does
+    parse_trees = build_parse_trees(read_dependency_heads(corpus_path + 'output_syndephead_0.txt'),
+                                    read_dependency_labels(corpus_path + 'output_syndeplabel_0.txt'),
+                                    read_requirements(input_file))
+    assert len(parse_trees) == SENTENCES
+    count, _ = label_parse_trees(parse_trees, patterns)
+    assert count > 0
+    output_path = str(tmp_path) + '/'
+    # the tree index is the input line, as every line has a tree
+    with LabelWriter(output_path + 'single_run.csv') as writer:
+        writer.write_trees(parse_trees)
+
+    parser = FakeParser(corpus_path)
+    descriptions = [run_shard(input_file, output_path, str(shard_no) + '/' + str(shards), mode, patterns, parser)
+                    for shard_no in range(shards)]
+    assert sum(description['lines'] for description in descriptions) == SENTENCES
+    assert sum(description['labelled'] for description in descriptions) == count
+    merge_shards(output_path)
+    with open(output_path + 'automated_labels.csv') as merged, open(output_path + 'single_run.csv') as single_run:
+        assert merged.read() == single_run.read()
+
+
+def test_merge_needs_all_shards(tokenizer, corpus_path, tmp_path):
+    output_path = str(tmp_path) + '/'
+    run_shard(corpus_path + 'input.txt', output_path, '1/2', 'hash', default_patterns(), FakeParser(corpus_path))
+    with pytest.raises(RuntimeError):
+        merge_shards(output_path)
+
+
+@pytest.mark.parametrize('shard', ['2/2', '-1/2', '0/0', '1', 'a/2'])
+def test_parse_shard_rejects(shard):
+    with pytest.raises(ValueError):
+        parse_shard(shard)
@@ -0,0 +1,160 @@
+from __future__ import annotations
+import json
+import time
+from typing import Callable, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak RSS is left out there
+    resource = None
+
+
+def peak_rss(children: bool = False) -> Optional[int]:
+    # peak resident set size of the process in kilobytes (ru_maxrss is in bytes on macOS). With children, the peak
+    # of the largest finished child process instead, e.g. the LAL-Parser.
+    if resource is None:
+        return None
+    import sys
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def children_cpu() -> Optional[float]:
+    # user and system CPU seconds of all finished child processes, which time.process_time does not count
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Stage:
+    # one stage of a traced run. The traced code can set 'items' to the number of things the stage processed.
+
+    def __init__(self, tracer: Tracer, name: str, items: Optional[int] = None):
+        self.tracer = tracer
+        self.name = name
+        self.items = items
+        self.record = None
+        self._profile = None
+
+    def __enter__(self) -> Stage:
+        tracer = self.tracer
+        if tracer.memory:
+            import tracemalloc
+            if hasattr(tracemalloc, 'reset_peak'):
+                # Python 3.9+, before the peak is the one since tracing started
+                tracemalloc.reset_peak()
+            self._memory = tracemalloc.get_traced_memory()[0]
+        if tracer.profile_stage == self.name:
+            import cProfile
+            self._profile = cProfile.Profile()
+        self._rss = peak_rss()
+        self._children_rss = peak_rss(children=True)
+        self._children_cpu = children_cpu()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        if self._profile is not None:
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profile is not None:
+            self._profile.disable()
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        record = {'stage': self.name, 'wall_seconds': wall, 'cpu_seconds': cpu, 'items': self.items}
+        if self.items:
+            record['items_per_second'] = self.items / wall if wall > 0 else None
+        rss = peak_rss()
+        if rss is not None:
+            record['peak_rss_kb'] = rss
+            record['peak_rss_increase_kb'] = rss - self._rss
+            # child processes of the stage, such as the parser started by the parser stage
+            record['children_cpu_seconds'] = children_cpu() - self._children_cpu
+            children_rss = peak_rss(children=True)
+            record['children_peak_rss_kb'] = children_rss
+            record['children_peak_rss_increase_kb'] = children_rss - self._children_rss
+        if self.tracer.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            record['allocated_bytes'] = current - self._memory
+            record['peak_allocated_bytes'] = peak - self._memory
+        if self._profile is not None:
+            record['profile'] = self.tracer.save_profile(self.name, self._profile)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.record = record
+        self.tracer.add(record)
+        return False
+
+
+class Tracer:
+    # collects wall and CPU time, item counts and memory of the stages of a run. Every finished stage is passed to
+    # the callback, e.g. to forward it to a job scheduler, and all of them can be written as JSON.
+
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None, memory: bool = False,
+                 profile_stage: Optional[str] = None, profile_file: Optional[str] = None):
+        self.callback = callback
+        self.memory = memory
+        self.profile_stage = profile_stage
+        self.profile_file = profile_file
+        self.stages: List[dict] = []
+        self.started = time.perf_counter()
+        if memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def stage(self, name: str, items: Optional[int] = None) -> Stage:
+        return Stage(self, name, items)
+
+    def add(self, record: dict):
+        self.stages.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def save_profile(self, name: str, profile) -> dict:
+        # the profile is written in the pstats format if a file is given, the top functions go into the trace
+        import io
+        import pstats
+
+        if self.profile_file is not None:
+            profile.dump_stats(self.profile_file)
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(20)
+        return {'file': self.profile_file, 'top': output.getvalue().splitlines()}
+
+    def summary(self) -> dict:
+        return {'wall_seconds': time.perf_counter() - self.started, 'peak_rss_kb': peak_rss(), 'stages': self.stages}
+
+    def write(self, file_name: str):
+        with open(file_name, 'w') as file:
+            json.dump(self.summary(), file, indent=1)
+
+
+class _NullStage:
+    # shared by all stages of a disabled tracer, so tracing costs one method call and a with block per stage
+    items = None
+
+    def __enter__(self) -> _NullStage:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+class NullTracer:
+    _stage = _NullStage()
+
+    def stage(self, name: str, items: Optional[int] = None) -> _NullStage:
+        return self._stage
+
+    def write(self, file_name: str):
+        pass
+
+
+NULL_TRACER = NullTracer()